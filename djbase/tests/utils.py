@@ -2,11 +2,15 @@ from __future__ import unicode_literals
 
 import json
 
+from unittest import skipIf
+
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.test import TestCase
 from djbase.utils import parse_iso_datetime
+from djbase.utils.cache import LRUCache
 from djbase.utils.json import encode as json_encode
+from djbase.utils.mock import s3 as mock_s3
 
 from datetime import datetime, date
 
@@ -56,3 +60,85 @@ class UtilsTest(TestCase):
 
             output = parse_iso_datetime(test_input)
             self.assertEqual(output, test_expected)
+
+class LRUCacheTest(TestCase):
+    def test_lru(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual(cache.get('a'), 1)
+
+        # b is the least recently used
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+        cache.delete_if(lambda key: key == 'c')
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.clear()
+        self.assertEqual(cache.get('a', 'x'), 'x')
+
+    def test_disabled(self):
+        cache = LRUCache(max_size=0)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+class FakeS3Test(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3.FakeS3().start()
+        self.bucket = self.s3.connect().get_bucket('test', validate=False)
+
+    def tearDown(self):
+        self.s3.stop()
+
+    def test_objects(self):
+        key = self.bucket.new_key('a/\u00e9.css')
+        key.set_contents_from_string(b'body {}', headers={
+            'Content-Type': 'text/css', 'Content-Encoding': 'gzip'})
+
+        key = self.bucket.get_key('a/\u00e9.css')
+        self.assertEqual(key.content_encoding, 'gzip')
+        self.assertEqual(key.get_contents_as_string(), b'body {}')
+        self.assertEqual(self.bucket.get_key('b.css'), None)
+
+        self.bucket.copy_key('b/c.css', 'test', 'a/\u00e9.css')
+        self.assertEqual(self.s3.get('test', 'b/c.css').data, b'body {}')
+        self.assertEqual([k.name for k in self.bucket.list(delimiter='/')], ['a/', 'b/'])
+
+        self.bucket.delete_key('a/\u00e9.css')
+        self.bucket.delete_keys(['b/c.css'])
+        self.assertEqual(list(self.bucket.list()), [])
+
+    def test_stats(self):
+        self.s3.delay = 0.05
+        self.bucket.new_key('a.txt').set_contents_from_string(b'12345')
+        self.bucket.get_key('a.txt').get_contents_as_string()
+
+        stats = self.s3.stats()
+        self.assertEqual(stats['methods'], {'PUT': 1, 'HEAD': 1, 'GET': 1})
+        self.assertEqual(stats['bytes_in'], 5)
+        self.assertEqual(stats['bytes_out'], 5)
+        self.assertEqual(stats['connections'], 1)
+        self.assertTrue(stats['latency'] >= 0.15)
+
+        self.s3.reset()
+        self.assertEqual(self.s3.stats()['requests'], 0)
+
+    def test_failures(self):
+        # boto itself sleeps before retrying 500 and 503
+        self.s3.fail(count=2, status=400, method='PUT')
+        key = self.bucket.new_key('a.txt')
+
+        for i in range(2):
+            self.assertRaises(Exception, key.set_contents_from_string, b'1')
+        self.assertEqual(self.bucket.get_key('a.txt'), None)
+
+        key.set_contents_from_string(b'1')
+        self.assertEqual([r.status for r in self.s3.requests if r.method == 'PUT'], 
+            [400, 400, 200])
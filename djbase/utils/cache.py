@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+
+import threading
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    A thread-safe in-memory cache that holds at most `max_size` items,
+    discarding the least recently used ones.
+    """
+
+    def __init__(self, max_size):
+        """
+        :type   max_size: int
+        :param  max_size: 0 disables the cache.
+        """
+
+        self.max_size   = max_size
+        self._items     = OrderedDict()
+        self._lock      = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+
+            # move to the end as the most recently used
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete_if(self, predicate):
+        """
+        Deletes the items whose key `predicate` returns True for.
+        Looks at every item.
+        """
+
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,520 @@
+"""
+Mock S3 for Python. An S3-compatible HTTP server running in a thread of
+the current process, so that boto and the S3 storages can be tested
+and benchmarked without a real bucket.
+
+It records every request, and can be told to respond slowly or to fail.
+Supported: PUT (also copy), GET, HEAD and DELETE of objects, multipart
+uploads, listing a bucket and deleting many objects at once. Requests 
+are not authenticated.
+
+    with FakeS3() as s3:
+        s3.patch(storage)
+        storage.save('a.css', content)
+        print(s3.stats())
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import random
+import socket
+import sys
+import threading
+import time
+import urllib
+import uuid
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from email.utils import formatdate
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+try:
+    from boto.s3.connection import S3Connection, OrdinaryCallingFormat
+except ImportError:
+    S3Connection = None
+
+# Headers of a PUT that are kept with the object and returned by GET
+_KEPT_HEADERS = ('content-type', 'content-encoding', 'cache-control',
+    'expires', 'content-disposition', 'content-language')
+
+_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+class Request(object):
+    """
+    A request received by FakeS3.
+    """
+
+    def __init__(self, method, bucket, key, query, headers):
+        self.method     = method
+        self.bucket     = bucket
+        self.key        = key
+        self.query      = query
+        self.headers    = headers
+        self.status     = None
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.latency    = 0.0 # seconds
+
+    def __repr__(self):
+        return '<Request %s /%s/%s %s>' % (self.method, self.bucket, self.key or '', self.status)
+
+class Object(object):
+    def __init__(self, data, headers):
+        self.data           = data
+        self.headers        = headers
+        self.etag           = '"%s"' % hashlib.md5(data).hexdigest()
+        self.last_modified  = time.time()
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the client or stop() closed the connection
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, like S3
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.fake._connected(self.request)
+
+    def finish(self):
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        finally:
+            self.server.fake._disconnected(self.request)
+
+    def _handle(self):
+        fake = self.server.fake
+        start = time.time()
+
+        url = urlparse.urlsplit(self.path)
+        bucket, slash, key = url.path.lstrip(b'/').partition(b'/')
+        key = urllib.unquote(key).decode('utf8') or None
+        query = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+        headers = dict((k.lower(), v) for k, v in self.headers.items())
+
+        request = Request(self.command, bucket, key, query, headers)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        request.bytes_in = len(body)
+
+        status = fake._get_failure(request)
+        if status:
+            response = (status, {}, b'')
+        else:
+            response = fake._respond(request, body)
+
+        (request.status, response_headers, response_body) = response
+        request.bytes_out = len(response_body)
+        fake._wait(request)
+
+        # recorded before responding, so that the client sees it
+        request.latency = time.time() - start
+        fake._record(request)
+
+        self.send_response(request.status)
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        if 'Content-Length' not in response_headers:
+            self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(response_body)
+
+    do_GET = do_PUT = do_HEAD = do_DELETE = do_POST = _handle
+
+class FakeS3(object):
+    """
+    In-process S3 server. Buckets are created on the first write.
+    """
+
+    def __init__(self, delay=0, bandwidth=None, failure_rate=0.0, seed=None):
+        """
+        :type   delay: float
+        :param  delay: Seconds to wait before every response.
+
+        :type   bandwidth: int
+        :param  bandwidth: Bytes per second of the request and response
+            bodies together, or None for no limit.
+
+        :type   failure_rate: float
+        :param  failure_rate: Probability that a request fails with 500.
+
+        :param  seed: Seed of the random failures, for repeatable runs.
+        """
+
+        self.delay          = delay
+        self.bandwidth      = bandwidth
+        self.failure_rate   = failure_rate
+        self.objects        = {} # (bucket, key) to Object
+        self.uploads        = {} # multipart upload ID to (bucket, key, headers, parts)
+        self.requests       = []
+        self.connections    = 0
+
+        self._random    = random.Random(seed)
+        self._failures  = []
+        self._lock      = threading.Lock()
+        self._sockets   = set()
+        self._server    = None
+        self._thread    = None
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+
+        self._thread = threading.Thread(target=self._server.serve_forever, 
+            kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+            # ends the keep-alive connections, so that their threads exit
+            with self._lock:
+                sockets = list(self._sockets)
+            for sock in sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+            deadline = time.time() + 5
+            while self._sockets and time.time() < deadline:
+                time.sleep(0.01)
+
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def connect(self, num_retries=0):
+        """
+        :param  num_retries: How many times boto itself retries a request
+            that failed with 500 or 503. boto waits up to 2^n seconds
+            before the n-th retry.
+
+        :returns: S3Connection -- a boto connection to this server.
+        """
+
+        connection = S3Connection('fake-access-key', 'fake-secret-key',
+            host=self.host, port=self.port, is_secure=False,
+            calling_format=OrdinaryCallingFormat())
+        connection.num_retries = num_retries
+
+        return connection
+
+    def patch(self, storage, **kwargs):
+        """
+        Makes an S3BotoStorage use this server.
+        Keyword arguments are passed to connect().
+        """
+
+        storage._connection = self.connect(**kwargs)
+        storage._bucket = None
+
+    def fail(self, count=1, status=500, method=None):
+        """
+        Fails the next `count` requests, or the next `count` requests
+        with `method`, with `status`.
+        """
+
+        with self._lock:
+            self._failures.append([count, status, method])
+
+    def reset(self):
+        """
+        Forgets the recorded requests, but not the objects.
+        """
+
+        with self._lock:
+            self.requests = []
+            self.connections = 0
+
+    def get(self, bucket, key):
+        """
+        :returns: Object, or None.
+        """
+
+        with self._lock:
+            return self.objects.get((bucket, key))
+
+    def stats(self):
+        """
+        :returns: dict -- totals of the recorded requests.
+        """
+
+        with self._lock:
+            requests = list(self.requests)
+            connections = self.connections
+
+        methods = {}
+        for request in requests:
+            methods[request.method] = methods.get(request.method, 0) + 1
+
+        return {
+            'requests'      : len(requests),
+            'methods'       : methods,
+            'errors'        : sum(1 for r in requests if r.status >= 400),
+            'bytes_in'      : sum(r.bytes_in for r in requests),
+            'bytes_out'     : sum(r.bytes_out for r in requests),
+            'latency'       : sum(r.latency for r in requests),
+            'connections'   : connections,
+        }
+
+    def _connected(self, sock):
+        with self._lock:
+            self.connections += 1
+            self._sockets.add(sock)
+
+    def _disconnected(self, sock):
+        with self._lock:
+            self._sockets.discard(sock)
+
+    def _record(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def _get_failure(self, request):
+        with self._lock:
+            for failure in self._failures:
+                (count, status, method) = failure
+                if method is None or method == request.method:
+                    failure[0] -= 1
+                    if failure[0] <= 0:
+                        self._failures.remove(failure)
+                    return status
+
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                return 500
+
+        return None
+
+    def _wait(self, request):
+        wait = self.delay
+        if self.bandwidth:
+            wait += float(request.bytes_in + request.bytes_out) / self.bandwidth
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def _respond(self, request, body):
+        """
+        :returns: tuple -- (status, headers, body)
+        """
+
+        method, bucket, key = request.method, request.bucket, request.key
+
+        if key is None:
+            if method == 'GET':
+                return self._list(bucket, request.query)
+            if method == 'POST' and 'delete' in request.query:
+                return self._delete_many(bucket, body)
+            if method == 'PUT':
+                return (200, {}, b'')
+            return (405, {}, b'')
+
+        if 'uploads' in request.query or 'uploadId' in request.query:
+            return self._multipart(request, body)
+
+        if method == 'PUT':
+            copy_source = request.headers.get('x-amz-copy-source')
+            if copy_source:
+                return self._copy(bucket, key, copy_source, request.headers)
+
+            obj = Object(body, _get_kept_headers(request.headers))
+            with self._lock:
+                self.objects[(bucket, key)] = obj
+
+            return (200, {'ETag': obj.etag}, b'')
+
+        if method in ('GET', 'HEAD'):
+            obj = self.get(bucket, key)
+            if obj is None:
+                return (404, {}, b'')
+
+            headers = dict(obj.headers)
+            headers['ETag'] = obj.etag
+            headers['Last-Modified'] = formatdate(obj.last_modified, usegmt=True)
+            if method == 'HEAD':
+                headers['Content-Length'] = str(len(obj.data))
+                return (200, headers, b'')
+
+            return (200, headers, obj.data)
+
+        if method == 'DELETE':
+            with self._lock:
+                self.objects.pop((bucket, key), None)
+            return (204, {}, b'')
+
+        return (405, {}, b'')
+
+    def _multipart(self, request, body):
+        method, bucket, key = request.method, request.bucket, request.key
+
+        if method == 'POST' and 'uploads' in request.query:
+            upload_id = uuid.uuid4().hex
+            with self._lock:
+                self.uploads[upload_id] = (bucket, key, _get_kept_headers(request.headers), {})
+
+            body = ('<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult xmlns="%s">'
+                '<Bucket>%s</Bucket><Key>%s</Key><UploadId>%s</UploadId></InitiateMultipartUploadResult>'
+                % (_XMLNS, escape(bucket), escape(key), upload_id))
+
+            return (200, {'Content-Type': 'application/xml'}, body.encode('utf8'))
+
+        upload_id = request.query['uploadId']
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None:
+            return (404, {}, b'')
+
+        parts = upload[3]
+
+        if method == 'PUT':
+            with self._lock:
+                parts[int(request.query['partNumber'])] = body
+            return (200, {'ETag': '"%s"' % hashlib.md5(body).hexdigest()}, b'')
+
+        if method == 'DELETE':
+            with self._lock:
+                self.uploads.pop(upload_id, None)
+            return (204, {}, b'')
+
+        if method == 'POST':
+            numbers = [int(e.text) for e in ElementTree.fromstring(body).iter() 
+                if e.tag.split('}')[-1] == 'PartNumber']
+
+            with self._lock:
+                if any(num not in parts for num in numbers):
+                    return (400, {}, b'')
+
+                obj = Object(b''.join(parts[num] for num in numbers), upload[2])
+                self.objects[(bucket, key)] = obj
+                self.uploads.pop(upload_id, None)
+
+            body = ('<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult xmlns="%s">'
+                '<Bucket>%s</Bucket><Key>%s</Key><ETag>%s</ETag></CompleteMultipartUploadResult>'
+                % (_XMLNS, escape(bucket), escape(key), escape(obj.etag)))
+
+            return (200, {'Content-Type': 'application/xml'}, body.encode('utf8'))
+
+        return (405, {}, b'')
+
+    def _copy(self, bucket, key, copy_source, headers):
+        src_bucket, slash, src_key = urllib.unquote(copy_source).lstrip(b'/').partition(b'/')
+        src = self.get(src_bucket, src_key.decode('utf8'))
+        if src is None:
+            return (404, {}, b'')
+
+        if headers.get('x-amz-metadata-directive', '').upper() == 'REPLACE':
+            obj = Object(src.data, _get_kept_headers(headers))
+        else:
+            obj = Object(src.data, src.headers)
+
+        with self._lock:
+            self.objects[(bucket, key)] = obj
+
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<CopyObjectResult><LastModified>%s</LastModified><ETag>%s</ETag></CopyObjectResult>'
+            % (_format_iso(obj.last_modified), escape(obj.etag)))
+
+        return (200, {'Content-Type': 'application/xml'}, body.encode('utf8'))
+
+    def _list(self, bucket, query):
+        prefix = query.get('prefix', b'').decode('utf8')
+        marker = query.get('marker', b'').decode('utf8')
+        delimiter = query.get('delimiter', b'').decode('utf8')
+        max_keys = int(query.get('max-keys') or 1000)
+
+        with self._lock:
+            keys = sorted(k for b, k in self.objects if b == bucket
+                and k.startswith(prefix) and k > marker)
+            objects = self.objects.copy()
+
+        contents = []
+        prefixes = []
+        is_truncated = False
+        last = None
+
+        for key in keys:
+            if len(contents) + len(prefixes) >= max_keys:
+                is_truncated = True
+                break
+
+            if delimiter and delimiter in key[len(prefix):]:
+                common = key[:key.index(delimiter, len(prefix)) + len(delimiter)]
+                if common not in prefixes:
+                    prefixes.append(common)
+                last = key
+                continue
+
+            obj = objects[(bucket, key)]
+            contents.append('<Contents><Key>%s</Key><LastModified>%s</LastModified>'
+                '<ETag>%s</ETag><Size>%d</Size><StorageClass>STANDARD</StorageClass></Contents>'
+                % (escape(key), _format_iso(obj.last_modified), escape(obj.etag), len(obj.data)))
+            last = key
+
+        body = ('<?xml version="1.0" encoding="UTF-8"?><ListBucketResult xmlns="%s">'
+            '<Name>%s</Name><Prefix>%s</Prefix><Marker>%s</Marker><MaxKeys>%d</MaxKeys>'
+            '<IsTruncated>%s</IsTruncated>%s%s%s</ListBucketResult>'
+            % (_XMLNS, escape(bucket), escape(prefix), escape(marker), max_keys,
+               'true' if is_truncated else 'false',
+               '<NextMarker>%s</NextMarker>' % escape(last) if is_truncated and last else '',
+               ''.join(contents),
+               ''.join('<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>' % escape(p)
+                   for p in prefixes)))
+
+        return (200, {'Content-Type': 'application/xml'}, body.encode('utf8'))
+
+    def _delete_many(self, bucket, body):
+        root = ElementTree.fromstring(body)
+        deleted = []
+
+        for element in root.iter():
+            if element.tag.split('}')[-1] == 'Key':
+                deleted.append(element.text)
+
+        with self._lock:
+            for key in deleted:
+                self.objects.pop((bucket, key), None)
+
+        body = ('<?xml version="1.0" encoding="UTF-8"?><DeleteResult xmlns="%s">%s</DeleteResult>'
+            % (_XMLNS, ''.join('<Deleted><Key>%s</Key></Deleted>' % escape(k) for k in deleted)))
+
+        return (200, {'Content-Type': 'application/xml'}, body.encode('utf8'))
+
+def _get_kept_headers(headers):
+    return dict((k, v) for k, v in headers.items()
+        if k in _KEPT_HEADERS or k.startswith('x-amz-meta-'))
+
+def _format_iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
@@ -0,0 +1,507 @@
+"""
+Benchmarks run by the `cdn_bench` management command.
+
+Each benchmark returns a dict of results, so that they can be
+printed or compared between runs.
+"""
+
+from __future__ import unicode_literals
+
+import binascii
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+import timeit
+from distutils.spawn import find_executable
+
+try:
+    import pkg_resources
+except ImportError:
+    pkg_resources = None
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils.encoding import force_text
+
+from djbase.utils.mock import s3 as mock_s3
+from djcdn import filters
+from djcdn.conf import settings as app_settings
+from djcdn.storage import Util
+from djcdn.storage import encodings as encodings_mod
+from djcdn.storage import images
+from djcdn.templatetags import cdn as cdn_tags
+
+_MB = 1024 * 1024
+
+def _time(fn, rounds):
+    """
+    :returns: float -- best time of `rounds` calls, in seconds.
+    """
+
+    return min(timeit.repeat(fn, number=1, repeat=rounds))
+
+def bench_tag(refs=500, paths=50, rounds=20):
+    """
+    Renders a template with `refs` `cdn` tags referencing `paths`
+    distinct files, with and without the URL memo.
+
+    :returns: dict -- 'uncached' and 'cached' render times in seconds,
+        the same per tag in microseconds, and 'speedup'.
+    """
+
+    source = '{% load cdn %}' + ''.join(
+        '<link href="{%% cdn "css/file%d.css" %%}">' % (i % paths)
+        for i in range(refs))
+    template = Template(source)
+
+    factory = RequestFactory()
+
+    def render():
+        # a new request each time, like in production
+        request = factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        template.render(Context({'request': request}))
+
+    cache = cdn_tags._url_cache
+    max_size = cache.max_size
+
+    try:
+        cache.max_size = 0
+        cache.clear()
+        uncached = _time(render, rounds)
+
+        cache.max_size = max(max_size, paths)
+        render() # warm up
+        cached = _time(render, rounds)
+    finally:
+        cache.max_size = max_size
+        cache.clear()
+
+    return {
+        'refs'          : refs,
+        'paths'         : paths,
+        'uncached'      : uncached,
+        'cached'        : cached,
+        'uncached_us'   : uncached / refs * 1e6,
+        'cached_us'     : cached / refs * 1e6,
+        'speedup'       : uncached / cached if cached else None,
+    }
+
+def _measure(conn, fn, args):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    result = fn(*args)
+    seconds = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux
+    conn.send((seconds, (peak - before) * 1024, result))
+    conn.close()
+
+def _run_measured(fn, *args):
+    """
+    Runs fn(*args) in a child process, so that the memory it uses
+    is not hidden by the peak of earlier runs.
+
+    :returns: tuple -- (seconds, peak memory growth in bytes, result)
+    """
+
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_measure, args=(writer, fn, args))
+    process.start()
+    writer.close()
+
+    try:
+        return reader.recv()
+    finally:
+        reader.close()
+        process.join()
+
+def _generate_css(path, size):
+    """
+    Writes about `size` bytes of minified CSS that references 
+    static files to `path`.
+    """
+
+    rule = ('.a%(i)d{background:url("%(root)simg/a%(i)d.png") no-repeat;color:#333}'
+            '@import "%(root)scss/b%(i)d.css";'
+            '.c%(i)d:after{content:"\\2014";background:URL( %(root)simg/c%(i)d.jpg )}')
+    root = settings.STATIC_ROOT or '/static/'
+
+    written = 0
+    i = 0
+    with open(path, 'wb') as f:
+        while written < size:
+            data = ''.join(rule % {'i': j, 'root': root} for j in range(i, i + 1000)).encode('utf8')
+            f.write(data)
+            written += len(data)
+            i += 1000
+
+def _csspath_whole(input_file, version_str=None):
+    """
+    Rewrites the whole file in memory, like csspath did before it
+    worked on chunks. Used as the baseline.
+    """
+
+    text = force_text(input_file.read())
+    matches = filters._CSS_URL_MATCH.finditer(text)
+
+    return ContentFile(filters._replace_urls(text, 0, len(text), matches, version_str))
+
+def _run_csspath(fn, path):
+    with open(path, 'rb') as f:
+        output_file = fn(File(f), version_str='20131023-12345678')
+
+    hash = Util.hash_file(output_file)
+    output_file.close()
+    Util.delete_file(output_file)
+
+    return hash
+
+def bench_csspath(size_mb=20, rounds=1):
+    """
+    Runs filters.csspath on a generated stylesheet of `size_mb` MB, and
+    the same rewrite on the whole file in memory as the baseline.
+
+    :returns: dict -- MB/s and peak memory growth in MB of each, and
+        whether their output is identical.
+    """
+
+    (handle, path) = tempfile.mkstemp(suffix='.css')
+    os.close(handle)
+
+    try:
+        _generate_css(path, size_mb * _MB)
+        size = os.path.getsize(path)
+
+        result = {'size_mb': size / float(_MB)}
+        hashes = {}
+
+        for name, fn in (('streaming', filters.csspath), ('whole', _csspath_whole)):
+            runs = [_run_measured(_run_csspath, fn, path) for _ in range(rounds)]
+            seconds = min(run[0] for run in runs)
+
+            result[name + '_mb_s'] = size / float(_MB) / seconds
+            result[name + '_peak_mb'] = max(run[1] for run in runs) / float(_MB)
+            hashes[name] = runs[0][2]
+
+        result['identical'] = hashes['streaming'] == hashes['whole']
+    finally:
+        os.unlink(path)
+
+    return result
+
+# Filters that run a command line tool
+_FILTER_TOOLS = {
+    'filters.jpegoptim' : 'jpegoptim',
+    'filters.pngcrush'  : 'pngcrush',
+}
+
+# Distributions whose version is reported by get_environment()
+_DISTRIBUTIONS = ('Django', 'cssmin', 'slimit', 'Pillow', 'Brotli', 
+    'zstandard', 'zopfli', 'boto', 'django-storages')
+
+def get_environment():
+    """
+    :returns: dict -- versions of Python and of the dependencies, and 
+        the filter tools found, so that results can be compared 
+        between runs.
+    """
+
+    versions = {}
+    for name in _DISTRIBUTIONS:
+        try:
+            versions[name] = pkg_resources.get_distribution(name).version
+        except Exception:
+            versions[name] = None
+
+    return {
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'versions'  : versions,
+        'tools'     : dict((tool, bool(find_executable(tool))) 
+            for tool in sorted(_FILTER_TOOLS.values())),
+    }
+
+def _write_text(path, size, make_block):
+    written = 0
+    i = 0
+    with open(path, 'wb') as f:
+        while written < size:
+            data = make_block(i).encode('utf8')
+            f.write(data)
+            written += len(data)
+            i += 1
+
+def _generate_pretty_css(path, size, rng):
+    """
+    Writes about `size` bytes of CSS as people write it, with 
+    comments, indents and URLs of static files.
+    """
+
+    root = settings.STATIC_ROOT or '/static/'
+
+    def make_block(i):
+        return ('/* Section %(i)d: styles of the %(i)dth block */\n'
+                '.block-%(i)d .element-%(n)d,\n.block-%(i)d > a:hover {\n'
+                '    color: #%(color)06x;\n'
+                '    margin: %(m)dpx %(n)dpx 0 0;\n'
+                '    background: url("%(root)simg/icon-%(n)d.png") no-repeat;\n'
+                '}\n\n') % {
+            'i': i, 'n': rng.randint(0, 999), 'm': rng.randint(0, 40),
+            'color': rng.randint(0, 0xffffff), 'root': root}
+
+    _write_text(path, size, make_block)
+
+def _generate_js(path, size, rng):
+    """
+    Writes about `size` bytes of unminified JavaScript.
+    """
+
+    def make_block(i):
+        return ('/* Module %(i)d */\n'
+                'function computeValue%(i)d(firstArgument, secondArgument) {\n'
+                '    // combine the arguments\n'
+                '    var resultValue = firstArgument * %(a)d + secondArgument;\n'
+                '    if (resultValue > %(b)d) {\n'
+                '        return resultValue - %(b)d;\n'
+                '    }\n'
+                '    return resultValue + "%(s)s";\n'
+                '}\n\n') % {
+            'i': i, 'a': rng.randint(2, 99), 'b': rng.randint(100, 9999),
+            's': '%x' % rng.getrandbits(32)}
+
+    _write_text(path, size, make_block)
+
+def _generate_image(path, size, rng, format):
+    """
+    Writes a photo-like image, a gradient with noise, of roughly 
+    `size` bytes.
+    """
+
+    # bytes per pixel, roughly
+    per_pixel = 1.8 if format == 'PNG' else 0.7
+    side = max(16, int((size / per_pixel) ** 0.5))
+    row_size = side * 3
+
+    rows = []
+    for y in range(side):
+        noise = bytearray(binascii.unhexlify('%0*x' % (row_size * 2, rng.getrandbits(row_size * 8))))
+        rows.append(bytes(bytearray(((v & 0x1f) + y // 4 + x // 12) & 0xff 
+            for x, v in enumerate(noise))))
+
+    image = images.Image.frombytes('RGB', (side, side), b''.join(rows))
+    image.save(path, format=format, quality=95)
+
+def _generate_corpus(file_ext, size, seed):
+    """
+    :returns: str -- path of a generated temp file of about `size` bytes.
+        The content only depends on the arguments.
+    """
+
+    rng = random.Random('%s|%s' % (seed, file_ext))
+    (handle, path) = tempfile.mkstemp(suffix='.' + file_ext)
+    os.close(handle)
+
+    try:
+        if file_ext == 'css':
+            _generate_pretty_css(path, size, rng)
+        elif file_ext == 'js':
+            _generate_js(path, size, rng)
+        else:
+            _generate_image(path, size, rng, 'PNG' if file_ext == 'png' else 'JPEG')
+    except:
+        os.unlink(path)
+        raise
+
+    return path
+
+def _run_filters(filters, path):
+    """
+    :returns: int -- size of the output.
+    """
+
+    with open(path, 'rb') as f:
+        input_file = File(f)
+        output_file = Util._apply_filters(filters, input_file, '20131023-12345678')
+
+        output_file.seek(0, os.SEEK_END)
+        size = output_file.tell()
+
+        if not(output_file is input_file):
+            output_file.close()
+            Util.delete_file(output_file)
+
+    return size
+
+def _run_encoding(encoding, data):
+    return len(encodings_mod.compress(encoding, data, zopfli=app_settings.CDN_GZIP_ZOPFLI))
+
+def _run_save(name, path, filters_map):
+    """
+    Saves a file with StaticStorage to a fake S3.
+
+    :returns: int -- bytes uploaded.
+    """
+
+    from djcdn.storage.s3 import StaticStorage
+
+    with override_settings(CDN_STATIC_FILTERS=filters_map):
+        with mock_s3.FakeS3() as s3:
+            storage = StaticStorage(bucket='bench', cdn_upload_workers=0, 
+                cdn_filter_processes=0)
+            s3.patch(storage)
+
+            with open(path, 'rb') as f:
+                storage._save(name, File(f))
+
+            return s3.stats()['bytes_in']
+
+def _add_run(result, prefix, runs, size, output_size=None):
+    """
+    Adds the MB/s, peak memory and compression ratio of `runs`
+    of _run_measured() to `result`.
+    """
+
+    seconds = min(run[0] for run in runs)
+    output_size = runs[0][2] if output_size is None else output_size
+
+    result[prefix + '.mb_s'] = size / float(_MB) / seconds if seconds else None
+    result[prefix + '.peak_mb'] = max(run[1] for run in runs) / float(_MB)
+    result[prefix + '.ratio'] = output_size / float(size)
+
+def bench_pipeline(size_mb=1, rounds=1, seed=0, types=('css', 'js', 'png', 'jpg')):
+    """
+    Generates a file of about `size_mb` MB of each type, and runs on it 
+    each filter in settings.CDN_STATIC_FILTERS, the whole chain of filters,
+    each of settings.CDN_STATIC_ENCODINGS on the output of the chain, and 
+    StaticStorage._save() with a fake S3. Filters whose tool is not 
+    installed are skipped. 
+
+    The same arguments always generate the same files.
+
+    :returns: dict -- MB/s, peak memory growth in MB and output to input 
+        size ratio of each, keyed like 'css.cssmin.mb_s', 'css.chain.ratio', 
+        'css.gzip.mb_s' or 'css.save.peak_mb'. 'skipped' lists what 
+        was not run.
+    """
+
+    filters_map = app_settings.CDN_STATIC_FILTERS
+    result = {}
+    skipped = []
+    available_map = {}
+
+    for file_ext in types:
+        filters = []
+        for filter in filters_map.get(file_ext, ()):
+            tool = _FILTER_TOOLS.get(filter)
+            if tool and not find_executable(tool):
+                skipped.append('%s %s (%s not installed)' % (file_ext, filter, tool))
+            else:
+                filters.append(filter)
+
+        available_map[file_ext] = tuple(filters)
+
+    for file_ext in types:
+        if file_ext in ('png', 'jpg') and images.Image is None:
+            skipped.append('%s (PIL not installed)' % file_ext)
+            continue
+
+        path = _generate_corpus(file_ext, int(size_mb * _MB), seed)
+
+        try:
+            size = os.path.getsize(path)
+            filters = available_map[file_ext]
+            result[file_ext + '.size_mb'] = size / float(_MB)
+
+            for filter in filters:
+                runs = [_run_measured(_run_filters, (filter,), path) for _ in range(rounds)]
+                _add_run(result, '%s.%s' % (file_ext, filter.split('.')[-1]), runs, size)
+
+            if filters:
+                runs = [_run_measured(_run_filters, filters, path) for _ in range(rounds)]
+                _add_run(result, file_ext + '.chain', runs, size)
+
+            if file_ext in app_settings.CDN_STATIC_COMPRESSED_TYPES:
+                with open(path, 'rb') as f:
+                    input_file = File(f)
+                    output_file = Util._apply_filters(filters, input_file, '20131023-12345678')
+                    output_file.seek(0)
+                    data = output_file.read()
+
+                    if not(output_file is input_file):
+                        output_file.close()
+                        Util.delete_file(output_file)
+
+                for encoding in app_settings.CDN_STATIC_ENCODINGS:
+                    runs = [_run_measured(_run_encoding, encoding, data) for _ in range(rounds)]
+                    _add_run(result, '%s.%s' % (file_ext, encoding), runs, len(data))
+
+            runs = [_run_measured(_run_save, 'bench.' + file_ext, path, available_map) 
+                for _ in range(rounds)]
+            _add_run(result, file_ext + '.save', runs, size)
+        finally:
+            os.unlink(path)
+
+    result['skipped'] = skipped
+
+    return result
+
+def bench_url(names=500, rounds=5):
+    """
+    Gets the URLs of `names` media files with DefaultStorage.url(), 
+    with and without its LRU, and with S3BotoStorage.url(), for public
+    and signed URLs. No request is sent to S3.
+
+    :returns: dict -- times in microseconds per URL, and the speedups.
+    """
+
+    from storages.backends.s3boto import S3BotoStorage
+    from djcdn.storage.s3 import DefaultStorage
+
+    paths = ['photos/%d/image %d.jpg' % (i // 10, i) for i in range(names)]
+    result = {'names': names}
+
+    for label, querystring_auth in (('public', False), ('signed', True)):
+        storage = DefaultStorage(bucket='bench', access_key='bench', secret_key='bench',
+            querystring_auth=querystring_auth, custom_domain=None)
+
+        def parent():
+            for path in paths:
+                S3BotoStorage.url(storage, path)
+
+        def djcdn():
+            for path in paths:
+                storage.url(path)
+
+        before = _time(parent, rounds) / names * 1e6
+
+        # without the LRU, i.e. the first call for each name
+        max_size = storage._cdn_urls.max_size
+        storage._cdn_urls.max_size = 0
+        uncached = _time(djcdn, rounds) / names * 1e6
+        storage._cdn_urls.max_size = max(max_size, names)
+
+        djcdn() # warm up
+        after = _time(djcdn, rounds) / names * 1e6
+
+        result['%s.s3boto_us' % label] = before
+        result['%s.uncached_us' % label] = uncached
+        result['%s.djcdn_us' % label] = after
+        result['%s.speedup' % label] = before / after if after else None
+
+    return result
+
+SUITES = {
+    'csspath'   : bench_csspath,
+    'pipeline'  : bench_pipeline,
+    'tag'       : bench_tag,
+    'url'       : bench_url,
+}
@@ -1,5 +1,8 @@
 from __future__ import unicode_literals
 
+import os.path
+import tempfile
+
 from django.conf import settings as django_settings
 
 class _Settings(object):
@@ -7,6 +10,22 @@ class _Settings(object):
         'CDN_STATIC_COMPRESSED_TYPES'        : ('css', 'js'), # Lowercase
         'CDN_DEFAULT_COMPRESSED_TYPES'       : (),
 
+        # Precompressed variants of the compressed types, in order of preference
+        'CDN_STATIC_ENCODINGS'               : ('gzip',), # 'br', 'zstd', 'gzip'
+        'CDN_DEFAULT_ENCODINGS'              : ('gzip',),
+        'CDN_GZIP_ZOPFLI'                    : False,
+
+        # Derivatives of jpg and png images, in order of preference.
+        # Only kept if smaller than the image.
+        'CDN_STATIC_IMAGE_FORMATS'           : (), # 'avif', 'webp'
+        'CDN_DEFAULT_IMAGE_FORMATS'          : (),
+        # Widths in pixels to scale jpg and png images down to.
+        'CDN_STATIC_IMAGE_WIDTHS'            : (),
+        'CDN_DEFAULT_IMAGE_WIDTHS'           : (), # e.g. (320, 640, 1280)
+        'CDN_JPEG_QUALITY'                   : 85,
+        'CDN_WEBP_QUALITY'                   : 80,
+        'CDN_AVIF_QUALITY'                   : 60,
+
         'CDN_STATIC_FILTERS'               : {
             'css'   : ('filters.cssmin', 'filters.csspath'),
             'js'    : ('filters.slimit',),
@@ -18,8 +37,84 @@ class _Settings(object):
             # none
         },
 
+        # Output path to the files concatenated into it, in order
+        'CDN_STATIC_BUNDLES'         : {},
+
         'CDN_STATIC_EXPIRY_AGE'      : 3600 * 24 * 365, # seconds
         'CDN_DEFAULT_EXPIRY_AGE'     : 3600 * 24 * 365, # seconds
+
+        # Lowercase extension to expiry age, overriding CDN_*_EXPIRY_AGE
+        'CDN_STATIC_EXPIRY_AGES'     : {},
+        'CDN_DEFAULT_EXPIRY_AGES'    : {},
+
+        # Seconds a CDN or browser may serve a stale file while fetching
+        # it again. Not added for immutable files.
+        'CDN_STATIC_STALE_WHILE_REVALIDATE' : 0,
+        'CDN_DEFAULT_STALE_WHILE_REVALIDATE': 24 * 3600,
+
+        # Store media files once per content under blobs/
+        'CDN_DEFAULT_CONTENT_ADDRESSED' : False,
+
+        # Process media files after the upload: 'local' or 'db', empty to disable
+        'CDN_DEFAULT_QUEUE'          : '',
+        'CDN_QUEUE_WORKERS'          : 1, # threads of the 'local' queue
+        'CDN_QUEUE_TIMEOUT'          : 3600, # seconds before a started task is retried
+
+        # Keep the size and ETag of the objects written to S3 in the database,
+        # so that exists(), size() and modified_time() need no request to S3
+        'CDN_STATIC_METADATA_INDEX'  : False,
+        'CDN_DEFAULT_METADATA_INDEX' : False,
+
+        'CDN_STATIC_UPLOAD_WORKERS'  : 0, # 0 uploads one file at a time
+        'CDN_STATIC_FILTER_PROCESSES': 0, # 0 runs filters in the uploading thread
+        'CDN_FILTER_TIMEOUT'         : 300, # seconds
+        'CDN_UPLOAD_RETRIES'         : 3,
+        'CDN_UPLOAD_RETRY_DELAY'     : 1, # seconds, doubled after every retry
+
+        # Files this big or bigger are uploaded to S3 in parts
+        'CDN_MULTIPART_THRESHOLD'    : 16 * 1024 * 1024, # bytes
+        'CDN_MULTIPART_PART_SIZE'    : 8 * 1024 * 1024, # bytes, at least 5 MB
+        'CDN_MULTIPART_WORKERS'      : 4, # parts uploaded at the same time
+
+        # Open S3 connections kept for reuse per host, shared by all storages
+        'CDN_S3_POOL_SIZE'           : 10,
+
+        # Per-file timing, sizes and S3 requests printed after collectstatic
+        'CDN_DEPLOY_REPORT'          : False,
+        'CDN_DEPLOY_REPORT_DIR'      : '', # also saved as JSON here, empty to disable
+        'CDN_DEPLOY_REPORT_TOP'      : 10, # slowest files listed
+
+        'CDN_FILTER_CACHE_DIR'       : '', # empty to disable
+        'CDN_FILTER_CACHE_SIZE'      : 512 * 1024 * 1024, # bytes
+
+        # Versions kept by `cdn_clean`: the latest done ones, and all
+        # the ones created recently
+        'CDN_CLEAN_KEEP'             : 3,
+        'CDN_CLEAN_GRACE'            : 7 * 24 * 3600, # seconds
+        'CDN_CLEAN_WORKERS'          : 4, # delete requests sent at the same time
+
+        'CDN_VERSION_TTL'            : 5, # seconds
+        'CDN_VERSION_CACHE'          : '', # cache alias, empty to disable
+
+        'CDN_URL_CACHE_SIZE'         : 1000, # 0 to disable
+        'CDN_ASSET_TTL'              : 60, # seconds
+
+        # Lowercase extensions of the files `cdn_preload` and PreloadMiddleware
+        # preload. Images are left out, as pages often use many of them.
+        'CDN_PRELOAD_TYPES'          : ('css', 'js', 'woff', 'woff2'),
+        'CDN_PRELOAD_DEPS'           : 0, # files found by csspath preloaded per CSS file
+
+        # Signed S3 URLs expire at the end of a window, so they can be kept
+        'CDN_SIGNED_URL_WINDOW'      : 300, # seconds
+        'CDN_S3_URL_CACHE_SIZE'      : 1000, # URLs kept by each S3 storage, 0 to disable
+
+        # Sizes allowed in the `thumbnail` view, e.g. 'w320h240'
+        'CDN_THUMBNAIL_SPECS'        : ('w160', 'w320', 'w640', 'w1280'),
+        'CDN_THUMBNAIL_CACHE_DIR'    : os.path.join(tempfile.gettempdir(), 'djcdn-thumbnails'),
+        'CDN_THUMBNAIL_CACHE_SIZE'   : 1024 * 1024 * 1024, # bytes
+        'CDN_THUMBNAIL_SOURCE_TTL'   : 60, # seconds
+        'CDN_THUMBNAIL_EXPIRY_AGE'   : 300, # seconds, for URLs without ?v=
+        'CDN_THUMBNAIL_UPLOAD'       : False,
     }
 
     def __getattr__(self, name):
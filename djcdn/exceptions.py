@@ -0,0 +1,33 @@
+from djbase.exceptions import BaseError
+
+class CDNError(BaseError):
+    """
+    Root class for all DjCDN related errors.
+    """
+
+    pass
+
+class CDNUploadError(CDNError):
+    """
+    Raised at the end of a parallel upload when one or more files
+    could not be uploaded.
+    """
+
+    def __init__(self, failures):
+        """
+        :type   failures: list
+        :param  failures: A list of (name, exception) tuples, one for
+            each file that failed.
+        """
+
+        super(CDNUploadError, self).__init__(
+            message='%s file(s) failed to upload' % len(failures))
+
+        self.failures = failures
+
+class CDNFilterError(CDNError):
+    """
+    Raised when filters run in a child process fail, crash or time out.
+    """
+
+    pass
@@ -1,23 +1,18 @@
 from __future__ import unicode_literals
 
+import codecs
 import re 
 import os.path
 import subprocess
 import shutil
 import tempfile
 
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
-
 import cssmin as cssmin_mod
 import slimit as slimit_mod
 
 from django.conf import settings
 from django.core.files import File
 from django.core.files.base import ContentFile
-from django.utils.translation import force_text
 
 _CSS_URL_MATCH = re.compile(
     r'(?<!\w)url\([ \t]*(?P<quote>[\'"]?)(?P<url>.*?)(?P=quote)[ \t]*\)|'+
@@ -25,6 +20,11 @@ _CSS_URL_MATCH = re.compile(
     re.IGNORECASE
 )
 
+# Where a match of _CSS_URL_MATCH can start
+_CSS_URL_START = re.compile(r'(?<!\w)url\(|@import', re.IGNORECASE)
+
+_CSS_CHUNK_SIZE = 64 * 1024 # characters
+
 def cssmin(input_file):
     """
     :type   input_file: File 
@@ -51,34 +51,152 @@ def _transform_url(url, version_str=None):
 
     return url
 
-def csspath(input_file, version_str=None):
+def _is_settled(match, text):
+    """
+    Whether the text after `text` cannot change `match`. A quoted URL
+    may be closed in the text that follows, and so may a URL whose
+    opening quote is the last character.
     """
-    :type   input_file: File 
 
-    :returns: File   
+    if match.group('url') is not None:
+        quote, pos = match.group('quote'), match.start('url')
+    else:
+        quote, pos = match.group('quote1'), match.end()
+
+    return bool(quote) or (pos < len(text) and text[pos] not in '\'"')
+
+def _split_css(text, start):
     """
+    Finds the URLs in text[start:] that the text after `text` cannot change.
+
+    :returns: tuple -- (matches, cut). text[:cut] is final once `matches` 
+        are replaced, text[cut:] must be scanned again with more text.
+    """
+
+    n = len(text)
+
+    # URLs cannot span lines, so everything before the last newline is final.
+    line_start = max(start, text.rfind('\n', start) + 1)
+
+    cut = n
+    matches = []
+    for match in _CSS_URL_MATCH.finditer(text, start):
+        if match.start() >= line_start and not _is_settled(match, text):
+            cut = match.start()
+            break
+
+        matches.append(match)
+
+    # On the last line, url( that failed to match may be closed later, 
+    # and so may @import followed by nothing. A url( fails only if there 
+    # is no ) after it.
+    i = 0
+    pos = max(line_start, text.rfind(')', line_start) + 1)
+    for candidate in _CSS_URL_START.finditer(text, pos, cut):
+        while i < len(matches) and matches[i].end() <= candidate.start():
+            i += 1
+
+        if i < len(matches) and matches[i].start() <= candidate.start():
+            continue
+
+        if candidate.group().lower() == 'url(' or candidate.end() == n:
+            cut = candidate.start()
+            break
+
+    matches = [m for m in matches if m.start() < cut]
+    last_end = matches[-1].end() if matches else start
+
+    # `url` or `@imp` at the end may be the start of a URL
+    for k in range(min(len('@import'), n - last_end), 0, -1):
+        tail = text[n-k:].lower()
+        if 'url('.startswith(tail) or '@import'.startswith(tail):
+            cut = min(cut, n - k)
+            break
+
+    return matches, cut
+
+def _replace_urls(text, start, end, matches, version_str):
+    """
+    :returns: bytes -- text[start:end] with the URL of each match 
+        transformed, encoded in UTF-8.
+    """
+
+    parts = []
+    cur = start
 
-    input_str = force_text(input_file.read())
-    cur = 0
-    output = StringIO()
-    matches = _CSS_URL_MATCH.finditer(input_str)
-    
     for match in matches:
         url = match.group('url')
         if url is None:
             url = match.group('url1')
-            start, end = match.span('url1')
+            url_start, url_end = match.span('url1')
         else:    
-            start, end = match.span('url')
+            url_start, url_end = match.span('url')
 
-        output.write(input_str[cur:start])
-        output.write(_transform_url(url, version_str=version_str).encode('utf8'))
-        cur = end
-        
-    output.write(input_str[cur:])
-    output.seek(0)
+        parts.append(text[cur:url_start])
+        parts.append(_transform_url(url, version_str=version_str))
+        cur = url_end
+
+    parts.append(text[cur:end])
+
+    return ''.join(parts).encode('utf8')
+
+def csspath(input_file, version_str=None):
+    """
+    Works on chunks of the input, so that large files are not held 
+    in memory. 
+
+    :type   input_file: File 
+
+    :returns: File   
+    """
+
+    decoder = codecs.getincrementaldecoder('utf8')()
+    (out_handle, out_path) = tempfile.mkstemp(text=False)
+
+    text = ''
+    start = 0
+
+    with os.fdopen(out_handle, 'wb') as output:
+        for chunk in input_file.chunks(chunk_size=_CSS_CHUNK_SIZE):
+            text += decoder.decode(chunk)
+            matches, cut = _split_css(text, start)
+            output.write(_replace_urls(text, start, cut, matches, version_str))
+
+            # keep one more character for the (?<!\w) look-behind
+            keep = max(cut - 1, 0)
+            text, start = text[keep:], cut - keep
+
+        text += decoder.decode(b'', final=True)
+        matches = _CSS_URL_MATCH.finditer(text, start)
+        output.write(_replace_urls(text, start, len(text), matches, version_str))
+
+    return File(open(out_path, 'rb'))
+
+def csspath_deps(input_file):
+    """
+    Finds the static files whose URLs csspath rewrites, e.g. fonts and
+    images, so that pages can preload them.
+
+    :type   input_file: File 
+
+    :returns: list -- paths relative to STATIC_ROOT, in order of first use.
+    """
+
+    root = settings.STATIC_ROOT
+    paths = []
+
+    # URLs cannot span lines
+    for line in input_file:
+        for match in _CSS_URL_MATCH.finditer(line.decode('utf8', 'replace')):
+            url = (match.group('url') or match.group('url1') or '').strip()
+            if not url.startswith(root):
+                continue
+
+            path = url[len(root):].lstrip('/').split('?')[0].split('#')[0]
+            if path and path not in paths:
+                paths.append(path)
 
-    return File(output)
+    return paths
 
 def slimit(input_file):
     """
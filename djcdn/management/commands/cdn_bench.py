@@ -0,0 +1,62 @@
+import inspect
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djcdn import bench
+
+class Command(BaseCommand):
+    args = '[suite ...]'
+    help = 'Runs DjCDN benchmarks. Suites: %s' % ', '.join(sorted(bench.SUITES))
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rounds', type='int', dest='rounds', default=None,
+            help='Number of rounds, the best one is reported.'),
+        make_option('--size', type='float', dest='size_mb', default=None,
+            help='Size in MB of the generated files, for the suites that generate files.'),
+        make_option('--json', dest='json', default=None,
+            help='Also writes the results and the versions of the dependencies '
+                 'as JSON to this file, or to stdout if "-".'),
+    )
+
+    def handle(self, *args, **options):
+        names = args or sorted(bench.SUITES)
+
+        for name in names:
+            if name not in bench.SUITES:
+                raise CommandError('Unknown suite: %s' % name)
+
+        results = {}
+
+        for name in names:
+            suite = bench.SUITES[name]
+            suite_args = inspect.getargspec(suite).args
+
+            kwargs = {}
+            if options['rounds']:
+                kwargs['rounds'] = options['rounds']
+            if options['size_mb'] and 'size_mb' in suite_args:
+                kwargs['size_mb'] = options['size_mb']
+
+            result = results[name] = suite(**kwargs)
+
+            if options['json'] == '-':
+                continue
+
+            print('%s:' % name)
+            width = max(len(key) for key in result)
+            for key in sorted(result):
+                print('  %-*s %s' % (max(width, 12), key, result[key]))
+
+        if options['json']:
+            output = json.dumps({
+                'environment'   : bench.get_environment(),
+                'suites'        : results,
+            }, indent=2, sort_keys=True)
+
+            if options['json'] == '-':
+                print(output)
+            else:
+                with open(options['json'], 'w') as f:
+                    f.write(output + '\n')
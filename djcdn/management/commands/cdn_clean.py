@@ -0,0 +1,40 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.files.storage import get_storage_class
+from django.core.management.base import BaseCommand, CommandError
+
+from djcdn.conf import settings as app_settings
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Deletes old versions of the static files from S3.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--keep', type='int', dest='keep', default=None,
+            help='Number of latest done versions to keep. Default: CDN_CLEAN_KEEP'),
+        make_option('--grace', type='int', dest='grace', default=None,
+            help='Keeps versions created less than GRACE seconds ago. Default: CDN_CLEAN_GRACE'),
+        make_option('--workers', type='int', dest='workers', default=None,
+            help='Delete requests sent at the same time. Default: CDN_CLEAN_WORKERS'),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Only lists the versions to delete.'),
+    )
+
+    def handle(self, *args, **options):
+        storage = get_storage_class(settings.STATICFILES_STORAGE)()
+        if not hasattr(storage, 'cdn_clean'):
+            raise CommandError('STATICFILES_STORAGE is not djcdn.storage.s3.VersionedStaticStorage.')
+
+        def option(name):
+            value = options[name]
+            return getattr(app_settings, 'CDN_CLEAN_' + name.upper()) if value is None else value
+
+        deleted = storage.cdn_clean(keep=option('keep'), grace=option('grace'),
+            workers=option('workers'), dry_run=options['dry_run'])
+
+        label = 'To delete' if options['dry_run'] else 'Deleted'
+        for version_str, count in deleted:
+            print('%s: %s (%d files)' % (label, version_str, count))
+
+        print('%d versions %s.' % (len(deleted), 'to delete' if options['dry_run'] else 'deleted'))
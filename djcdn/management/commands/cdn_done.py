@@ -1,11 +1,20 @@
+from optparse import make_option
+
 from django.core.management.base import BaseCommand, CommandError
 
 from djcdn.models import CDNVersion
+from djcdn.report import format_summary, load_summary
+from djcdn.versions import version_resolver
 
 class Command(BaseCommand):
     args = ''
     help = ''
 
+    option_list = BaseCommand.option_list + (
+        make_option('--report', action='store_true', dest='report', default=False,
+            help='Also prints the deploy report of the version, see CDN_DEPLOY_REPORT_DIR.'),
+    )
+
     def handle(self, *args, **options):
         ver = CDNVersion.objects.get_latest(is_done=False)
 
@@ -19,6 +28,14 @@ class Command(BaseCommand):
 
         ver.is_done = True 
         ver.save(update_fields=('is_done',))
+        version_resolver.publish(ver.version_str)
 
         print('Version %s marked as done.' % ver.version_str)
+
+        if options['report']:
+            summary = load_summary(ver.version_str)
+            if summary is None:
+                print('Warning: No deploy report saved for version %s.' % ver.version_str)
+            else:
+                print(format_summary(summary))
     
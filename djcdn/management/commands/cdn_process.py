@@ -0,0 +1,36 @@
+import time
+from optparse import make_option
+
+from django.core.files.storage import get_storage_class
+from django.core.management.base import BaseCommand, CommandError
+
+from djcdn.conf import settings as app_settings
+from djcdn.storage import deferred
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Processes the media files queued when CDN_DEFAULT_QUEUE is "db".'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--loop', type='float', dest='interval', default=None,
+            help='Keeps running, checking for new files every INTERVAL seconds.'),
+    )
+
+    def handle(self, *args, **options):
+        if app_settings.CDN_DEFAULT_QUEUE != 'db':
+            raise CommandError('CDN_DEFAULT_QUEUE is not "db".')
+
+        storage = get_storage_class()()
+        if not hasattr(storage, '_cdn_process'):
+            raise CommandError('DEFAULT_FILE_STORAGE is not a djcdn storage.')
+
+        while True:
+            done, failed = deferred.process_tasks(storage)
+
+            if done or failed or options['interval'] is None:
+                print('%d files processed, %d failed.' % (done, failed))
+
+            if options['interval'] is None:
+                return
+
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.files.storage import get_storage_class
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Makes the S3 metadata index (CDN_*_METADATA_INDEX) match the bucket.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Only lists the differences.'),
+    )
+
+    def handle(self, *args, **options):
+        paths = [settings.STATICFILES_STORAGE]
+        if settings.DEFAULT_FILE_STORAGE not in paths:
+            paths.append(settings.DEFAULT_FILE_STORAGE)
+
+        storages = [get_storage_class(path)() for path in paths]
+        storages = [storage for storage in storages
+            if hasattr(storage, 'cdn_reconcile') and storage._cdn_indexed]
+
+        if not storages:
+            raise CommandError('No djcdn S3 storage has its METADATA_INDEX setting on.')
+
+        for storage in storages:
+            added, updated, removed = storage.cdn_reconcile(dry_run=options['dry_run'])
+
+            for label, keys in (('Added', added), ('Updated', updated), ('Removed', removed)):
+                for key in keys:
+                    print('%s: %s' % (label, key))
+
+            print('%s: %d added, %d updated, %d removed.' % (storage._cdn_type,
+                len(added), len(updated), len(removed)))
@@ -0,0 +1,48 @@
+from __future__ import unicode_literals
+
+from django.utils.cache import patch_vary_headers
+
+from djcdn.templatetags.cdn import get_preloads
+
+class VaryMiddleware(object):
+    """
+    Adds the request headers that the `cdn` tag chose URLs by, e.g. 
+    Accept for WebP/AVIF images, to the Vary header of the response, so
+    that caches do not send the page to browsers that cannot use them.
+    """
+
+    def process_response(self, request, response):
+        vary = getattr(request, '_cdn_vary', None)
+        if vary:
+            patch_vary_headers(response, sorted(vary))
+
+        return response
+
+class PreloadMiddleware(object):
+    """
+    Adds a Link header preloading the files that the `cdn` tag gave URLs
+    of while rendering the page, and the fonts and images they refer to.
+    Browsers can then fetch them before parsing the HTML and the CSS.
+
+    Files already preloaded by the `cdn_preload` tag are left out.
+    """
+
+    def process_response(self, request, response):
+        if getattr(request, '_cdn_assets', None) is None:
+            return response
+
+        if not response.get('Content-Type', '').startswith('text/html'):
+            return response
+
+        links = get_preloads(request)
+        if not links:
+            return response
+
+        value = ', '.join('<%s>; rel=preload; as=%s%s' % (
+            url, as_, '; crossorigin' if as_ == 'font' else '') for url, as_ in links)
+
+        if response.has_header('Link'):
+            value = '%s, %s' % (response['Link'], value)
+
+        response['Link'] = value
+        return response
@@ -1,9 +1,10 @@
 import random 
+from datetime import timedelta
 
-from django.db import models
+from django.db import IntegrityError, models
 from django.utils import timezone 
 
-from djbase.models import BaseModel 
+from djbase.models import BaseModel, PickleField
 
 class CDNVersionManager(models.Manager):
     def get_latest(self, is_done=True):
@@ -28,6 +29,21 @@ class CDNVersionManager(models.Manager):
             except IntegrityError:
                 pass 
 
+    def get_prunable(self, keep, grace):
+        """
+        :param  keep: Number of latest done versions to keep, at least 1.
+        :param  grace: Versions created less than this many seconds ago
+            are kept, including the ones not done yet.
+
+        :returns: list of CDNVersion, oldest first.
+        """
+
+        kept = list(self.filter(is_done=True).order_by('-id')
+            .values_list('id', flat=True)[0:max(keep, 1)])
+        cutoff = timezone.now() - timedelta(seconds=grace)
+
+        return list(self.filter(created__lt=cutoff).exclude(id__in=kept).order_by('id'))
+
 class CDNVersion(BaseModel):
     id              = models.AutoField(primary_key=True)
     version_str     = models.CharField(max_length=30, unique=True)
@@ -40,3 +56,236 @@ class CDNVersion(BaseModel):
         index_together = [
             ['is_done', 'id'],
         ]
+
+class CDNFileManager(models.Manager):
+    def get_manifest(self, version):
+        """
+        :type   version: CDNVersion
+
+        :returns: dict -- source name to CDNFile for all files in the version.
+        """
+
+        return dict((f.name, f) for f in self.filter(version=version))
+
+    def get_variants(self, version_str, name):
+        """
+        :returns: dict -- See CDNFile.variants. Empty if there is no such file.
+        """
+
+        rows = list(self.filter(version__version_str=version_str, name=name)[0:1])
+
+        if rows:
+            return rows[0].variants
+
+        return {}
+
+    def get_deps(self, version_str, name):
+        """
+        :returns: list -- See CDNFile.deps. Empty if there is no such file.
+        """
+
+        rows = list(self.filter(version__version_str=version_str, name=name)[0:1])
+
+        if rows:
+            return rows[0].deps
+
+        return []
+
+class CDNFile(BaseModel):
+    """
+    A static file deployed as part of a CDNVersion.
+    """
+
+    id              = models.AutoField(primary_key=True)
+    version         = models.ForeignKey(CDNVersion)
+    name            = models.CharField(max_length=255)
+    """Name of the source file as given to the storage."""
+
+    hash            = models.CharField(max_length=40)
+    """SHA1 of the source file content and the processing settings."""
+
+    variants        = PickleField(default=dict)
+    """Names the file was stored as, relative to the version's folder. 
+    Keyed by variant: '' for the main file, the Content-Encoding 
+    ('gzip', 'br', 'zstd') for the precompressed ones, or the image
+    format ('webp', 'avif') for derivatives smaller than the main file."""
+
+    deps            = PickleField(default=list)
+    """Names of the static files the file refers to, e.g. the fonts and
+    images in the url()s of a CSS file that csspath rewrites."""
+
+    objects = CDNFileManager()
+
+    class Meta:
+        unique_together = [
+            ['version', 'name'],
+        ]
+
+class CDNAssetManager(models.Manager):
+    def record(self, type, name, variants):
+        """
+        Creates or replaces the variants of a file.
+        """
+
+        try:
+            return self.create(type=type, name=name, variants=variants)
+        except IntegrityError:
+            asset = self.get(type=type, name=name)
+            asset.variants = variants
+            asset.save(update_fields=('variants',))
+            return asset
+
+    def get_variants(self, type, name):
+        """
+        :returns: dict -- See CDNAsset.variants. Empty if not recorded.
+        """
+
+        rows = list(self.filter(type=type, name=name)[0:1])
+
+        if rows:
+            return rows[0].variants
+
+        return {}
+
+class CDNAsset(BaseModel):
+    """
+    A file saved to a storage that is not versioned, e.g. a media file, 
+    that has variants the `cdn` tag must know about.
+    """
+
+    id              = models.AutoField(primary_key=True)
+    type            = models.CharField(max_length=10)
+    """'STATIC' or 'DEFAULT'."""
+
+    name            = models.CharField(max_length=255)
+    variants        = PickleField(default=dict)
+    """Same as CDNFile.variants."""
+
+    objects = CDNAssetManager()
+
+    class Meta:
+        unique_together = [
+            ['type', 'name'],
+        ]
+
+class CDNTaskManager(models.Manager):
+    def get_pending(self, type, timeout, max_attempts):
+        """
+        :param  timeout: Seconds after which a started task is assumed
+            to have been abandoned, e.g. by a worker that was killed.
+
+        :returns: list of CDNTask, oldest first.
+        """
+
+        stale = timezone.now() - timedelta(seconds=timeout)
+        qs = self.filter(models.Q(started__isnull=True) | models.Q(started__lt=stale),
+            type=type, attempts__lte=max_attempts)
+
+        return list(qs.order_by('id'))
+
+    def claim(self, task):
+        """
+        Marks a task as started, unless another worker did first.
+        Counts the attempt, so that a task whose worker is killed is 
+        also given up after `max_attempts`.
+
+        :returns: bool -- whether the caller got the task.
+        """
+
+        now = timezone.now()
+        claimed = self.filter(pk=task.pk, started=task.started).update(started=now, 
+            attempts=models.F('attempts') + 1)
+
+        if claimed == 1:
+            task.started = now
+            task.attempts += 1
+
+        return claimed == 1
+
+    def release(self, task):
+        """
+        Puts back a task that failed, to be retried.
+        """
+
+        task.started = None
+        task.save(update_fields=('attempts', 'started'))
+
+class CDNTask(BaseModel):
+    """
+    A file saved to a storage whose processing is deferred to 
+    `python manage.py cdn_process`. See CDN_DEFAULT_QUEUE.
+    """
+
+    id              = models.AutoField(primary_key=True)
+    type            = models.CharField(max_length=10)
+    """'STATIC' or 'DEFAULT'."""
+
+    name            = models.CharField(max_length=255)
+    """Name of the source file as given to the storage."""
+
+    attempts        = models.IntegerField(default=0)
+    started         = models.DateTimeField(null=True)
+    created         = models.DateTimeField(auto_now_add=True)
+
+    objects = CDNTaskManager()
+
+    class Meta:
+        index_together = [
+            ['type', 'id'],
+        ]
+
+class CDNObjectManager(models.Manager):
+    def record(self, bucket, key, **fields):
+        """
+        Creates or replaces the metadata of an object.
+        """
+
+        try:
+            return self.create(bucket=bucket, key=key, **fields)
+        except IntegrityError:
+            obj = self.get(bucket=bucket, key=key)
+            for name, value in fields.items():
+                setattr(obj, name, value)
+            obj.save(update_fields=fields.keys())
+            return obj
+
+    def get_object(self, bucket, key):
+        """
+        :returns: CDNObject, or None if not recorded.
+        """
+
+        rows = list(self.filter(bucket=bucket, key=key)[0:1])
+
+        if rows:
+            return rows[0]
+
+        return None
+
+    def forget(self, bucket, key):
+        self.filter(bucket=bucket, key=key).delete()
+
+class CDNObject(BaseModel):
+    """
+    An object written to S3 by a storage whose METADATA_INDEX setting
+    is on, so that exists() and size() need no request to S3.
+    """
+
+    id              = models.AutoField(primary_key=True)
+    bucket          = models.CharField(max_length=63)
+    key             = models.CharField(max_length=255)
+    """Full key name, including the storage's location."""
+
+    size            = models.BigIntegerField()
+    etag            = models.CharField(max_length=70)
+    content_type    = models.CharField(max_length=100)
+    modified        = models.DateTimeField()
+    variants        = PickleField(default=dict)
+    """Same as CDNFile.variants, for the main file of a saved file. 
+    Empty for the variants themselves."""
+
+    objects = CDNObjectManager()
+
+    class Meta:
+        unique_together = [
+            ['bucket', 'key'],
+        ]
@@ -0,0 +1,227 @@
+"""
+Deploy report: what collectstatic spent its time on, file by file.
+
+The storage opens a record with DeployReport.file() around the work
+on each file, and the code doing the work adds to the record of its
+thread with DeployReport.add(). See CDN_DEPLOY_REPORT.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from djcdn.conf import settings as app_settings
+
+_MB = 1024.0 * 1024
+
+class DeployReport(object):
+    """
+    Thread-safe collection of one record per file, e.g.
+    {'name': 'css/main.css', 'seconds': 0.5, 'input_bytes': 10240,
+    'output_bytes': 4096, 'encoded_bytes': {'gzip': 1024},
+    'filters': {'filters.cssmin': 0.4}, 'requests': 2,
+    'upload_seconds': 0.1, 'copied': False}
+    """
+
+    def __init__(self):
+        self._files     = {}
+        self._lock      = threading.Lock()
+        self._local     = threading.local()
+        self._started   = time.time()
+
+    @contextmanager
+    def file(self, name, input_bytes):
+        """
+        Makes the record of `name` the current one of this thread.
+        """
+
+        with self._lock:
+            record = self._files.get(name, None)
+            if record is None:
+                record = self._files[name] = {
+                    'name'          : name,
+                    'seconds'       : 0,
+                    'input_bytes'   : input_bytes,
+                    'output_bytes'  : input_bytes,
+                    'encoded_bytes' : {},
+                    'filters'       : {},
+                    'requests'      : 0,
+                    'upload_seconds': 0,
+                    'copied'        : False,
+                }
+
+        prev = getattr(self._local, 'record', None)
+        self._local.record = record
+        start = time.time()
+
+        try:
+            yield record
+        finally:
+            self.add('seconds', time.time() - start, record=record)
+            self._local.record = prev
+
+    def current(self):
+        """
+        :returns: dict -- the record of this thread's file, or None.
+        """
+
+        return getattr(self._local, 'record', None)
+
+    def add(self, key, value, record=None):
+        """
+        Adds a number to a number of the current record, or a dict of
+        numbers to a dict.
+
+        :param  record: Record to add to instead of the current one,
+            e.g. from a worker thread.
+        """
+
+        record = record or self.current()
+        if record is None:
+            return
+
+        with self._lock:
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    record[key][k] = record[key].get(k, 0) + v
+            else:
+                record[key] += value
+
+    def set(self, key, value):
+        """
+        Sets a value of the current record.
+        """
+
+        record = self.current()
+        if record is None:
+            return
+
+        with self._lock:
+            record[key] = value
+
+    def summary(self, top=10):
+        """
+        :param  top: Number of slowest files to list.
+
+        :returns: dict -- totals, and the `top` slowest files.
+        """
+
+        with self._lock:
+            files = [dict(record) for record in self._files.values()]
+
+        filters = {}
+        encoded_bytes = {}
+
+        for record in files:
+            for name, seconds in record['filters'].items():
+                filters[name] = filters.get(name, 0) + seconds
+            for encoding, size in record['encoded_bytes'].items():
+                encoded_bytes[encoding] = encoded_bytes.get(encoding, 0) + size
+
+        processed = [record for record in files if not record['copied']]
+        input_bytes = sum(record['input_bytes'] for record in processed)
+        output_bytes = sum(record['output_bytes'] for record in processed)
+
+        return {
+            'seconds'       : time.time() - self._started,
+            'files'         : len(files),
+            'copied'        : len(files) - len(processed),
+            'requests'      : sum(record['requests'] for record in files),
+            'upload_seconds': sum(record['upload_seconds'] for record in files),
+            'input_bytes'   : input_bytes,
+            'output_bytes'  : output_bytes,
+            'saved_bytes'   : input_bytes - output_bytes,
+            'encoded_bytes' : encoded_bytes,
+            'filters'       : filters,
+            'slowest'       : sorted(files, key=lambda r: -r['seconds'])[:top],
+        }
+
+    def to_json(self):
+        """
+        :returns: str -- the summary and the records of all files.
+        """
+
+        with self._lock:
+            files = sorted((dict(record) for record in self._files.values()),
+                key=lambda r: r['name'])
+
+        return json.dumps({
+            'summary'   : self.summary(),
+            'files'     : files,
+        }, indent=2, sort_keys=True)
+
+    def save(self, version_str):
+        """
+        Writes the JSON to CDN_DEPLOY_REPORT_DIR, if set.
+
+        :returns: str -- path of the file, or None.
+        """
+
+        path = app_settings.CDN_DEPLOY_REPORT_DIR
+        if not path:
+            return None
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        path = os.path.join(path, '%s.json' % (version_str or 'latest'))
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+        return path
+
+def load_summary(version_str):
+    """
+    :returns: dict -- the summary saved for a version, or None.
+    """
+
+    path = app_settings.CDN_DEPLOY_REPORT_DIR
+    if not path:
+        return None
+
+    path = os.path.join(path, '%s.json' % (version_str or 'latest'))
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)['summary']
+
+def format_summary(summary):
+    """
+    :returns: str -- the summary as text for the console.
+    """
+
+    lines = [
+        'Deploy report: %d files (%d copied) in %.1f s, %d S3 requests taking %.1f s' % (
+            summary['files'], summary['copied'], summary['seconds'],
+            summary['requests'], summary['upload_seconds']),
+        'Bytes: %.2f MB in, %.2f MB out, %.2f MB saved by filters' % (
+            summary['input_bytes'] / _MB, summary['output_bytes'] / _MB,
+            summary['saved_bytes'] / _MB),
+    ]
+
+    if summary['encoded_bytes']:
+        lines.append('Encoded: ' + ', '.join('%s %.2f MB' % (encoding, size / _MB)
+            for encoding, size in sorted(summary['encoded_bytes'].items())))
+
+    if summary['filters']:
+        lines.append('Filters: ' + ', '.join('%s %.2f s' % (name, seconds)
+            for name, seconds in sorted(summary['filters'].items(), key=lambda i: -i[1])))
+
+    if summary['slowest']:
+        lines.append('Slowest files:')
+
+    for record in summary['slowest']:
+        details = ['%d requests' % record['requests']]
+        details.extend('%s %.2f s' % (name, seconds)
+            for name, seconds in sorted(record['filters'].items(), key=lambda i: -i[1]))
+        if record['copied']:
+            details.append('copied')
+
+        lines.append('  %7.2f s  %s (%s)' % (record['seconds'], record['name'], ', '.join(details)))
+
+    return '\n'.join(lines)
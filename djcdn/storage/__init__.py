@@ -1,14 +1,21 @@
 from __future__ import unicode_literals
 
 from datetime import datetime, timedelta
+import hashlib
 import inspect
 import os
 import os.path
+import tempfile
+import time
 
+from django.conf import settings
 from django.core.files import File
 from django.core.files.base import ContentFile 
 
 from djcdn import filters as filters_mod
+from djcdn.conf import settings as app_settings
+from djcdn.storage import encodings as encodings_mod
+from djcdn.storage.cache import DiskCache
 
 class Util(object):
     # locale independent... the GMT format should just be pure numbers.
@@ -17,13 +24,20 @@ class Util(object):
     MONTHS  = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug',
                'Sep', 'Oct', 'Nov', 'Dec')
 
+    # (path, DiskCache)
+    _filter_cache = None
+
     @classmethod
-    def get_expiry_headers(cls, age):
+    def get_expiry_headers(cls, age, stale=0, immutable=False):
         """
         Get Expires and Cache-Control headers.
 
         :type   age: int 
         :param  age: Expiry age in seconds. 
+        :param  stale: Seconds a stale copy may be served while it is
+            revalidated in the background, 0 to disable.
+        :param  immutable: True if the content never changes, so that
+            browsers do not revalidate it on reload.
 
         :returns:   dict 
         """
@@ -35,13 +49,46 @@ class Util(object):
         expires = now + timedelta(seconds=age)
         expires_str = expires.strftime('%%s, %d %%s %Y %H:%M:%S GMT')
         expires_str = expires_str % (days[expires.weekday()], months[expires.month-1])
+        cache_control = 'public, max-age=%s' % age
+        if stale > 0:
+            cache_control += ', stale-while-revalidate=%s' % stale
+        if immutable:
+            cache_control += ', immutable'
+
         headers = {
             'Expires'       : expires_str,
-            'Cache-Control' : 'public, max-age=%s' % age, 
+            'Cache-Control' : cache_control, 
         }
 
         return headers
 
+    @classmethod
+    def get_cache_headers(cls, cdn_type, name, immutable=False):
+        """
+        Get the Expires and Cache-Control headers of a file from the 
+        CDN_<TYPE>_EXPIRY_AGE, CDN_<TYPE>_EXPIRY_AGES and 
+        CDN_<TYPE>_STALE_WHILE_REVALIDATE settings. Call it for every
+        upload, as Expires is relative to now.
+
+        :param  cdn_type: 'STATIC' or 'DEFAULT'.
+        :param  immutable: True if the content of `name` never changes,
+            e.g. it is in a version folder.
+
+        :returns:   dict -- empty if the expiry age is 0.
+        """
+
+        file_ext = os.path.splitext(name)[1].lstrip('.').lower()
+        age = getattr(app_settings, 'CDN_%s_EXPIRY_AGES' % cdn_type).get(file_ext, 
+            getattr(app_settings, 'CDN_%s_EXPIRY_AGE' % cdn_type))
+        if age <= 0:
+            return {}
+
+        # immutable content is never stale
+        stale = 0 if immutable else getattr(app_settings, 
+            'CDN_%s_STALE_WHILE_REVALIDATE' % cdn_type)
+
+        return cls.get_expiry_headers(age=age, stale=stale, immutable=immutable)
+
     @classmethod
     def delete_file(cls, file):
         if isinstance(file, ContentFile):
@@ -61,6 +108,77 @@ class Util(object):
             print('Warning: Cannot delete temp file (Reason: %s): %s' 
                 % (e, inner_file_path))
 
+    @classmethod
+    def spool_file(cls, file, suffix=''):
+        """
+        Copies the content of a file into a new temp file on disk.
+
+        :type   file: File
+
+        :returns: str -- path of the temp file. The caller must delete it.
+        """
+
+        (out_handle, out_path) = tempfile.mkstemp(suffix=suffix)
+
+        with os.fdopen(out_handle, 'wb') as out:
+            for chunk in file.chunks():
+                out.write(chunk)
+
+        return out_path
+
+    @classmethod
+    def hash_file(cls, file, salt=''):
+        """
+        Gets the SHA1 hex digest of a file's content.
+
+        :type   file: File
+        :param  salt: Hashed before the content.
+
+        :returns: str. The file is rewound to the start.
+        """
+
+        m = hashlib.sha1()
+        m.update(salt.encode('utf8'))
+
+        for chunk in file.chunks():
+            m.update(chunk)
+
+        file.seek(0)
+        return m.hexdigest()
+
+    @classmethod
+    def get_filter(cls, filter):
+        """
+        :param  filter: Filter name such as 'filters.cssmin'.
+
+        :returns: function, or None if `filter` is not a filter name.
+        """
+
+        if not filter.startswith('filters.'):
+            return None
+
+        fn_name = filter.split('.')[1]
+        filter_fn = getattr(filters_mod, fn_name, None)
+
+        if filter_fn is None:
+            raise Exception('filter function does not exist: %s' % filter)
+
+        return filter_fn
+
+    @classmethod
+    def uses_version(cls, filters):
+        """
+        Checks whether the output of any of the filters depends on the version.
+        """
+
+        for filter in filters:
+            filter_fn = cls.get_filter(filter)
+
+            if filter_fn and 'version_str' in inspect.getargspec(filter_fn).args:
+                return True
+
+        return False
+
     @classmethod 
     def _call_filter(cls, filter_fn, input_file, version_str):
         argspec = inspect.getargspec(filter_fn)
@@ -71,30 +189,95 @@ class Util(object):
         return filter_fn(input_file=input_file)
 
     @classmethod
-    def apply_filters(cls, filters, input_file, version_str=None):
+    def get_filter_cache(cls):
         """
+        :returns: DiskCache for the output of filters, 
+            or None if settings.CDN_FILTER_CACHE_DIR is not set.
+        """
+
+        path = app_settings.CDN_FILTER_CACHE_DIR
+        if not path:
+            return None
+
+        if cls._filter_cache is None or cls._filter_cache[0] != path:
+            cache = DiskCache(path=path, max_size=app_settings.CDN_FILTER_CACHE_SIZE)
+            cls._filter_cache = (path, cache)
+
+        return cls._filter_cache[1]
+
+    @classmethod
+    def _filters_salt(cls, filters, version_str):
+        salt = '%r|' % (tuple(filters),)
+
+        # csspath also depends on where static files are served from.
+        if cls.uses_version(filters):
+            salt += '%s|%s|%s|' % (version_str, settings.STATIC_ROOT, settings.STATIC_URL)
+
+        return salt
+
+    @classmethod
+    def apply_filters(cls, filters, input_file, version_str=None, pool=None, timings=None):
+        """
+        If settings.CDN_FILTER_CACHE_DIR is set, the output is cached 
+        on disk, keyed by the input content, the filters and the version 
+        if any of the filters uses it.
+
         :type   input_file: File
         :param  input_file: Will start reading at the current file position.
+            If the cache is enabled, the whole file is read.
+
+        :type   pool: djcdn.storage.process.FilterPool
+        :param  pool: If given, the filters are run in a child process.
+
+        :type   timings: dict
+        :param  timings: If given, filter name to the seconds it ran is
+            added to it. Filters whose output is cached are not run.
 
         :returns: 
             File -- may be the same as input_file. 
             File position indeterminate.
         """
-        
+
+        if pool is None:
+            run = cls._apply_filters
+        else:
+            run = pool.apply
+
+        cache = cls.get_filter_cache()
+        if cache is None:
+            return run(filters, input_file, version_str, timings=timings)
+
+        key = cls.hash_file(input_file, salt=cls._filters_salt(filters, version_str))
+        data = cache.get(key)
+
+        if data is not None:
+            return ContentFile(data)
+
+        output_file = run(filters, input_file, version_str, timings=timings)
+
+        # A filter that fails, e.g. when jpegoptim is not installed,
+        # returns its input. Don't remember that.
+        if not(output_file is input_file):
+            output_file.seek(0)
+            cache.set(key, output_file.read())
+            output_file.seek(0)
+
+        return output_file
+
+    @classmethod
+    def _apply_filters(cls, filters, input_file, version_str, timings=None):
         output_file = input_file
         is_first = True 
 
         for filter in filters:
-            if not filter.startswith('filters.'):
-                continue 
-
-            fn_name = filter.split('.')[1]
-            filter_fn = getattr(filters_mod, fn_name, None)
-            
+            filter_fn = cls.get_filter(filter)
             if filter_fn is None:
-                raise Exception('filter function does not exist: %s' % filter)
+                continue 
 
+            start = time.time()
             new_output_file = cls._call_filter(filter_fn, input_file=output_file, version_str=version_str)
+            if timings is not None:
+                timings[filter] = timings.get(filter, 0) + time.time() - start
 
             # Delete intermediate files
             if (not is_first) and not(output_file is new_output_file):
@@ -119,3 +302,65 @@ class Util(object):
     @classmethod 
     def format_gz_file_name(cls, file_name):
         return '%s.gz' % file_name 
+
+    @classmethod
+    def format_encoded_file_name(cls, file_name, encoding):
+        """
+        :param  encoding: Content-Encoding such as 'gzip' or 'br'.
+        """
+
+        return '%s.%s' % (file_name, encodings_mod.MARKERS[encoding])
+
+    @classmethod
+    def parse_accept(cls, header):
+        """
+        Parses an Accept or Accept-Encoding header.
+
+        :returns: dict -- lowercase value to its q-value (float).
+        """
+
+        accept = {}
+
+        for item in header.split(','):
+            parts = item.split(';')
+            value = parts[0].strip().lower()
+            if not value:
+                continue
+
+            q = 1.0
+            for param in parts[1:]:
+                param = param.strip().lower()
+                if param.startswith('q='):
+                    try:
+                        q = float(param[2:])
+                    except ValueError:
+                        q = 0.0
+
+            accept[value] = q
+
+        return accept
+
+    @classmethod
+    def choose_encoding(cls, header, encodings):
+        """
+        Chooses the encoding with the highest q-value in an Accept-Encoding 
+        header. Ties are broken by the order of `encodings`.
+
+        :param  header: Value of the Accept-Encoding header.
+        :param  encodings: Available encodings in order of preference.
+
+        :returns: str, or None if none of the encodings is accepted.
+        """
+
+        accept = cls.parse_accept(header)
+        any_q = accept.get('*', 0.0)
+        best = None
+        best_q = 0.0
+
+        for encoding in encodings:
+            q = accept.get(encoding, any_q)
+            if q > best_q:
+                best = encoding
+                best_q = q
+
+        return best
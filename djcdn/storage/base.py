@@ -0,0 +1,599 @@
+"""
+The djcdn pipeline shared by the storage backends: filters, 
+precompressed encodings, image derivatives and width variants,
+parallel uploads and bundles.
+
+In content-addressed mode (CDN_DEFAULT_CONTENT_ADDRESSED), files are 
+stored once per content under blobs/, and the names given to the
+storage are mapped to their blob by CDNAsset rows.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import os
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.base import ContentFile
+
+from djcdn.models import CDNAsset
+from djcdn.conf import settings as app_settings
+from djcdn.exceptions import CDNError, CDNUploadError
+from djcdn.report import DeployReport, format_summary
+from djcdn.storage import Util
+from djcdn.storage import deferred
+from djcdn.storage import encodings as encodings_mod
+from djcdn.storage import images
+from djcdn.storage.process import FilterPool
+from djcdn.storage.upload import UploadPool, call_with_retry
+
+# Prefix of the names of content-addressed files
+BLOBS_PATH = 'blobs/'
+
+# Blobs never change, so browsers need not revalidate them
+_IMMUTABLE_AGE = 3600 * 24 * 365 # seconds
+
+class CDNStorageMixin(object):
+    """
+    Runs every saved file through the djcdn pipeline. 
+
+    Backends call _cdn_init() from their __init__ and implement
+    _cdn_put(), which writes one file.
+    """
+
+    def _cdn_init(self, cdn_type, kwargs):
+        """
+        Pops the cdn_* arguments from `kwargs`.
+
+        :param  cdn_type: 'STATIC' or 'DEFAULT'.
+        """
+
+        self._cdn_type = cdn_type 
+        self._cdn_version_str = kwargs.pop('cdn_version_str', None)
+        self._cdn_content_addressed = (cdn_type == 'DEFAULT' and 
+            app_settings.CDN_DEFAULT_CONTENT_ADDRESSED)
+        self._cdn_queue = deferred.get_queue(
+            app_settings.CDN_DEFAULT_QUEUE if cdn_type == 'DEFAULT' else '')
+
+        if cdn_type == 'STATIC' and app_settings.CDN_DEPLOY_REPORT:
+            self._cdn_report = DeployReport()
+        else:
+            self._cdn_report = None
+
+        upload_workers = kwargs.pop('cdn_upload_workers', 0)
+        if upload_workers > 0:
+            self._cdn_upload_pool = UploadPool(workers=upload_workers)
+        else:
+            self._cdn_upload_pool = None
+
+        filter_processes = kwargs.pop('cdn_filter_processes', 0)
+        if filter_processes > 0:
+            self._cdn_filter_pool = FilterPool(processes=filter_processes,
+                timeout=app_settings.CDN_FILTER_TIMEOUT)
+        else:
+            self._cdn_filter_pool = None
+
+        missing = encodings_mod.get_missing(self._cdn_settings('ENCODINGS'), 
+            zopfli=app_settings.CDN_GZIP_ZOPFLI)
+        if missing:
+            raise ImproperlyConfigured('Cannot produce encodings (module not installed?): %s' 
+                % ', '.join(missing))
+
+        # formats whose encoder is not installed are skipped
+        self._cdn_image_formats = images.get_available(self._cdn_settings('IMAGE_FORMATS'))
+
+        if self._cdn_settings('IMAGE_WIDTHS') and images.Image is None:
+            raise ImproperlyConfigured('Cannot resize images (module not installed?): PIL')
+
+    def _cdn_settings(self, name):
+        return getattr(app_settings, 'CDN_%s_%s' % (self._cdn_type, name))
+
+    def _cdn_put(self, name, content, headers=None):
+        """
+        Writes a file, replacing any file with the same name.
+
+        :param  headers: HTTP headers of the file, e.g. Content-Encoding.
+
+        :returns: str -- the saved name.
+        """
+
+        raise NotImplementedError()
+
+    def _cdn_report_add(self, key, value, record=None):
+        """
+        Adds to the deploy report of the file being saved, if any.
+        See DeployReport.add().
+        """
+
+        if self._cdn_report is not None:
+            self._cdn_report.add(key, value, record=record)
+
+    def _cdn_get_headers(self, name):
+        """
+        :returns: dict -- HTTP headers of the file saved as `name`, 
+            other than the ones of every file of the storage.
+        """
+
+        if self._cdn_content_addressed and name.startswith(BLOBS_PATH):
+            return Util.get_expiry_headers(age=_IMMUTABLE_AGE, immutable=True)
+
+        # a version folder is never uploaded to again
+        return Util.get_cache_headers(self._cdn_type, name, 
+            immutable=self._cdn_version_str is not None)
+
+    def _cdn_upload(self, name, content, headers=None):
+        headers = dict(self._cdn_get_headers(name), **(headers or {}))
+
+        def put(**kwargs):
+            self._cdn_report_add('requests', 1)
+            return self._cdn_put(**kwargs)
+
+        start = time.time()
+
+        try:
+            return call_with_retry(put,
+                retries=app_settings.CDN_UPLOAD_RETRIES,
+                delay=app_settings.CDN_UPLOAD_RETRY_DELAY,
+                name=name, content=content, headers=headers)
+        finally:
+            self._cdn_report_add('upload_seconds', time.time() - start)
+
+    def _cdn_format_encoded_name(self, file_name, file_ext, encoding):
+        """
+        :returns: str -- name of a precompressed variant, e.g. main.min.gz.css
+        """
+
+        # must preserve file ext!
+        encoded_file_name = Util.format_encoded_file_name(file_name, encoding)
+        return '%s.%s' % (encoded_file_name, file_ext)
+
+    def _cdn_save_encoded(self, file_name, file_ext, content):
+        """
+        Uploads the precompressed variants of a file.
+
+        :returns: dict -- Content-Encoding to the name of the variant.
+        """
+
+        if file_ext.lower() not in self._cdn_settings('COMPRESSED_TYPES'):
+            return {}
+
+        variants = {}
+
+        for encoding in self._cdn_settings('ENCODINGS'):
+            encoded_name = self._cdn_format_encoded_name(file_name, file_ext, encoding)
+            encoded_file = encodings_mod.compress_file(encoding, content, 
+                zopfli=app_settings.CDN_GZIP_ZOPFLI)
+            self._cdn_report_add('encoded_bytes', {encoding: encoded_file.size})
+
+            try:
+                variants[encoding] = self._cdn_upload(name=encoded_name, 
+                    content=encoded_file,
+                    headers={'Content-Encoding': encoding})
+            finally:
+                encoded_file.close()
+                Util.delete_file(encoded_file)
+
+        return variants
+
+    def _cdn_save_derivatives(self, saved_name, file_ext, content):
+        """
+        Uploads the derivatives of an image that are smaller than it.
+
+        :returns: dict -- image format to the name of the derivative.
+        """
+
+        file_ext = file_ext.lower()
+        if file_ext not in images.SOURCE_TYPES:
+            return {}
+
+        size = content.size
+        variants = {}
+
+        for format in self._cdn_image_formats:
+            data = images.encode(format, content, file_ext)
+            if data is None or len(data) >= size:
+                continue
+
+            derivative = ContentFile(data)
+            derivative.content_type = images.FORMATS[format][1]
+
+            variants[format] = self._cdn_upload(
+                name=images.format_derivative_name(saved_name, format), 
+                content=derivative)
+
+        return variants
+
+    def _cdn_save_widths(self, file_name, file_ext, content, filters, saved_name):
+        """
+        Uploads the image scaled down to each width in IMAGE_WIDTHS, 
+        filtered like the image itself.
+
+        :returns: dict -- width key to the name of the variant, including
+            the image itself under its own width.
+        """
+
+        widths = self._cdn_settings('IMAGE_WIDTHS')
+        if not widths or file_ext.lower() not in images.SOURCE_TYPES:
+            return {}
+
+        orig_width, resized = images.resize(content, file_ext.lower(), widths)
+        if orig_width is None:
+            return {}
+
+        variants = {images.format_width_key(orig_width): saved_name}
+
+        for width, data in sorted(resized.items()):
+            # filters such as jpegoptim need a file on disk
+            path = Util.spool_file(ContentFile(data), suffix='.' + file_ext)
+
+            try:
+                with open(path, 'rb') as f:
+                    input_file = File(f)
+                    output_file = input_file
+
+                    if filters:
+                        output_file = self._cdn_apply_filters(filters, input_file)
+
+                    variants[images.format_width_key(width)] = self._cdn_upload(
+                        name=images.format_width_name(file_name, file_ext, width),
+                        content=output_file)
+
+                    if not(output_file is input_file):
+                        output_file.close()
+                        Util.delete_file(output_file)
+            finally:
+                os.unlink(path)
+
+        return variants
+
+    def _cdn_apply_filters(self, filters, input_file):
+        """
+        Util.apply_filters() with the settings of this storage.
+        """
+
+        timings = {} if self._cdn_report is not None else None
+
+        output_file = Util.apply_filters(filters=filters, input_file=input_file, 
+            version_str=self._cdn_version_str, pool=self._cdn_filter_pool,
+            timings=timings)
+
+        if timings:
+            self._cdn_report_add('filters', timings)
+
+        return output_file
+
+    def _cdn_save(self, name, content):
+        """
+        Filters and uploads a file together with its variants.
+
+        :returns: dict -- variant to saved name. See CDNFile.variants.
+        """
+
+        file_name, file_ext = os.path.splitext(name)
+        file_ext = file_ext.lstrip('.')
+        file_ext_lower = file_ext.lower()
+        
+        filters_map = self._cdn_settings('FILTERS')
+        filters = filters_map.get(file_ext_lower, None)
+
+        if filters:
+            output_file = self._cdn_apply_filters(filters, content)
+            if self._cdn_report is not None:
+                self._cdn_report.set('output_bytes', output_file.size)
+
+            file_name = Util.format_min_file_name(file_name, file_ext)
+            new_name = '%s.%s' % (file_name, file_ext)
+            
+            new_name = self._cdn_upload(name=new_name, content=output_file)
+            variants = self._cdn_save_encoded(file_name=file_name, file_ext=file_ext, content=output_file)
+            variants.update(self._cdn_save_derivatives(new_name, file_ext, output_file))
+
+            if not(output_file is content):
+                output_file.close()
+                Util.delete_file(output_file)
+        else:
+            new_name = self._cdn_upload(name=name, content=content)
+            variants = self._cdn_save_encoded(file_name=file_name, file_ext=file_ext, content=content)
+            variants.update(self._cdn_save_derivatives(new_name, file_ext, content))
+
+        variants.update(self._cdn_save_widths(file_name=file_name, file_ext=file_ext, 
+            content=content, filters=filters, saved_name=new_name))
+
+        variants[''] = new_name
+        return variants
+
+    def _cdn_hash(self, name, content):
+        """
+        Hashes the source content together with the settings that
+        affect how it is processed.
+        """
+
+        file_ext = os.path.splitext(name)[1].lstrip('.').lower()
+        filters = self._cdn_settings('FILTERS').get(file_ext, None) or ()
+        if file_ext in self._cdn_settings('COMPRESSED_TYPES'):
+            encodings = (tuple(self._cdn_settings('ENCODINGS')), app_settings.CDN_GZIP_ZOPFLI)
+        else:
+            encodings = ()
+
+        salt = '%r|%r|' % (tuple(filters), encodings)
+
+        if file_ext in images.SOURCE_TYPES and self._cdn_image_formats:
+            salt += '%r|%r|%r|' % (tuple(self._cdn_image_formats), 
+                app_settings.CDN_WEBP_QUALITY, app_settings.CDN_AVIF_QUALITY)
+
+        if file_ext in images.SOURCE_TYPES and self._cdn_settings('IMAGE_WIDTHS'):
+            salt += '%r|%r|' % (tuple(self._cdn_settings('IMAGE_WIDTHS')), 
+                app_settings.CDN_JPEG_QUALITY)
+
+        return Util.hash_file(content, salt=salt)
+
+    def _cdn_store(self, name, content):
+        """
+        Saves a file with _cdn_save() and records its variants.
+
+        :returns: str -- the saved name.
+        """
+
+        if self._cdn_report is not None:
+            with self._cdn_report.file(name, input_bytes=content.size):
+                return self._cdn_store_file(name, content)
+
+        return self._cdn_store_file(name, content)
+
+    def _cdn_store_file(self, name, content):
+        if self._cdn_content_addressed:
+            return self._cdn_store_blob(name, content)
+
+        variants = self._cdn_save(name, content)
+        self._cdn_record(name, variants)
+
+        return variants['']
+
+    def _cdn_store_blob(self, name, content):
+        """
+        Saves a file as the blob named after the hash of its content,
+        unless that blob was saved before, and maps `name` to it.
+
+        :returns: str -- the cleaned `name`.
+        """
+
+        hash = self._cdn_hash(name, content)
+        file_ext = os.path.splitext(name)[1].lower()
+        blob_name = '%s%s/%s%s' % (BLOBS_PATH, hash[:2], hash, file_ext)
+
+        variants = CDNAsset.objects.get_variants(type=self._cdn_type, name=blob_name)
+        if not variants:
+            # Recorded once the blob and all its variants are saved, so
+            # that a failed upload is retried by the next save.
+            variants = self._cdn_save(blob_name, content)
+            CDNAsset.objects.record(type=self._cdn_type, name=blob_name, variants=variants)
+
+        name = self._clean_name(name)
+        CDNAsset.objects.record(type=self._cdn_type, name=name, variants=variants)
+
+        return name
+
+    def _cdn_resolve(self, name):
+        """
+        :returns: str -- name of the blob that `name` is mapped to in 
+            content-addressed mode, otherwise `name`.
+        """
+
+        if self._cdn_content_addressed:
+            blob_name = CDNAsset.objects.get_variants(type=self._cdn_type, 
+                name=self._clean_name(name)).get('')
+            if blob_name:
+                return blob_name
+
+        return name
+
+    def _open(self, name, mode='rb'):
+        return super(CDNStorageMixin, self)._open(self._cdn_resolve(name), mode)
+
+    def exists(self, name):
+        return super(CDNStorageMixin, self).exists(self._cdn_resolve(name))
+
+    def size(self, name):
+        return super(CDNStorageMixin, self).size(self._cdn_resolve(name))
+
+    def url(self, name):
+        return super(CDNStorageMixin, self).url(self._cdn_resolve(name))
+
+    def delete(self, name):
+        if self._cdn_resolve(name) != name:
+            # Only the mapping is deleted: other names may share the blob.
+            CDNAsset.objects.filter(type=self._cdn_type, name=self._clean_name(name)).delete()
+            return
+
+        # the image derivatives and width variants, e.g. 1.jpg.webp
+        variants = CDNAsset.objects.get_variants(type=self._cdn_type, name=self._clean_name(name))
+        for saved_name in set(variants.values()) - set([name, self._clean_name(name)]):
+            self._cdn_delete(saved_name)
+
+        if variants:
+            CDNAsset.objects.filter(type=self._cdn_type, name=self._clean_name(name)).delete()
+
+        self._cdn_delete(name)
+
+    def _cdn_delete(self, name):
+        """
+        Deletes the file stored as `name`, without resolving the name.
+        """
+
+        super(CDNStorageMixin, self).delete(name)
+
+    def _cdn_record(self, name, variants):
+        """
+        Records the image derivatives of a file for the `cdn` tag.
+        """
+
+        if any(format in variants for format in images.FORMATS) or images.get_widths(variants):
+            CDNAsset.objects.record(type=self._cdn_type, 
+                name=self._clean_name(name), variants=variants)
+
+    def _cdn_save_spooled(self, name, path):
+        try:
+            with open(path, 'rb') as f:
+                self._cdn_store(name, File(f))
+        finally:
+            os.unlink(path)
+
+    def _cdn_saved_name(self, name):
+        """
+        Gets the name that _cdn_store() returns for `name` without saving.
+        """
+
+        if self._cdn_content_addressed:
+            return self._clean_name(name)
+
+        file_name, file_ext = os.path.splitext(name)
+        file_ext = file_ext.lstrip('.')
+
+        if self._cdn_settings('FILTERS').get(file_ext.lower(), None):
+            file_name = Util.format_min_file_name(file_name, file_ext)
+            name = '%s.%s' % (file_name, file_ext)
+
+        return self._clean_name(name)
+
+    def _cdn_needs_processing(self, name):
+        """
+        :returns: bool -- whether _cdn_save() does more than upload `name`.
+        """
+
+        file_ext = os.path.splitext(name)[1].lstrip('.').lower()
+
+        if self._cdn_settings('FILTERS').get(file_ext, None):
+            return True
+        if file_ext in self._cdn_settings('COMPRESSED_TYPES') and self._cdn_settings('ENCODINGS'):
+            return True
+        if file_ext in images.SOURCE_TYPES and \
+           (self._cdn_image_formats or self._cdn_settings('IMAGE_WIDTHS')):
+            return True
+
+        return False
+
+    def _cdn_defer(self, name, content):
+        """
+        Uploads `content` as is under the name it is processed into, 
+        and queues the processing.
+
+        :returns: str -- the saved name.
+        """
+
+        saved_name = self._cdn_upload(name=self._cdn_saved_name(name), content=content)
+        self._cdn_queue.put(self, name)
+
+        return saved_name
+
+    def _cdn_process(self, name):
+        """
+        Processes a file saved by _cdn_defer(). Called by the queue.
+        """
+
+        saved_name = self._cdn_saved_name(name)
+
+        # not self._open(), which would resolve the name to a blob
+        with super(CDNStorageMixin, self)._open(saved_name, 'rb') as f:
+            path = Util.spool_file(f, suffix=os.path.splitext(name)[1])
+
+        self._cdn_save_spooled(name, path)
+
+        if self._cdn_content_addressed:
+            # the name is now mapped to a blob
+            self._cdn_delete(saved_name)
+
+    def _save(self, name, content):
+        if self._cdn_queue is not None and self._cdn_needs_processing(name):
+            return self._cdn_defer(name, content)
+
+        if self._cdn_upload_pool is None:
+            return self._cdn_store(name, content)
+
+        # The caller may close `content` as soon as we return,
+        # so the worker gets its own copy on disk.
+        path = Util.spool_file(content, suffix=os.path.splitext(name)[1])
+        self._cdn_upload_pool.submit(name, self._cdn_save_spooled, name, path)
+
+        return self._cdn_saved_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        """
+        Called by collectstatic after all files have been passed to save().
+        Saves the bundles in settings.CDN_STATIC_BUNDLES like any other
+        file, so that they are filtered and precompressed. Then waits for
+        parallel uploads to finish and reports the failed files.
+        """
+
+        if self._cdn_type == 'STATIC' and not dry_run:
+            for name in sorted(app_settings.CDN_STATIC_BUNDLES):
+                self._save(name, ContentFile(self._cdn_read_bundle(name, paths)))
+
+        if dry_run:
+            return []
+
+        if self._cdn_upload_pool is not None:
+            failures = self._cdn_upload_pool.join()
+        else:
+            failures = []
+
+        if self._cdn_report is not None:
+            self._cdn_print_report()
+
+        for name, error in failures:
+            print('ERROR: Cannot upload file (Reason: %s): %s' % (error, name))
+
+        if failures:
+            raise CDNUploadError(failures=failures)
+
+        return []
+
+    def _cdn_print_report(self):
+        """
+        Prints the deploy report and saves it to CDN_DEPLOY_REPORT_DIR.
+        A new report is started for the next files.
+        """
+
+        report = self._cdn_report
+        self._cdn_report = DeployReport()
+
+        print(format_summary(report.summary(top=app_settings.CDN_DEPLOY_REPORT_TOP)))
+
+        path = report.save(self._cdn_version_str)
+        if path:
+            print('Deploy report saved to %s' % path)
+
+    def _cdn_read_bundle(self, name, paths):
+        """
+        Concatenates the source files of a bundle.
+
+        :type   paths: dict
+        :param  paths: Path to (storage, path) of the files found by
+            collectstatic.
+
+        :returns: bytes
+        """
+
+        sources = app_settings.CDN_STATIC_BUNDLES[name]
+        file_ext = os.path.splitext(name)[1].lstrip('.').lower()
+
+        # A script may end without a semicolon or with a // comment.
+        separator = b'\n;\n' if file_ext == 'js' else b'\n'
+        parts = []
+
+        for source in sources:
+            if source not in paths:
+                raise CDNError('File of bundle %s not found: %s' % (name, source))
+
+            storage, path = paths[source]
+            with storage.open(path) as f:
+                data = f.read()
+
+            # a BOM in the middle of a file is not valid CSS or JS
+            if data.startswith(codecs.BOM_UTF8):
+                data = data[len(codecs.BOM_UTF8):]
+
+            parts.append(data)
+
+        return separator.join(parts)
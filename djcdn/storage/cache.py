@@ -0,0 +1,148 @@
+from __future__ import unicode_literals
+
+import os
+import os.path
+import tempfile
+import threading
+
+class DiskCache(object):
+    """
+    A cache of files on local disk, evicting the least recently used
+    files once the total size exceeds a limit.
+
+    Entries are written to a temp file and renamed into place, so
+    several processes can share the same folder.
+    """
+
+    def __init__(self, path, max_size):
+        """
+        :param  path: Folder to keep the cached files in. Created if missing.
+
+        :type   max_size: int
+        :param  max_size: Total size in bytes.
+        """
+
+        self._path      = path
+        self._max_size  = max_size
+        self._size      = None
+        self._lock      = threading.Lock()
+
+    def _get_path(self, key):
+        return os.path.join(self._path, key[:2], key)
+
+    def get_path(self, key):
+        """
+        :param  key: A hex string, such as a SHA1 digest.
+
+        :returns: str -- path of the cached file, or None if not cached.
+        """
+
+        path = self._get_path(key)
+
+        try:
+            # mark as recently used
+            os.utime(path, None)
+        except OSError:
+            return None
+
+        return path
+
+    def get(self, key):
+        """
+        :returns: bytes, or None if not cached.
+        """
+
+        path = self.get_path(key)
+        if path is None:
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except IOError:
+            # evicted by someone else in the meantime
+            return None
+
+    def set(self, key, data):
+        """
+        :type   data: bytes
+        """
+
+        path = self._get_path(key)
+        folder = os.path.dirname(path)
+
+        try:
+            os.makedirs(folder)
+        except OSError:
+            pass
+
+        (out_handle, out_path) = tempfile.mkstemp(dir=folder, prefix='.tmp')
+
+        with os.fdopen(out_handle, 'wb') as out:
+            out.write(data)
+
+        # the file being replaced, if any, no longer counts
+        try:
+            old_size = os.stat(path).st_size
+        except OSError:
+            old_size = 0
+
+        os.rename(out_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._get_size()
+            else:
+                self._size += len(data) - old_size
+
+            if self._size > self._max_size:
+                self._evict()
+
+    def _list(self):
+        """
+        :returns: list of (mtime, size, path) of all cached files.
+        """
+
+        entries = []
+
+        for folder, dirs, files in os.walk(self._path):
+            # hidden folders are not entries, e.g. lock files
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+
+            for file_name in files:
+                if file_name.startswith('.tmp'):
+                    continue
+
+                path = os.path.join(folder, file_name)
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def _get_size(self):
+        return sum(size for mtime, size, path in self._list())
+
+    def _evict(self):
+        # Evict down to 90% so that we don't have to walk the folder
+        # on every set once the cache is full.
+        target = self._max_size * 9 // 10
+        entries = sorted(self._list())
+        size = sum(size for mtime, size, path in entries)
+
+        for mtime, file_size, path in entries:
+            if size <= target:
+                break
+
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+            size -= file_size
+
+        self._size = size
@@ -0,0 +1,71 @@
+"""
+S3 connections shared by all djcdn storages of the process.
+
+boto keeps the HTTP connections of an S3Connection open for reuse, so
+sharing one S3Connection per set of credentials saves a TCP and TLS
+handshake on most requests, including the ones of the upload threads.
+"""
+
+from __future__ import unicode_literals
+
+import threading
+
+from boto.connection import ConnectionPool
+
+from djcdn.conf import settings as app_settings
+
+class BoundedConnectionPool(ConnectionPool):
+    """
+    A boto ConnectionPool that keeps at most `max_size` connections per
+    host. Connections returned to a full pool are not reused, and close
+    once their response has been read.
+
+    Thread-safe, like ConnectionPool.
+    """
+
+    def __init__(self, max_size):
+        super(BoundedConnectionPool, self).__init__()
+        self.max_size = max_size
+
+    def put_http_connection(self, host, is_secure, conn):
+        with self.mutex:
+            pool = self.host_to_pool.get((host, is_secure), None)
+            if pool is not None and pool.size() >= self.max_size:
+                return
+
+        super(BoundedConnectionPool, self).put_http_connection(host, is_secure, conn)
+
+# (connection class, arguments) to connection
+_connections = {}
+_lock = threading.Lock()
+
+def get_connection(connection_class, *args, **kwargs):
+    """
+    Gets the shared connection for the arguments, creating it on the
+    first call. A `calling_format` argument is compared by class.
+
+    :param  connection_class: e.g. S3Connection
+
+    :returns: an instance of `connection_class`.
+    """
+
+    key = (connection_class, args, tuple(sorted(
+        (name, type(val) if name == 'calling_format' else val)
+        for name, val in kwargs.items())))
+
+    with _lock:
+        if key not in _connections:
+            connection = connection_class(*args, **kwargs)
+            connection._pool = BoundedConnectionPool(max_size=app_settings.CDN_S3_POOL_SIZE)
+            _connections[key] = connection
+
+        return _connections[key]
+
+def close_all():
+    """
+    Forgets the shared connections. Their idle HTTP connections close
+    when they are garbage collected.
+    """
+
+    with _lock:
+        _connections.clear()
@@ -0,0 +1,119 @@
+"""
+Queues for processing media files after the request that uploads them,
+see CDN_DEFAULT_QUEUE. The storage saves the original right away and
+the queue later runs the filters, precompression and image variants,
+whose output replaces the original.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+from djcdn.conf import settings as app_settings
+from djcdn.models import CDNTask
+from djcdn.storage.upload import UploadPool, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+def _process(storage, name):
+    try:
+        call_with_retry(storage._cdn_process,
+            retries=app_settings.CDN_UPLOAD_RETRIES,
+            delay=app_settings.CDN_UPLOAD_RETRY_DELAY,
+            name=name)
+    except Exception:
+        logger.exception('Cannot process file: %s', name)
+
+class LocalQueue(object):
+    """
+    Processes files in CDN_QUEUE_WORKERS threads of the web process.
+    Failed files are retried up to CDN_UPLOAD_RETRIES times, then logged.
+    Files still queued when the process exits are left unprocessed,
+    i.e. served as uploaded.
+    """
+
+    def __init__(self, workers):
+        self._pool = UploadPool(workers=workers)
+
+    def put(self, storage, name):
+        self._pool.submit(name, _process, storage, name)
+
+    def join(self):
+        """
+        Waits until all queued files are processed.
+        """
+
+        self._pool.join()
+
+class DatabaseQueue(object):
+    """
+    Records files as CDNTask rows, processed by `python manage.py cdn_process`
+    on any server. Failed files are retried up to CDN_UPLOAD_RETRIES times.
+    """
+
+    def put(self, storage, name):
+        CDNTask.objects.create(type=storage._cdn_type, name=name)
+
+    def join(self):
+        pass
+
+def process_tasks(storage):
+    """
+    Processes the CDNTask rows of a storage's type.
+
+    :returns: (int, int) -- number of files processed and failed.
+    """
+
+    done = 0
+    failed = 0
+
+    tasks = CDNTask.objects.get_pending(type=storage._cdn_type,
+        timeout=app_settings.CDN_QUEUE_TIMEOUT,
+        max_attempts=app_settings.CDN_UPLOAD_RETRIES)
+
+    for task in tasks:
+        if not CDNTask.objects.claim(task):
+            continue
+
+        try:
+            storage._cdn_process(task.name)
+        except Exception as e:
+            print('ERROR: Cannot process file (Reason: %s): %s' % (e, task.name))
+            CDNTask.objects.release(task)
+            failed += 1
+        else:
+            task.delete()
+            done += 1
+
+    return (done, failed)
+
+_QUEUE_CLASSES = {
+    'local' : lambda: LocalQueue(workers=app_settings.CDN_QUEUE_WORKERS),
+    'db'    : DatabaseQueue,
+}
+
+# shared by all storages, so that the threads are only started once
+_queues = {}
+_queues_lock = threading.Lock()
+
+def get_queue(kind):
+    """
+    :param  kind: 'local', 'db', or '' to process files when they are saved.
+
+    :returns: LocalQueue, DatabaseQueue or None.
+    """
+
+    if not kind:
+        return None
+
+    if kind not in _QUEUE_CLASSES:
+        raise ImproperlyConfigured('Unknown queue: %s' % kind)
+
+    with _queues_lock:
+        if kind not in _queues:
+            _queues[kind] = _QUEUE_CLASSES[kind]()
+
+        return _queues[kind]
@@ -0,0 +1,144 @@
+"""
+Compressors for the precompressed variants of files.
+
+brotli, zstandard and zopfli are optional dependencies.
+"""
+
+from __future__ import unicode_literals
+
+import gzip
+import os
+import tempfile
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from django.core.files import File
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import zopfli.gzip as zopfli_gzip
+except ImportError:
+    zopfli_gzip = None
+
+# Content-Encoding to the marker added to file names, e.g. main.min.br.css
+MARKERS = {
+    'gzip'  : 'gz',
+    'br'    : 'br',
+    'zstd'  : 'zst',
+}
+
+def _gzip(data, zopfli):
+    if zopfli:
+        return zopfli_gzip.compress(data)
+
+    buf = StringIO()
+
+    # mtime=0 so that the output only depends on the input
+    f = gzip.GzipFile(mode='wb', compresslevel=9, fileobj=buf, mtime=0)
+    try:
+        f.write(data)
+    finally:
+        f.close()
+
+    return buf.getvalue()
+
+def get_missing(encodings, zopfli=False):
+    """
+    :returns: list of the encodings (or 'zopfli') that cannot be
+        produced because a module is not installed or the encoding
+        is not supported.
+    """
+
+    missing = []
+
+    for encoding in encodings:
+        if encoding not in MARKERS or \
+           (encoding == 'br' and brotli is None) or \
+           (encoding == 'zstd' and zstandard is None):
+            missing.append(encoding)
+
+    if zopfli and 'gzip' in encodings and zopfli_gzip is None:
+        missing.append('zopfli')
+
+    return missing
+
+def compress(encoding, data, zopfli=False):
+    """
+    Compresses at the maximum level. This is slow, but is only done
+    once when the file is uploaded.
+
+    :param  encoding: One of MARKERS.
+    :type   data: bytes
+    :param  zopfli: Whether to use zopfli for gzip.
+
+    :returns: bytes
+    """
+
+    if encoding == 'gzip':
+        return _gzip(data, zopfli=zopfli)
+    elif encoding == 'br':
+        return brotli.compress(data, quality=11)
+    elif encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=22).compress(data)
+
+    raise ValueError('Unsupported encoding: %s' % encoding)
+
+def _compress_chunks(encoding, input_file, out):
+    if encoding == 'gzip':
+        # filename='' so that the temp file name is not in the header
+        f = gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=out, mtime=0)
+        try:
+            for chunk in input_file.chunks():
+                f.write(chunk)
+        finally:
+            f.close()
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=11)
+        for chunk in input_file.chunks():
+            out.write(compressor.process(chunk))
+        out.write(compressor.finish())
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=22).compressobj(size=input_file.size)
+        for chunk in input_file.chunks():
+            out.write(compressor.compress(chunk))
+        out.write(compressor.flush())
+    else:
+        raise ValueError('Unsupported encoding: %s' % encoding)
+
+def compress_file(encoding, input_file, zopfli=False):
+    """
+    Same as compress(), but reads `input_file` in chunks and writes 
+    to a temp file, so that large files are not held in memory.
+    zopfli needs the whole input at once.
+
+    :type   input_file: File
+
+    :returns: File -- a temp file. The caller must delete it.
+    """
+
+    input_file.seek(0)
+    (out_handle, out_path) = tempfile.mkstemp(suffix='.' + MARKERS.get(encoding, ''))
+
+    try:
+        with os.fdopen(out_handle, 'wb') as out:
+            if encoding == 'gzip' and zopfli:
+                out.write(zopfli_gzip.compress(input_file.read()))
+            else:
+                _compress_chunks(encoding, input_file, out)
+    except:
+        os.unlink(out_path)
+        raise
+
+    return File(open(out_path, 'rb'))
@@ -0,0 +1,106 @@
+"""
+Storages on the local filesystem, for sites that serve their files
+with nginx instead of S3. Files go through the same pipeline as on S3.
+
+The precompressed variants are written next to each file, e.g.
+main.min.css.gz and main.min.css.br, which is where nginx's
+gzip_static and brotli_static look for them.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+from djcdn.conf import settings as app_settings
+from djcdn.storage import encodings as encodings_mod
+from djcdn.storage.base import CDNStorageMixin
+
+class AbstractStorage(CDNStorageMixin, FileSystemStorage):
+    """
+    Base storage for the local filesystem.
+    """
+
+    def __init__(self, cdn_type, *args, **kwargs):
+        self._cdn_init(cdn_type, kwargs)
+        super(AbstractStorage, self).__init__(*args, **kwargs)
+
+    def _clean_name(self, name):
+        return name.replace('\\', '/')
+
+    def _cdn_format_encoded_name(self, file_name, file_ext, encoding):
+        """
+        :returns: str -- name of a precompressed variant, e.g. main.min.css.gz
+        """
+
+        return '%s.%s.%s' % (file_name, file_ext, encodings_mod.MARKERS[encoding])
+
+    def _cdn_put(self, name, content, headers=None):
+        """
+        Writes to a temp file in the same folder and renames it into
+        place, so that nginx never serves a partly written file.
+        The headers are ignored, nginx sets them itself.
+        """
+
+        cleaned_name = self._clean_name(name)
+        full_path = self.path(cleaned_name)
+        folder = os.path.dirname(full_path)
+
+        try:
+            os.makedirs(folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        (out_handle, out_path) = tempfile.mkstemp(dir=folder, prefix='.tmp')
+
+        try:
+            with os.fdopen(out_handle, 'wb') as out:
+                content.seek(0)
+                for chunk in content.chunks():
+                    out.write(chunk)
+
+            # mkstemp() only lets the owner read the file
+            os.chmod(out_path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+            os.rename(out_path, full_path)
+        except:
+            os.unlink(out_path)
+            raise
+
+        return cleaned_name
+
+    def _cdn_delete(self, name):
+        """
+        Deletes a stored file together with its precompressed variants.
+        """
+
+        super(AbstractStorage, self)._cdn_delete(name)
+
+        for marker in encodings_mod.MARKERS.values():
+            super(AbstractStorage, self)._cdn_delete('%s.%s' % (name, marker))
+
+class StaticStorage(AbstractStorage):
+    """
+    Storage for static files.
+    The folder is settings.STATIC_ROOT
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('location', settings.STATIC_ROOT)
+        kwargs.setdefault('base_url', settings.STATIC_URL)
+        kwargs.setdefault('cdn_upload_workers', app_settings.CDN_STATIC_UPLOAD_WORKERS)
+        kwargs.setdefault('cdn_filter_processes', app_settings.CDN_STATIC_FILTER_PROCESSES)
+        super(StaticStorage, self).__init__(*args, cdn_type='STATIC', **kwargs)
+
+class DefaultStorage(AbstractStorage):
+    """
+    Storage for uploaded media files.
+    The folder is settings.MEDIA_ROOT
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DefaultStorage, self).__init__(*args, cdn_type='DEFAULT', **kwargs)
@@ -0,0 +1,174 @@
+"""
+Encoders for the WebP and AVIF derivatives of images, and resizing
+for the width variants.
+
+The encoders are command line tools, like the image filters:
+`cwebp` for WebP and `avifenc` for AVIF. Resizing requires Pillow, 
+which is an optional dependency.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import re
+import subprocess
+import tempfile
+from distutils.spawn import find_executable
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from djcdn.conf import settings as app_settings
+from djcdn.storage import Util
+
+# Image format to (encoder, Content-Type)
+FORMATS = {
+    'webp'  : ('cwebp', 'image/webp'),
+    'avif'  : ('avifenc', 'image/avif'),
+}
+
+# Source types that get derivatives (lowercase)
+SOURCE_TYPES = ('jpg', 'jpeg', 'png')
+
+# Key of a width variant in CDNFile.variants, e.g. 'w640'
+_WIDTH_KEY = re.compile(r'^w(\d+)$')
+
+_PIL_FORMATS = {
+    'jpg'   : 'JPEG',
+    'jpeg'  : 'JPEG',
+    'png'   : 'PNG',
+}
+
+def get_available(formats):
+    """
+    :returns: list -- the formats in `formats` whose encoder is installed,
+        in the same order.
+    """
+
+    return [f for f in formats if f in FORMATS and find_executable(FORMATS[f][0])]
+
+def format_derivative_name(name, format):
+    """
+    :returns: str -- name of the derivative, e.g. photos/1.jpg.webp
+    """
+
+    return '%s.%s' % (name, format)
+
+def _get_args(format, file_ext, in_path, out_path):
+    if format == 'webp':
+        # PNGs are mostly graphics, which lossy WebP blurs
+        if file_ext == 'png':
+            quality = ['-lossless']
+        else:
+            quality = ['-q', str(app_settings.CDN_WEBP_QUALITY)]
+
+        return ['cwebp', '-quiet', '-metadata', 'none'] + quality + [in_path, '-o', out_path]
+
+    return ['avifenc', '-q', str(app_settings.CDN_AVIF_QUALITY), in_path, out_path]
+
+def encode(format, input_file, file_ext):
+    """
+    Encodes an image to `format`.
+
+    :type   input_file: File
+    :param  file_ext: Lowercase extension of the source, e.g. 'jpg'.
+
+    :returns: bytes, or None if the encoder failed.
+    """
+
+    in_path = Util.spool_file(input_file, suffix='.' + file_ext)
+    (out_handle, out_path) = tempfile.mkstemp(suffix='.' + format)
+    os.close(out_handle)
+
+    try:
+        with open(os.devnull, 'wb') as devnull:
+            code = subprocess.call(_get_args(format, file_ext, in_path, out_path),
+                stdout=devnull, stderr=devnull)
+
+        if code != 0:
+            print('ERROR: Cannot encode image to %s (exit code: %s)' % (format, code))
+            return None
+
+        with open(out_path, 'rb') as f:
+            return f.read() or None
+    finally:
+        os.unlink(in_path)
+        os.unlink(out_path)
+        input_file.seek(0)
+
+def format_width_key(width):
+    return 'w%d' % width
+
+def format_width_name(file_name, file_ext, width):
+    """
+    :returns: str -- name of a width variant, e.g. photos/1.w640.jpg
+    """
+
+    return '%s.%s.%s' % (file_name, format_width_key(width), file_ext)
+
+def get_widths(variants):
+    """
+    :type   variants: dict
+    :param  variants: See CDNFile.variants.
+
+    :returns: list -- (width, name) of the width variants, narrowest first.
+    """
+
+    widths = []
+
+    for key, name in variants.items():
+        match = _WIDTH_KEY.match(key)
+        if match:
+            widths.append((int(match.group(1)), name))
+
+    return sorted(widths)
+
+def resize(input_file, file_ext, widths):
+    """
+    Scales an image down to each of `widths`, keeping the aspect ratio.
+    Widths not narrower than the image are skipped. 
+    The output only depends on the input and the settings.
+
+    :param  file_ext: Lowercase extension of the source, e.g. 'jpg'.
+
+    :returns: tuple -- (width of the image, dict of width to bytes),
+        or (None, {}) if the image cannot be read.
+    """
+
+    input_file.seek(0)
+
+    try:
+        image = Image.open(input_file)
+        image.load()
+    except Exception as e:
+        print('ERROR: Cannot read image (Reason: %s)' % e)
+        return None, {}
+    finally:
+        input_file.seek(0)
+
+    (orig_width, orig_height) = image.size
+    if file_ext in ('jpg', 'jpeg') and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+
+    resized = {}
+
+    for width in sorted(set(widths)):
+        if width >= orig_width:
+            continue
+
+        height = max(1, int(round(orig_height * width / float(orig_width))))
+        output = StringIO()
+        image.resize((width, height), Image.ANTIALIAS).save(output, 
+            format=_PIL_FORMATS[file_ext], quality=app_settings.CDN_JPEG_QUALITY,
+            optimize=True)
+
+        resized[width] = output.getvalue()
+
+    return orig_width, resized
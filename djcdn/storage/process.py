@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+
+from django.core.files import File
+
+from djcdn.exceptions import CDNFilterError
+from djcdn.storage import Util
+
+def _run_filters(conn, filters, in_path, out_path, version_str):
+    """
+    Entry point of the child process.
+    Sends (error, is_unchanged, timings) back through `conn`.
+    """
+
+    # Own process group, so that tools started by the filters
+    # are killed together with us on timeout.
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+
+    timings = {}
+
+    try:
+        with open(in_path, 'rb') as f:
+            input_file = File(f)
+            output_file = Util._apply_filters(filters, input_file, version_str, timings=timings)
+            is_unchanged = output_file is input_file
+
+            if not is_unchanged:
+                with open(out_path, 'wb') as out:
+                    for chunk in output_file.chunks():
+                        out.write(chunk)
+
+                output_file.close()
+                Util.delete_file(output_file)
+
+        conn.send((None, is_unchanged, timings))
+    except Exception as e:
+        conn.send(('%s: %s' % (e.__class__.__name__, e), False, timings))
+
+    conn.close()
+
+class FilterPool(object):
+    """
+    Runs filter chains in child processes, at most `processes` at a time.
+
+    CPU-bound filters such as cssmin and slimit are pure Python, so
+    this lets them use all cores instead of being serialized by the GIL.
+    A filter or tool that crashes or hangs only takes down its own
+    process, and is killed after `timeout` seconds.
+
+    Filters are given the input and return the output through temp files.
+    """
+
+    def __init__(self, processes, timeout):
+        """
+        :type   processes: int
+        :param  processes: Max number of child processes. Must be positive.
+
+        :type   timeout: int
+        :param  timeout: Seconds to wait for a filter chain to finish.
+        """
+
+        self._slots     = threading.BoundedSemaphore(processes)
+        self._timeout   = timeout
+
+    def apply(self, filters, input_file, version_str=None, timings=None):
+        """
+        Same as Util.apply_filters() but in a child process.
+        Raises CDNFilterError if the child fails.
+
+        :returns: File -- `input_file` rewound to the start if no filter
+            changed it, otherwise a temp file.
+        """
+
+        in_path = Util.spool_file(input_file)
+        (out_handle, out_path) = tempfile.mkstemp()
+        os.close(out_handle)
+
+        try:
+            with self._slots:
+                is_unchanged = self._run(filters, in_path, out_path, version_str, timings)
+        except Exception:
+            os.unlink(out_path)
+            raise
+        finally:
+            os.unlink(in_path)
+
+        if is_unchanged:
+            os.unlink(out_path)
+            input_file.seek(0)
+            return input_file
+
+        return File(open(out_path, 'rb'))
+
+    def _run(self, filters, in_path, out_path, version_str, timings):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_filters,
+            args=(writer, filters, in_path, out_path, version_str))
+        process.start()
+        writer.close()
+
+        try:
+            if not reader.poll(self._timeout):
+                self._kill(process)
+                raise CDNFilterError('Filters %s timed out after %s seconds'
+                    % (', '.join(filters), self._timeout))
+
+            try:
+                error, is_unchanged, child_timings = reader.recv()
+            except EOFError:
+                error, is_unchanged, child_timings = 'Process died', False, {}
+        finally:
+            reader.close()
+
+        process.join()
+
+        if timings is not None:
+            for filter, seconds in child_timings.items():
+                timings[filter] = timings.get(filter, 0) + seconds
+
+        if error:
+            raise CDNFilterError('Filters %s failed (Reason: %s, exit code: %s)'
+                % (', '.join(filters), error, process.exitcode))
+
+        return is_unchanged
+
+    def _kill(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            process.terminate()
+
+        process.join()
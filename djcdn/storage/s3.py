@@ -1,53 +1,83 @@
 from __future__ import unicode_literals
 
+import hashlib
 import os
+import re
 import sys
 import mimetypes
+import threading
+import time
+import urllib
+from datetime import timedelta
 
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from boto.utils import parse_ts
 from storages.backends.s3boto import S3BotoStorage
 from django.conf import settings
-from django.core.files import File
+from django.utils import timezone
 
-from djcdn.models import CDNVersion
+from djbase.utils.cache import LRUCache
+from djcdn.models import CDNFile, CDNObject, CDNVersion
+from djcdn import filters as filters_mod
 from djcdn.conf import settings as app_settings
+from djcdn.exceptions import CDNError
 from djcdn.storage import Util
+from djcdn.storage import connections
+from djcdn.storage import encodings as encodings_mod
+from djcdn.storage.base import CDNStorageMixin
+from djcdn.storage.upload import UploadPool, call_with_retry
+
+# S3 rejects smaller parts, except the last one
+_MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Most keys S3 deletes in one request
+_DELETE_BATCH_SIZE = 1000
+
+# Headers that S3 keeps with an object, set again by a copy, see 
+# boto.utils.merge_meta()
+_OBJECT_HEADERS = ('cache-control', 'content-type', 'content-encoding', 
+    'content-disposition', 'expires')
+
+# See CDNVersionManager.create_new()
+_VERSION_RE = re.compile(r'^\d{8}-[0-9A-F]{8}$')
 
-class AbstractStorage(S3BotoStorage):
+class AbstractStorage(CDNStorageMixin, S3BotoStorage):
     """
     Base storage for S3.
     """
 
     def __init__(self, cdn_type, *args, **kwargs):
         self._parent = super(AbstractStorage, self)
-        self._cdn_type = cdn_type 
-        self._cdn_version_str = kwargs.pop('cdn_version_str', None)
+        self._cdn_init(cdn_type, kwargs)
 
+        # expiry headers are added per upload, see _cdn_get_headers()
         aws_headers = getattr(settings, 'AWS_HEADERS', {})
         headers = aws_headers.copy()
-        
-        age = self._cdn_settings('EXPIRY_AGE')
-        if age > 0: 
-            expiry_headers = Util.get_expiry_headers(age=age)
-            headers.update(expiry_headers)
 
         for key, val in headers.items():
             # need to encode into bytes, otherwise boto will url encode
             # the header value (see boto/connection.py/HTTPRequest/authorize)
             headers[key] = val.encode('utf8')
 
-        gzip_types = list(getattr(settings, 'GZIP_CONTENT_TYPES', ()))
-        com_types = self._cdn_settings('COMPRESSED_TYPES')
-        for type in com_types:
-            mime = mimetypes.types_map.get('.'+type, None)
-            if mime:
-                gzip_types += (mime,)
-
-        # Fix the issue when the mime type is not found
-        if 'js' in com_types:
-            gzip_types += ('text/javascript', 'application/javascript', 'application/x-javascript')
-            
-        self._cdn_gzip_storage =  S3BotoStorage(*args, headers=headers, gzip=True, gzip_content_types=gzip_types, **kwargs)
         self._parent.__init__(*args, headers=headers, gzip=False, **kwargs)
+        self._cdn_indexed = self._cdn_settings('METADATA_INDEX')
+
+        # (base, '?', query) of the URLs of public objects
+        self._cdn_url_base = None
+        # (name, expires) to URL, expires is None for unsigned URLs
+        self._cdn_urls = LRUCache(max_size=app_settings.CDN_S3_URL_CACHE_SIZE)
+
+    @property
+    def connection(self):
+        # shared with the other storages, see djcdn.storage.connections
+        if self._connection is None:
+            self._connection = connections.get_connection(self.connection_class,
+                self.access_key, self.secret_key, calling_format=self.calling_format)
+        return self._connection
 
     def url(self, name):
         """
@@ -57,51 +87,323 @@ class AbstractStorage(S3BotoStorage):
         This is taken from django-s3-folder-storage. Credits go to the author.
         """
 
-        url = self._parent.url(name)
-        if name.endswith('/') and not url.endswith('/'):
-            url += '/'
+        # Signed URLs expire at the end of a CDN_SIGNED_URL_WINDOW, at least
+        # AWS_QUERYSTRING_EXPIRE seconds from now, so that the URL of a file
+        # stays the same during a window and can be kept.
+        if self.querystring_auth and not self.custom_domain:
+            window = max(app_settings.CDN_SIGNED_URL_WINDOW, 1)
+            expires = (int(time.time()) + self.querystring_expire + window - 1) // window * window
+        else:
+            expires = None
+
+        # The blob of a name changes when the name is saved again, see 
+        # _cdn_store_blob(). Other processes see it within CDN_ASSET_TTL.
+        if self._cdn_content_addressed:
+            window = int(time.time()) // max(app_settings.CDN_ASSET_TTL, 1)
+        else:
+            window = None
+
+        key = (name, expires, window)
+        url = self._cdn_urls.get(key)
+
+        if url is None:
+            key_name = self._normalize_name(self._clean_name(self._cdn_resolve(name)))
+            url = self._cdn_build_url(key_name, expires)
+            if name.endswith('/') and not url.endswith('/'):
+                url += '/'
+            self._cdn_urls.set(key, url)
+
         return url
 
-    def _cdn_settings(self, name):
-        return getattr(app_settings, 'CDN_%s_%s' % (self._cdn_type, name))
+    def _cdn_forget_url(self, name):
+        if self._cdn_content_addressed:
+            self._cdn_urls.delete_if(lambda key: key[0] == name)
 
-    def _cdn_save_gzip(self, file_name, file_ext, content):
-        file_ext_lower = file_ext.lower()
+    def _cdn_store_blob(self, name, content):
+        name = super(AbstractStorage, self)._cdn_store_blob(name, content)
+        self._cdn_forget_url(name)
+        return name
 
-        if file_ext_lower in self._cdn_settings('COMPRESSED_TYPES'):
-            content.seek(0)
+    def delete(self, name):
+        super(AbstractStorage, self).delete(name)
+        self._cdn_forget_url(name)
+
+    def _cdn_build_url(self, key_name, expires):
+        """
+        Same as S3BotoStorage.url(), but public URLs are the key appended
+        to a base URL built once.
 
-            # must preserve file ext!
-            gzip_file_name = Util.format_gz_file_name(file_name)
-            gzip_name = '%s.%s' % (gzip_file_name, file_ext)
-            self._cdn_gzip_storage._save(name=gzip_name, content=content,)
-
-    def _save(self, name, content):
-        file_name, file_ext = os.path.splitext(name)
-        file_ext = file_ext.lstrip('.')
-        file_ext_lower = file_ext.lower()
-        
-        filters_map = self._cdn_settings('FILTERS')
-        filters = filters_map.get(file_ext_lower, None)
-
-        if filters:
-            output_file = Util.apply_filters(filters=filters, input_file=content, version_str=self._cdn_version_str)
-
-            file_name = Util.format_min_file_name(file_name, file_ext)
-            new_name = '%s.%s' % (file_name, file_ext)
-            
-            new_name = self._parent._save(name=new_name, content=output_file,)
-            self._cdn_save_gzip(file_name=file_name, file_ext=file_ext, content=output_file)
-
-            if not(output_file is content):
-                output_file.close()
-                Util.delete_file(output_file)
-
-            return new_name 
+        :param  key_name: Full key name, including the location.
+        :param  expires: Expiry timestamp of a signed URL, or None.
+        """
+
+        if self.custom_domain:
+            return '%s//%s/%s' % (self.url_protocol, self.custom_domain, key_name)
+
+        encoded_name = self._encode_name(key_name)
+
+        if expires is None:
+            if self._cdn_url_base is None:
+                self._cdn_url_base = self.connection.generate_url(0, method='GET', 
+                    bucket=self.bucket_name, key='', query_auth=False, 
+                    force_http=not self.secure_urls).partition('?')
+
+            base, sep, query = self._cdn_url_base
+            return base + urllib.quote(encoded_name) + sep + query
+
+        return self.connection.generate_url(expires, method='GET', 
+            bucket=self.bucket_name, key=encoded_name, query_auth=True, 
+            force_http=not self.secure_urls, expires_in_absolute=True)
+
+    def _cdn_put(self, name, content, headers=None):
+        """
+        Same as S3BotoStorage._save(), but with extra headers for this
+        object, and without checking whether the key exists first.
+        """
+
+        cleaned_name = self._clean_name(name)
+        name = self._normalize_name(cleaned_name)
+        content_type = getattr(content, 'content_type',
+            mimetypes.guess_type(name)[0] or self.key_class.DefaultContentType)
+
+        all_headers = self.headers.copy()
+        for key, val in (headers or {}).items():
+            all_headers[key] = val.encode('utf8')
+
+        # setting the content_type in the key object is not enough.
+        all_headers['Content-Type'] = content_type
+
+        if (getattr(content, 'size', None) or 0) >= app_settings.CDN_MULTIPART_THRESHOLD:
+            etag = self._cdn_put_multipart(self._encode_name(name), content, all_headers)
         else:
-            name = self._parent._save(name=name, content=content,)
-            self._cdn_save_gzip(file_name=file_name, file_ext=file_ext, content=content)
-            return name         
+            key = self.bucket.new_key(self._encode_name(name))
+            key.set_metadata('Content-Type', content_type)
+            self._save_content(key, content, headers=all_headers)
+            etag = key.etag
+
+        if self._cdn_indexed:
+            CDNObject.objects.record(bucket=self.bucket_name, key=name, 
+                size=content.size, etag=etag or '', content_type=content_type, 
+                modified=timezone.now())
+
+        return cleaned_name
+
+    def _cdn_put_multipart(self, key_name, content, headers):
+        """
+        Uploads a large file in parts of CDN_MULTIPART_PART_SIZE, 
+        CDN_MULTIPART_WORKERS parts at a time. Only the parts being 
+        uploaded are held in memory.
+
+        :returns: str -- the ETag of the object.
+        """
+
+        part_size = max(app_settings.CDN_MULTIPART_PART_SIZE, _MIN_PART_SIZE)
+        workers = max(app_settings.CDN_MULTIPART_WORKERS, 1)
+
+        multipart = self.bucket.initiate_multipart_upload(key_name, headers=headers,
+            reduced_redundancy=self.reduced_redundancy, encrypt_key=self.encryption,
+            policy=self.default_acl)
+
+        pool = UploadPool(workers=workers)
+        slots = threading.Semaphore(workers)
+        etags = {}
+        failed = []
+
+        # the parts are uploaded by other threads; _cdn_upload() counted
+        # one request for initiating and completing the upload
+        record = self._cdn_report.current() if self._cdn_report is not None else None
+        self._cdn_report_add('requests', 1, record=record)
+
+        def put_part(part_num, data):
+            self._cdn_report_add('requests', 1, record=record)
+            multipart.upload_part_from_file(StringIO(data), part_num)
+
+        def upload_part(part_num, data):
+            try:
+                call_with_retry(put_part, part_num=part_num, data=data,
+                    retries=app_settings.CDN_UPLOAD_RETRIES,
+                    delay=app_settings.CDN_UPLOAD_RETRY_DELAY)
+                # boto checks that the ETag S3 returns is the MD5 of the part
+                etags[part_num] = '"%s"' % hashlib.md5(data).hexdigest()
+            except Exception:
+                failed.append(part_num)
+                raise
+            finally:
+                slots.release()
+
+        try:
+            content.seek(0)
+            part_num = 0
+
+            while not failed:
+                # wait for a free worker before reading the next part
+                slots.acquire()
+                data = content.read(part_size)
+                if not data:
+                    slots.release()
+                    break
+
+                part_num += 1
+                pool.submit(key_name, upload_part, part_num, data)
+                data = None
+
+            failures = pool.join()
+            if failures:
+                raise failures[0][1]
+        except Exception:
+            # frees the parts uploaded so far
+            multipart.cancel_upload()
+            raise
+        finally:
+            pool.close()
+
+        xml = '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % ''.join(
+            '<Part><PartNumber>%d</PartNumber><ETag>%s</ETag></Part>' % (num, etags[num])
+            for num in sorted(etags))
+
+        return self.bucket.complete_multipart_upload(key_name, multipart.id, xml).etag
+
+    def _cdn_copy(self, src_key_name, name, headers=None):
+        """
+        Copies an object within the bucket without downloading it.
+        Its headers, storage class and encryption are set like for an
+        upload of `name`, so that Expires is relative to now.
+
+        :param  src_key_name: Full key name of the source object.
+        :param  name: Destination name relative to this storage's location.
+        :param  headers: HTTP headers of the file, e.g. Content-Encoding.
+        """
+
+        all_headers = self.headers.copy()
+        for key, val in dict(self._cdn_get_headers(name), **(headers or {})).items():
+            all_headers[key] = val.encode('utf8')
+
+        name = self._normalize_name(self._clean_name(name))
+        all_headers['Content-Type'] = mimetypes.guess_type(name)[0] or self.key_class.DefaultContentType
+
+        metadata = dict((key, val) for key, val in all_headers.items() 
+            if key.lower() in _OBJECT_HEADERS)
+        headers = dict((key, val) for key, val in all_headers.items() 
+            if key.lower() not in _OBJECT_HEADERS)
+        headers[self.connection.provider.acl_header] = self.default_acl
+
+        def copy_key(**kwargs):
+            self._cdn_report_add('requests', 1)
+            self.bucket.copy_key(**kwargs)
+
+        start = time.time()
+
+        try:
+            call_with_retry(copy_key,
+                retries=app_settings.CDN_UPLOAD_RETRIES,
+                delay=app_settings.CDN_UPLOAD_RETRY_DELAY,
+                new_key_name=self._encode_name(name),
+                src_bucket_name=self.bucket_name,
+                src_key_name=self._encode_name(src_key_name),
+                metadata=metadata,
+                storage_class='REDUCED_REDUNDANCY' if self.reduced_redundancy else 'STANDARD',
+                encrypt_key=self.encryption,
+                headers=headers)
+        finally:
+            self._cdn_report_add('upload_seconds', time.time() - start)
+
+        if self._cdn_indexed:
+            obj = CDNObject.objects.get_object(self.bucket_name, src_key_name)
+            if obj is not None:
+                CDNObject.objects.record(bucket=self.bucket_name, key=name, size=obj.size,
+                    etag=obj.etag, content_type=obj.content_type, 
+                    modified=timezone.now(), variants=obj.variants)
+
+    def _cdn_save(self, name, content):
+        variants = super(AbstractStorage, self)._cdn_save(name, content)
+
+        if self._cdn_indexed:
+            key = self._normalize_name(self._clean_name(variants['']))
+            CDNObject.objects.filter(bucket=self.bucket_name, key=key).update(variants=variants)
+
+        return variants
+
+    def _cdn_get_object(self, name):
+        """
+        :returns: CDNObject of `name` in the metadata index, or None.
+        """
+
+        key = self._normalize_name(self._clean_name(self._cdn_resolve(name)))
+        return CDNObject.objects.get_object(self.bucket_name, key)
+
+    def exists(self, name):
+        # objects written before the index or without djcdn have no row
+        if self._cdn_indexed and self._cdn_get_object(name) is not None:
+            return True
+
+        return super(AbstractStorage, self).exists(name)
+
+    def size(self, name):
+        obj = self._cdn_get_object(name) if self._cdn_indexed else None
+        if obj is not None:
+            return obj.size
+
+        return super(AbstractStorage, self).size(name)
+
+    def modified_time(self, name):
+        obj = self._cdn_get_object(name) if self._cdn_indexed else None
+        if obj is None:
+            return super(AbstractStorage, self).modified_time(name)
+
+        # naive, like S3BotoStorage
+        if timezone.is_aware(obj.modified):
+            return timezone.make_naive(obj.modified, timezone.utc)
+        return obj.modified
+
+    def _cdn_delete(self, name):
+        if self._cdn_indexed:
+            CDNObject.objects.forget(self.bucket_name, 
+                self._normalize_name(self._clean_name(name)))
+
+        super(AbstractStorage, self)._cdn_delete(name)
+
+    def cdn_reconcile(self, dry_run=False):
+        """
+        Makes the metadata index match the objects under this storage's
+        location in the bucket, e.g. after objects were changed without
+        djcdn. The variants of the objects that are kept are kept.
+
+        :returns: (list, list, list) -- keys added, updated and removed.
+        """
+
+        prefix = self.location
+        objects = dict((obj.key, obj) for obj in
+            CDNObject.objects.filter(bucket=self.bucket_name, key__startswith=prefix))
+
+        added = []
+        updated = []
+
+        for key in self.bucket.list(prefix=self._encode_name(prefix)):
+            key_name = self._decode_name(key.name)
+            obj = objects.pop(key_name, None)
+
+            if obj is not None and obj.size == key.size and obj.etag == key.etag:
+                continue
+
+            (updated if obj is not None else added).append(key_name)
+            if dry_run:
+                continue
+
+            content_type = obj.content_type if obj is not None else \
+                (mimetypes.guess_type(key_name)[0] or self.key_class.DefaultContentType)
+
+            modified = parse_ts(key.last_modified)
+            if settings.USE_TZ:
+                modified = timezone.make_aware(modified, timezone.utc)
+
+            CDNObject.objects.record(bucket=self.bucket_name, key=key_name, size=key.size,
+                etag=key.etag, content_type=content_type, modified=modified)
+
+        removed = sorted(objects)
+        if not dry_run and removed:
+            CDNObject.objects.filter(pk__in=[obj.pk for obj in objects.values()]).delete()
+
+        return (added, updated, removed)
 
 class StaticStorage(AbstractStorage):
     """
@@ -112,6 +414,8 @@ class StaticStorage(AbstractStorage):
     def __init__(self, *args, **kwargs):
         if not 'location' in kwargs:
             kwargs['location'] = settings.CDN_STATIC_S3_PATH
+        kwargs.setdefault('cdn_upload_workers', app_settings.CDN_STATIC_UPLOAD_WORKERS)
+        kwargs.setdefault('cdn_filter_processes', app_settings.CDN_STATIC_FILTER_PROCESSES)
         super(StaticStorage, self).__init__(*args, cdn_type='STATIC', **kwargs)
 
 class DefaultStorage(AbstractStorage):
@@ -125,16 +429,173 @@ class DefaultStorage(AbstractStorage):
         super(DefaultStorage, self).__init__(*args, cdn_type='DEFAULT', **kwargs)
 
 class VersionedStaticStorage(StaticStorage):
+    """
+    Storage for static files where every collectstatic uploads to a new 
+    CDNVersion folder.
+
+    Files that have not changed since the latest done version are 
+    copied from that version's folder on S3, instead of being filtered
+    and uploaded again.
+    """
+
     def __init__(self, *args, **kwargs):
         if 'collectstatic' in sys.argv:
-            version_str = CDNVersion.objects.create_new().version_str 
+            prev_version = CDNVersion.objects.get_latest(is_done=True)
+            version = CDNVersion.objects.create_new()
+            version_str = version.version_str
             extra = version_str + '/'
         else:
+            prev_version = None
+            version = None
             version_str = None
             extra = ''
 
+        self._cdn_version = version
+        self._cdn_prev_version = prev_version
+        self._cdn_prev_files = CDNFile.objects.get_manifest(prev_version) if prev_version else {}
+        self._cdn_files = []
+        self._cdn_files_lock = threading.Lock()
+
         location = settings.CDN_STATIC_S3_PATH + extra
 
         self._parent = super(VersionedStaticStorage, self)
         self._parent.__init__(*args, location=location, cdn_version_str=version_str, **kwargs)
 
+    def _cdn_save(self, name, content):
+        if self._cdn_version is None:
+            return super(VersionedStaticStorage, self)._cdn_save(name, content)
+
+        file_ext = os.path.splitext(name)[1].lstrip('.').lower()
+        filters = self._cdn_settings('FILTERS').get(file_ext, None) or ()
+
+        hash = self._cdn_hash(name, content)
+        prev_file = self._cdn_prev_files.get(name, None)
+
+        deps = []
+        if any(Util.get_filter(f) is filters_mod.csspath for f in filters):
+            deps = filters_mod.csspath_deps(content)
+            content.seek(0)
+
+        # Output that embeds the version, e.g. URLs rewritten by csspath,
+        # cannot be reused across versions.
+        if prev_file and prev_file.hash == hash and not Util.uses_version(filters):
+            prev_location = '%s%s/' % (settings.CDN_STATIC_S3_PATH, self._cdn_prev_version.version_str)
+
+            for variant, saved_name in prev_file.variants.items():
+                src_key_name = (prev_location + saved_name).lstrip('/')
+                headers = {'Content-Encoding': variant} if variant in encodings_mod.MARKERS else None
+                self._cdn_copy(src_key_name, saved_name, headers=headers)
+
+            if self._cdn_report is not None:
+                self._cdn_report.set('copied', True)
+
+            variants = prev_file.variants
+        else:
+            variants = super(VersionedStaticStorage, self)._cdn_save(name, content)
+
+        with self._cdn_files_lock:
+            self._cdn_files.append(CDNFile(name=name, hash=hash, variants=variants, deps=deps))
+
+        return variants
+
+    def _cdn_record(self, name, variants):
+        # recorded as a CDNFile of the version instead
+        if self._cdn_version is None:
+            super(VersionedStaticStorage, self)._cdn_record(name, variants)
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = super(VersionedStaticStorage, self).post_process(paths, dry_run=dry_run, **options)
+
+        if self._cdn_version is not None and not dry_run:
+            with self._cdn_files_lock:
+                files = self._cdn_files
+                self._cdn_files = []
+
+            for f in files:
+                f.version = self._cdn_version
+
+            CDNFile.objects.bulk_create(files)
+
+        return processed
+
+    def cdn_clean(self, keep, grace, workers=4, dry_run=False):
+        """
+        Deletes the folders of the versions older than both the `keep`
+        latest done versions and `grace` seconds, then their CDNVersion
+        rows. Version folders without a row are deleted too. Objects are
+        deleted 1000 per request by `workers` threads.
+
+        A row is only deleted once its whole folder is, so running it
+        again resumes an interrupted or failed run.
+
+        :returns: list of (version_str, number of objects) -- the
+            versions deleted, or to delete if `dry_run`.
+        """
+
+        prefix = settings.CDN_STATIC_S3_PATH.lstrip('/')
+        targets = [version.version_str for version in
+            CDNVersion.objects.get_prunable(keep=keep, grace=grace)]
+
+        # Folders left by a version whose row is gone, e.g. after the
+        # database was restored from a backup.
+        known = set(CDNVersion.objects.values_list('version_str', flat=True))
+        cutoff = (timezone.now() - timedelta(seconds=grace)).strftime('%Y%m%d')
+
+        for folder in self.bucket.list(prefix=self._encode_name(prefix), delimiter='/'):
+            version_str = self._decode_name(folder.name)[len(prefix):].rstrip('/')
+            if _VERSION_RE.match(version_str) and version_str not in known \
+               and version_str[:8] < cutoff:
+                targets.append(version_str)
+
+        pool = UploadPool(workers=max(workers, 1))
+        counts = {}
+
+        try:
+            for version_str in targets:
+                counts[version_str] = 0
+                batch = []
+
+                for key in self.bucket.list(prefix=self._encode_name('%s%s/' % (prefix, version_str))):
+                    batch.append(key.name)
+                    counts[version_str] += 1
+
+                    if len(batch) == _DELETE_BATCH_SIZE:
+                        if not dry_run:
+                            pool.submit(version_str, self._cdn_delete_batch, batch)
+                        batch = []
+
+                if batch and not dry_run:
+                    pool.submit(version_str, self._cdn_delete_batch, batch)
+
+            failures = pool.join()
+        finally:
+            pool.close()
+
+        failed = set()
+        for version_str, e in failures:
+            if version_str not in failed:
+                print('ERROR: Cannot delete version %s, run again to resume (Reason: %s)' % (version_str, e))
+            failed.add(version_str)
+
+        deleted = [(version_str, counts[version_str]) for version_str in targets
+            if version_str not in failed]
+
+        if not dry_run:
+            for version_str, count in deleted:
+                CDNObject.objects.filter(bucket=self.bucket_name,
+                    key__startswith='%s%s/' % (prefix, version_str)).delete()
+
+            CDNVersion.objects.filter(version_str__in=[version_str for version_str, count in deleted]).delete()
+
+        return deleted
+
+    def _cdn_delete_batch(self, key_names):
+        def delete_keys():
+            result = self.bucket.delete_keys(key_names, quiet=True)
+            if result.errors:
+                raise CDNError('%d objects not deleted, e.g. %s: %s' % (len(result.errors),
+                    result.errors[0].key, result.errors[0].message))
+
+        call_with_retry(delete_keys,
+            retries=app_settings.CDN_UPLOAD_RETRIES,
+            delay=app_settings.CDN_UPLOAD_RETRY_DELAY)
@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+def call_with_retry(fn, retries, delay, *args, **kwargs):
+    """
+    Calls `fn`, retrying up to `retries` times when it raises.
+    The wait between attempts starts at `delay` seconds and doubles
+    after every failed attempt.
+
+    :returns: whatever `fn` returns.
+        The last exception is re-raised if all attempts fail.
+    """
+
+    attempt = 0
+
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if attempt >= retries:
+                raise
+
+        time.sleep(delay * (2 ** attempt))
+        attempt += 1
+
+class UploadPool(object):
+    """
+    A bounded pool of worker threads for uploading files concurrently.
+
+    `submit` blocks when the workers are too far behind, so that at most
+    a few jobs per worker are pending at any time. A failed job does not
+    stop the others; failures are collected and returned by `join`.
+    """
+
+    def __init__(self, workers):
+        """
+        :type   workers: int
+        :param  workers: Number of worker threads. Must be positive.
+        """
+
+        self._workers   = workers
+        self._queue     = queue.Queue(maxsize=workers * 2)
+        self._threads   = []
+        self._lock      = threading.Lock()
+        self._failures  = []
+
+    def _start(self):
+        if self._threads:
+            return
+
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+
+            name, fn, args, kwargs = job
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self._failures.append((name, e))
+            finally:
+                self._queue.task_done()
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        Queues `fn(*args, **kwargs)` to be run by a worker.
+
+        :param  name: Name reported with the exception if the job fails.
+        """
+
+        self._start()
+        self._queue.put((name, fn, args, kwargs))
+
+    def join(self):
+        """
+        Waits until all submitted jobs are done.
+
+        :returns: list of (name, exception) for the jobs that failed
+            since the last call.
+        """
+
+        self._queue.join()
+
+        with self._lock:
+            failures = self._failures
+            self._failures = []
+
+        return failures
+
+    def close(self):
+        """
+        Waits until all submitted jobs are done and stops the workers.
+        The pool can be used again afterwards.
+        """
+
+        for thread in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
@@ -1,40 +1,217 @@
 import os
+import time
+from collections import OrderedDict
 
 from django import template
 from django.conf import settings
 from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
 
-from djcdn.models import CDNVersion
+from djbase.utils.cache import LRUCache
+from djcdn import thumbnails
 from djcdn.conf import settings as app_settings 
+from djcdn.models import CDNAsset, CDNFile
 from djcdn.storage import Util
+from djcdn.storage import images
+from djcdn.versions import version_resolver
 
 register = template.Library()
 
-_latest_ver     = CDNVersion.objects.get_latest(is_done=True)
 _static_storage = settings.STATICFILES_STORAGE 
 _is_versioned   = _static_storage == 'djcdn.storage.s3.VersionedStaticStorage'
-_is_static      = _static_storage == 'djcdn.storage.s3.StaticStorage'
+_is_static      = _static_storage in ('djcdn.storage.s3.StaticStorage', 
+                                      'djcdn.storage.fs.StaticStorage')
 
-@register.simple_tag(takes_context=True)
-def cdn(context, path, type='STATIC'):
-    global _static_storage, _latest_ver, _is_versioned, _is_static 
+# Types whose files nginx serves precompressed by itself
+_is_local       = {
+    'STATIC'    : _static_storage == 'djcdn.storage.fs.StaticStorage',
+    'DEFAULT'   : settings.DEFAULT_FILE_STORAGE == 'djcdn.storage.fs.DefaultStorage',
+}
 
-    request = context['request']
+_BUNDLE_HTML    = {
+    'css'   : '<link rel="stylesheet" href="%s">',
+    'js'    : '<script src="%s"></script>',
+}
+
+# Lowercase extension to the `as` of a preload link
+_PRELOAD_AS     = {
+    'css'   : 'style',
+    'js'    : 'script',
+    'woff'  : 'font',
+    'woff2' : 'font',
+    'ttf'   : 'font',
+    'otf'   : 'font',
+    'eot'   : 'font',
+    'png'   : 'image',
+    'jpg'   : 'image',
+    'jpeg'  : 'image',
+    'gif'   : 'image',
+    'svg'   : 'image',
+    'webp'  : 'image',
+}
+
+# (path, type, encoding, image_formats, version_str, asset window) to URL
+_url_cache      = LRUCache(max_size=app_settings.CDN_URL_CACHE_SIZE)
+
+@receiver(setting_changed)
+def _clear_url_cache(**kwargs):
+    _url_cache.max_size = app_settings.CDN_URL_CACHE_SIZE
+    _url_cache.clear()
+
+@receiver(post_save, sender=CDNAsset)
+@receiver(post_delete, sender=CDNAsset)
+def _forget_asset(instance, **kwargs):
+    """
+    Forgets the URLs built from the variants of an asset when they 
+    change in this process. Other processes see the change within 
+    CDN_ASSET_TTL seconds.
+    """
+
+    _url_cache.delete_if(lambda key: key[0] == instance.name and key[1] == instance.type or
+        key[0] == 'srcset' and key[1] == instance.name and key[2] == instance.type)
+
+def _get_asset_window(type, version_str):
+    """
+    :returns: int -- part of the cache keys of files whose variants are
+        looked up in CDNAsset, changing every CDN_ASSET_TTL seconds. 
+        None for the files of a version, which never change.
+    """
+
+    if version_str or not (type == 'DEFAULT' or _is_static):
+        return None
+
+    return int(time.time()) // max(app_settings.CDN_ASSET_TTL, 1)
+
+def _add_vary(request, header):
+    """
+    Records that the output depends on a request header, for VaryMiddleware.
+    """
+
+    vary = getattr(request, '_cdn_vary', None)
+    if vary is None:
+        vary = request._cdn_vary = set()
+
+    vary.add(header)
+
+def _get_encoding(request, type):
+    """
+    Chooses the encoding once per request and type.
+    """
+
+    if _is_local.get(type):
+        return None
+
+    encodings = getattr(request, '_cdn_encodings', None)
+    if encodings is None:
+        encodings = request._cdn_encodings = {}
+
+    if getattr(app_settings, 'CDN_'+type+'_ENCODINGS'):
+        _add_vary(request, 'Accept-Encoding')
+
+    if type not in encodings:
+        encodings[type] = Util.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            getattr(app_settings, 'CDN_'+type+'_ENCODINGS') or ())
+
+    return encodings[type]
+
+def _get_image_formats(request, type):
+    """
+    Gets the image formats that the browser accepts, in order of 
+    preference. Only once per request and type.
+    """
+
+    formats = getattr(request, '_cdn_image_formats', None)
+    if formats is None:
+        formats = request._cdn_image_formats = {}
+
+    if getattr(app_settings, 'CDN_'+type+'_IMAGE_FORMATS'):
+        _add_vary(request, 'Accept')
+
+    if type not in formats:
+        accept = Util.parse_accept(request.META.get('HTTP_ACCEPT', ''))
+        formats[type] = tuple(f for f in getattr(app_settings, 'CDN_'+type+'_IMAGE_FORMATS') or ()
+            if f in images.FORMATS and accept.get(images.FORMATS[f][1], 0) > 0)
+
+    return formats[type]
+
+def _get_variants(path, type, version_str):
+    """
+    :returns: dict -- See CDNFile.variants. Empty if not known.
+    """
+
+    if version_str:
+        return CDNFile.objects.get_variants(version_str=version_str, name=path)
+    elif type == 'DEFAULT' or _is_static:
+        return CDNAsset.objects.get_variants(type=type, name=path)
+
+    return {}
+
+def _get_image_format(path, type, image_formats, version_str):
+    """
+    :returns: str -- the first of `image_formats` that `path` has a 
+        derivative in, or None.
+    """
+
+    variants = _get_variants(path, type, version_str)
+
+    for format in image_formats:
+        if format in variants:
+            return format
+
+    return None
+
+def _build_blob_url(path, type, encoding, image_formats):
+    """
+    :returns: str -- URL of the blob `path` is mapped to in 
+        content-addressed mode, or None if it is not mapped.
+    """
+
+    variants = _get_variants(path, type, None)
+    if not variants.get(''):
+        return None
+
+    name = variants['']
+
+    for format in image_formats:
+        if format in variants:
+            name = variants[format]
+            break
+    else:
+        if encoding in variants:
+            name = variants[encoding]
+
+    return '%s%s' % (settings.MEDIA_URL, name)
+
+def _build_url(path, type, encoding, image_formats, version_str):
+    global _static_storage, _is_versioned, _is_static 
+
+    if type == 'DEFAULT' and app_settings.CDN_DEFAULT_CONTENT_ADDRESSED:
+        url = _build_blob_url(path, type, encoding, image_formats)
+        if url:
+            return url
+
+    if image_formats and os.path.splitext(path)[1].lstrip('.').lower() in images.SOURCE_TYPES:
+        image_format = _get_image_format(path, type, image_formats, version_str)
+        if image_format:
+            path = images.format_derivative_name(path, image_format)
 
     file_name, file_ext = os.path.splitext(path)
     file_ext = file_ext.lstrip('.')
 
     file_name = Util.format_min_file_name(file_name=file_name, file_ext=file_ext)
 
-    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '').lower():
-        file_ext_lower = file_ext.lower()
-        com_types = getattr(app_settings, 'CDN_'+type+'_COMPRESSED_TYPES')
-        if file_ext_lower in com_types:
-            file_name = Util.format_gz_file_name(file_name)
+    file_ext_lower = file_ext.lower()
+    com_types = getattr(app_settings, 'CDN_'+type+'_COMPRESSED_TYPES')
+    if encoding and file_ext_lower in com_types:
+        file_name = Util.format_encoded_file_name(file_name, encoding)
 
     if type=='STATIC':
-        if _latest_ver and _is_versioned:
-            new_path = '%s%s/%s.%s' % (settings.STATIC_URL, _latest_ver.version_str, file_name, file_ext)
+        if version_str:
+            new_path = '%s%s/%s.%s' % (settings.STATIC_URL, version_str, file_name, file_ext)
         elif _is_static:
             new_path = '%s%s.%s' % (settings.STATIC_URL, file_name, file_ext)
         else:
@@ -46,3 +223,160 @@ def cdn(context, path, type='STATIC'):
         return new_path 
 
     return path 
+
+def _get_url(request, path, type):
+    encoding = _get_encoding(request, type)
+    image_formats = _get_image_formats(request, type)
+    version_str = version_resolver.get_latest() if type == 'STATIC' and _is_versioned else None
+
+    key = (path, type, encoding, image_formats, version_str, _get_asset_window(type, version_str))
+    url = _url_cache.get(key)
+
+    if url is None:
+        url = _build_url(path, type, encoding, image_formats, version_str)
+        _url_cache.set(key, url)
+
+    return url
+
+def _get_deps(path, type):
+    """
+    :returns: list -- names of the static files that `path` refers to. 
+        Only known for the files of VersionedStaticStorage.
+    """
+
+    if type != 'STATIC' or not _is_versioned:
+        return []
+
+    version_str = version_resolver.get_latest()
+    if not version_str:
+        return []
+
+    key = ('deps', path, version_str)
+    deps = _url_cache.get(key)
+
+    if deps is None:
+        deps = CDNFile.objects.get_deps(version_str=version_str, name=path)
+        _url_cache.set(key, deps)
+
+    return deps
+
+def get_preloads(request, assets=None):
+    """
+    Gets the preload links of files and of the first CDN_PRELOAD_DEPS
+    static files each refers to, once per request: links already 
+    returned for the request are skipped. Only files whose extension is
+    in CDN_PRELOAD_TYPES are preloaded.
+
+    :param  assets: list of (path, type). Defaults to the files the 
+        `cdn` tag gave URLs of during the request.
+
+    :returns: list of (url, as), e.g. ('//cdn/a.css', 'style').
+    """
+
+    if assets is None:
+        assets = getattr(request, '_cdn_assets', None) or ()
+
+    preloaded = getattr(request, '_cdn_preloaded', None)
+    if preloaded is None:
+        preloaded = request._cdn_preloaded = set()
+
+    types = app_settings.CDN_PRELOAD_TYPES
+    max_deps = app_settings.CDN_PRELOAD_DEPS
+    links = []
+
+    for path, type in assets:
+        deps = _get_deps(path, type)[:max_deps] if max_deps > 0 else []
+
+        for dep_path, dep_type in [(path, type)] + [(dep, 'STATIC') for dep in deps]:
+            file_ext = os.path.splitext(dep_path)[1].lstrip('.').lower()
+            if file_ext not in types or file_ext not in _PRELOAD_AS:
+                continue
+
+            url = _get_url(request, dep_path, dep_type)
+            if url not in preloaded:
+                preloaded.add(url)
+                links.append((url, _PRELOAD_AS[file_ext]))
+
+    return links
+
+@register.simple_tag(takes_context=True)
+def cdn(context, path, type='STATIC'):
+    request = context['request']
+
+    # for `cdn_preload` and PreloadMiddleware, an ordered set
+    assets = getattr(request, '_cdn_assets', None)
+    if assets is None:
+        assets = request._cdn_assets = OrderedDict()
+    assets[(path, type)] = None
+
+    return _get_url(request, path, type)
+
+@register.simple_tag(takes_context=True)
+def cdn_srcset(context, path, type='STATIC'):
+    """
+    Outputs the value of a `srcset` attribute listing the width variants
+    of an image, e.g. "//cdn/1.w320.jpg 320w, //cdn/1.jpg 800w". 
+    Only outputs the URL of the image if it has no width variants.
+    """
+
+    version_str = version_resolver.get_latest() if type == 'STATIC' and _is_versioned else None
+
+    key = ('srcset', path, type, version_str, _get_asset_window(type, version_str))
+    widths = _url_cache.get(key)
+
+    if widths is None:
+        widths = images.get_widths(_get_variants(path, type, version_str))
+        _url_cache.set(key, widths)
+
+    if not widths:
+        return cdn(context, path, type=type)
+
+    return ', '.join('%s %dw' % (cdn(context, name, type=type), w) for w, name in widths)
+
+@register.simple_tag
+def cdn_thumbnail(path, spec):
+    """
+    Outputs the URL of a thumbnail of a media file, with the version of 
+    the file so that it can be cached for long. See djcdn.views.thumbnail.
+    """
+
+    try:
+        spec = thumbnails.Spec(spec)
+    except ValueError as e:
+        raise template.TemplateSyntaxError(e)
+
+    return thumbnails.get_thumbnail_url(path, spec)
+
+@register.simple_tag(takes_context=True)
+def cdn_bundle(context, name):
+    """
+    Outputs the HTML tag that loads a bundle in settings.CDN_STATIC_BUNDLES,
+    or one tag for each of its files when DEBUG is on.
+    """
+
+    bundles = app_settings.CDN_STATIC_BUNDLES
+    if name not in bundles:
+        raise template.TemplateSyntaxError('Unknown bundle: %s' % name)
+
+    file_ext = os.path.splitext(name)[1].lstrip('.').lower()
+    if file_ext not in _BUNDLE_HTML:
+        raise template.TemplateSyntaxError('Bundle must be css or js: %s' % name)
+
+    paths = bundles[name] if settings.DEBUG else (name,)
+    html = _BUNDLE_HTML[file_ext]
+
+    return mark_safe('\n'.join(html % escape(cdn(context, path)) for path in paths))
+
+@register.simple_tag(takes_context=True)
+def cdn_preload(context, *paths):
+    """
+    Outputs <link rel="preload"> tags for the static files in `paths`
+    and the fonts and images they refer to, or for the files given to
+    the `cdn` tag so far if there are no paths. See get_preloads().
+    """
+
+    assets = [(path, 'STATIC') for path in paths] if paths else None
+    links = get_preloads(context['request'], assets)
+
+    return mark_safe('\n'.join('<link rel="preload" href="%s" as="%s"%s>' % (
+        escape(url), as_, ' crossorigin' if as_ == 'font' else '') for url, as_ in links))
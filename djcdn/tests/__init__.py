@@ -1,3 +1,15 @@
+from .bundles import *
+from .cache import *
+from .deferred import *
+from .encodings import *
 from .filters import *
+from .fs import *
+from .images import *
+from .models import *
+from .process import *
+from .report import *
 from .storage import *
-
+from .templatetags import *
+from .thumbnails import *
+from .upload import *
+from .versions import *
@@ -0,0 +1,103 @@
+from __future__ import unicode_literals
+
+import codecs
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.template import TemplateSyntaxError
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from djcdn.exceptions import CDNError
+from djcdn.storage.s3 import StaticStorage
+from djcdn.templatetags import cdn
+
+class _MemoryStorage(FileSystemStorage):
+    def __init__(self, files):
+        self._files = files
+
+    def open(self, name, mode='rb'):
+        return ContentFile(self._files[name])
+
+_BUNDLES = {
+    'js/all.js'     : ('js/a.js', 'js/b.js'),
+    'css/all.css'   : ('css/a.css', 'css/b.css'),
+}
+
+@override_settings(CDN_STATIC_BUNDLES=_BUNDLES)
+class BundleTest(TestCase):
+    def setUp(self):
+        source = _MemoryStorage({
+            'a.js'  : b'var a = 1 // no semicolon',
+            'b.js'  : codecs.BOM_UTF8 + b'var b = 2;',
+            'a.css' : b'a { color: red; }',
+            'b.css' : b'b { color: blue; }',
+        })
+
+        self.paths = {
+            'js/a.js'   : (source, 'a.js'),
+            'js/b.js'   : (source, 'b.js'),
+            'css/a.css' : (source, 'a.css'),
+            'css/b.css' : (source, 'b.css'),
+        }
+
+        self.storage = StaticStorage(cdn_upload_workers=0)
+        self.saved = {}
+
+        def save(name, content):
+            self.saved[name] = content.read()
+            return name
+
+        self.storage._save = save
+
+    def test_read(self):
+        self.assertEqual(self.storage._cdn_read_bundle('js/all.js', self.paths),
+            b'var a = 1 // no semicolon\n;\nvar b = 2;')
+        self.assertEqual(self.storage._cdn_read_bundle('css/all.css', self.paths),
+            b'a { color: red; }\nb { color: blue; }')
+
+    def test_post_process(self):
+        self.storage.post_process(self.paths)
+        self.assertEqual(sorted(self.saved), ['css/all.css', 'js/all.js'])
+
+        self.saved.clear()
+        self.storage.post_process(self.paths, dry_run=True)
+        self.assertEqual(self.saved, {})
+
+    def test_missing(self):
+        del self.paths['css/b.css']
+        self.assertRaises(CDNError, self.storage.post_process, self.paths)
+
+@override_settings(
+    CDN_STATIC_BUNDLES = _BUNDLES,
+    STATICFILES_STORAGE = 'djcdn.storage.s3.StaticStorage',
+    STATIC_URL = '//cdn.example.com/static/',
+    CDN_STATIC_FILTERS = {'js': ('filters.slimit',)},
+    CDN_STATIC_COMPRESSED_TYPES = (),
+)
+class BundleTagTest(TestCase):
+    def setUp(self):
+        self._flags = (cdn._is_static, cdn._is_versioned)
+        cdn._is_static, cdn._is_versioned = True, False
+
+    def tearDown(self):
+        cdn._is_static, cdn._is_versioned = self._flags
+
+    def _render(self, name):
+        return cdn.cdn_bundle({'request': RequestFactory().get('/')}, name)
+
+    def test_bundle(self):
+        self.assertEqual(self._render('js/all.js'),
+            '<script src="//cdn.example.com/static/js/all.min.js"></script>')
+        self.assertEqual(self._render('css/all.css'),
+            '<link rel="stylesheet" href="//cdn.example.com/static/css/all.min.css">')
+
+    def test_debug(self):
+        with self.settings(DEBUG=True):
+            self.assertEqual(self._render('js/all.js'),
+                '<script src="//cdn.example.com/static/js/a.min.js"></script>\n'
+                '<script src="//cdn.example.com/static/js/b.min.js"></script>')
+
+    def test_unknown(self):
+        self.assertRaises(TemplateSyntaxError, self._render, 'js/none.js')
@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djcdn import filters
+from djcdn.storage import Util
+from djcdn.storage.cache import DiskCache
+
+class DiskCacheTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_set(self):
+        cache = DiskCache(path=self.path, max_size=1000)
+
+        self.assertEqual(cache.get('abcd'), None)
+        cache.set('abcd', b'1234')
+        self.assertEqual(cache.get('abcd'), b'1234')
+        self.assertEqual(open(cache.get_path('abcd'), 'rb').read(), b'1234')
+
+    def test_replace(self):
+        cache = DiskCache(path=self.path, max_size=1000)
+
+        for i in range(5):
+            cache.set('abcd', b'x' * 100)
+
+        self.assertEqual(cache._size, 100)
+
+    def test_evict_least_recently_used(self):
+        cache = DiskCache(path=self.path, max_size=300)
+        now = time.time()
+
+        for i, key in enumerate(('aa01', 'aa02', 'aa03')):
+            cache.set(key, b'x' * 100)
+            os.utime(cache.get_path(key), (now - 100 + i, now - 100 + i))
+
+        # aa01 is now the most recently used
+        cache.get('aa01')
+        cache.set('aa04', b'x' * 100)
+
+        self.assertEqual(cache.get('aa02'), None)
+        self.assertEqual(cache.get('aa01'), b'x' * 100)
+        self.assertEqual(cache.get('aa04'), b'x' * 100)
+
+@override_settings(
+    STATIC_ROOT = '/static/',
+    STATIC_URL = '//1234.cloudfront.net/static/',
+)
+class FilterCacheTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_apply_filters(self):
+        css = 'body { background: url("/static/a.png") }'
+        chain = ('filters.cssmin', 'filters.csspath')
+
+        with self.settings(CDN_FILTER_CACHE_DIR=self.path):
+            expected = Util.apply_filters(chain, ContentFile(css), version_str='1').read()
+
+            def fail(input_file):
+                raise IOError('cssmin called')
+
+            cssmin = filters.cssmin
+            filters.cssmin = fail
+            try:
+                # served from the cache, without calling the filter
+                output = Util.apply_filters(chain, ContentFile(css), version_str='1').read()
+                self.assertEqual(output, expected)
+
+                # different version
+                self.assertRaises(IOError, Util.apply_filters, 
+                    chain, ContentFile(css), version_str='2')
+            finally:
+                filters.cssmin = cssmin
+
+            output = Util.apply_filters(chain, ContentFile(css), version_str='2').read()
+            self.assertTrue(b'/static/2/a.png' in output)
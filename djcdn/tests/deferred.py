@@ -0,0 +1,121 @@
+from __future__ import unicode_literals
+
+import os
+import os.path
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djcdn.models import CDNTask
+from djcdn.storage import deferred
+from djcdn.storage.fs import DefaultStorage
+
+@override_settings(
+    CDN_DEFAULT_FILTERS             = {'css': ('filters.cssmin',)},
+    CDN_DEFAULT_COMPRESSED_TYPES    = ('css',),
+    CDN_DEFAULT_ENCODINGS           = ('gzip',),
+    CDN_UPLOAD_RETRIES              = 1,
+)
+class DeferredTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    @override_settings(CDN_DEFAULT_QUEUE='db')
+    def test_db(self):
+        storage = DefaultStorage(location=self.path)
+        name = storage.save('css/a.css', ContentFile(b'a {  color: red;  }'))
+
+        # the original is saved under the final name until processed
+        self.assertEqual(name, 'css/a.min.css')
+        self.assertEqual(self._read(name), b'a {  color: red;  }')
+        self.assertEqual(os.listdir(os.path.join(self.path, 'css')), ['a.min.css'])
+        self.assertEqual(CDNTask.objects.get().name, 'css/a.css')
+
+        # files with nothing to process are not queued
+        storage.save('a.txt', ContentFile(b'a'))
+        self.assertEqual(CDNTask.objects.count(), 1)
+
+        self.assertEqual(deferred.process_tasks(storage), (1, 0))
+        self.assertEqual(self._read(name), b'a{color:red}')
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'css/a.min.css.gz')))
+        self.assertEqual(CDNTask.objects.count(), 0)
+
+    @override_settings(CDN_DEFAULT_QUEUE='db')
+    def test_db_failure(self):
+        storage = DefaultStorage(location=self.path)
+        CDNTask.objects.create(type='DEFAULT', name='missing.css')
+
+        self.assertEqual(deferred.process_tasks(storage), (0, 1))
+        self.assertEqual(CDNTask.objects.get().attempts, 1)
+
+        # given up after CDN_UPLOAD_RETRIES
+        self.assertEqual(deferred.process_tasks(storage), (0, 1))
+        self.assertEqual(deferred.process_tasks(storage), (0, 0))
+
+    def test_claim(self):
+        task = CDNTask.objects.create(type='DEFAULT', name='a.css')
+        other = CDNTask.objects.get(pk=task.pk)
+
+        self.assertTrue(CDNTask.objects.claim(task))
+        self.assertFalse(CDNTask.objects.claim(other))
+        self.assertEqual(CDNTask.objects.get_pending(type='DEFAULT', timeout=60, max_attempts=1), [])
+        self.assertEqual(CDNTask.objects.get_pending(type='DEFAULT', timeout=-1, max_attempts=1), [task])
+
+    def test_abandoned(self):
+        CDNTask.objects.create(type='DEFAULT', name='a.css')
+
+        # claimed by workers that were killed
+        for i in range(2):
+            task = CDNTask.objects.get_pending(type='DEFAULT', timeout=-1, max_attempts=1)[0]
+            self.assertTrue(CDNTask.objects.claim(task))
+
+        self.assertEqual(CDNTask.objects.get().attempts, 2)
+        self.assertEqual(CDNTask.objects.get_pending(type='DEFAULT', timeout=-1, max_attempts=1), [])
+
+    @override_settings(CDN_DEFAULT_QUEUE='local')
+    def test_local(self):
+        storage = DefaultStorage(location=self.path)
+        name = storage.save('a.css', ContentFile(b'a {  color: red;  }'))
+        deferred.get_queue('local').join()
+
+        self.assertEqual(self._read(name), b'a{color:red}')
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'a.min.css.gz')))
+        self.assertEqual(CDNTask.objects.count(), 0)
+
+    @override_settings(CDN_UPLOAD_RETRY_DELAY=0)
+    def test_local_failure(self):
+        storage = DefaultStorage(location=self.path)
+        calls = []
+        errors = []
+
+        def fail(name):
+            calls.append(name)
+            raise IOError('failed')
+
+        class Logger(object):
+            def exception(self, msg, *args):
+                errors.append(msg % args)
+
+        storage._cdn_process = fail
+        logger = deferred.logger
+        deferred.logger = Logger()
+
+        try:
+            queue = deferred.LocalQueue(workers=1)
+            queue.put(storage, 'a.css')
+            queue.join()
+        finally:
+            deferred.logger = logger
+
+        self.assertEqual(calls, ['a.css', 'a.css'])
+        self.assertEqual(errors, ['Cannot process file: a.css'])
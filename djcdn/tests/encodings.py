@@ -0,0 +1,100 @@
+from __future__ import unicode_literals
+
+import gzip
+import zlib
+from unittest import skipIf
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from djcdn.storage import Util
+from djcdn.storage import encodings
+from djcdn.templatetags import cdn
+
+class ChooseEncodingTest(TestCase):
+    def test_parse_accept(self):
+        self.assertEqual(Util.parse_accept('gzip, deflate;q=0.5, BR;q=bad, ;'),
+            {'gzip': 1.0, 'deflate': 0.5, 'br': 0.0})
+
+    def test_choose(self):
+        encodings = ('br', 'zstd', 'gzip')
+        test_data = (
+            ('', None),
+            ('gzip,deflate', 'gzip'),
+            ('gzip, deflate, br', 'br'),
+            ('gzip;q=1.0, br;q=0.8', 'gzip'),
+            ('br;q=0, gzip;q=0.1', 'gzip'),
+            ('gzip;q=0', None),
+            ('*', 'br'),
+            ('*;q=0.5, br;q=0', 'zstd'),
+            ('zstd, br', 'br'),
+            ('identity', None),
+        )
+
+        for header, expected in test_data:
+            self.assertEqual(Util.choose_encoding(header, encodings), expected, header)
+
+        self.assertEqual(Util.choose_encoding('br, gzip', ('gzip',)), 'gzip')
+
+class CompressTest(TestCase):
+    DATA = b'body{color:red}' * 100
+
+    def test_gzip(self):
+        data = encodings.compress('gzip', self.DATA)
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS), self.DATA)
+
+        # deterministic
+        self.assertEqual(data, encodings.compress('gzip', self.DATA))
+
+    @skipIf(encodings.zopfli_gzip is None, 'zopfli not installed')
+    def test_zopfli(self):
+        data = encodings.compress('gzip', self.DATA, zopfli=True)
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS), self.DATA)
+
+    @skipIf(encodings.brotli is None, 'brotli not installed')
+    def test_brotli(self):
+        data = encodings.compress('br', self.DATA)
+        self.assertEqual(encodings.brotli.decompress(data), self.DATA)
+
+    @skipIf(encodings.zstandard is None, 'zstandard not installed')
+    def test_zstd(self):
+        data = encodings.compress('zstd', self.DATA)
+        self.assertEqual(encodings.zstandard.ZstdDecompressor().decompress(data), self.DATA)
+
+    def test_missing(self):
+        self.assertEqual(encodings.get_missing(('gzip', 'deflate')), ['deflate'])
+
+    def test_compress_file(self):
+        for encoding in ('gzip', 'br', 'zstd'):
+            if encodings.get_missing((encoding,)):
+                continue
+
+            output_file = encodings.compress_file(encoding, ContentFile(self.DATA))
+            try:
+                data = output_file.read()
+            finally:
+                output_file.close()
+                Util.delete_file(output_file)
+
+            # the same bytes as compressing at once
+            self.assertEqual(data, encodings.compress(encoding, self.DATA), encoding)
+
+@override_settings(
+    MEDIA_URL = '//cdn.example.com/media/',
+    CDN_DEFAULT_COMPRESSED_TYPES = ('css',),
+    CDN_DEFAULT_ENCODINGS = ('br', 'gzip'),
+)
+class TagEncodingTest(TestCase):
+    def _url(self, path, accept_encoding):
+        request = RequestFactory().get('/')
+        request.META['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        return cdn.cdn({'request': request}, path, type='DEFAULT')
+
+    def test_negotiate(self):
+        self.assertEqual(self._url('a.css', 'gzip, br'), '//cdn.example.com/media/a.min.br.css')
+        self.assertEqual(self._url('a.css', 'gzip'), '//cdn.example.com/media/a.min.gz.css')
+        self.assertEqual(self._url('a.css', 'br;q=0.5, gzip'), '//cdn.example.com/media/a.min.gz.css')
+        self.assertEqual(self._url('a.css', ''), '//cdn.example.com/media/a.min.css')
+        self.assertEqual(self._url('a.png', 'gzip, br'), '//cdn.example.com/media/a.png')
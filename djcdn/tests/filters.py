@@ -1,11 +1,13 @@
 from __future__ import unicode_literals
 
+import os
+
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.test import TestCase 
 from django.test.utils import override_settings
 
-from djcdn import filters
+from djcdn import bench, filters
 
 @override_settings(
     STATIC_ROOT = '/static/',
@@ -87,3 +89,82 @@ class CssPathTest(TestCase):
             self.assertEqual(output, expected)
 
 
+
+    def test_chunks(self):
+        input = ''.join((
+            'a{background:url("%simg/a.png")}' % settings.STATIC_ROOT,
+            'b{background:url( \'%simg/b.png\' )}' % settings.STATIC_ROOT,
+            'c{background:URL(%simg/c.png)}' % settings.STATIC_ROOT,
+            '@import "%scss/main.css";' % settings.STATIC_ROOT,
+            'd{content:"\u00e9"}\n',
+            'e{background:url("%simg/e.png\')}' % settings.STATIC_ROOT,
+            '@import url(%scss/f.css)' % settings.STATIC_ROOT,
+        )).encode('utf8')
+
+        expected = input.replace(settings.STATIC_ROOT.encode('utf8'), settings.STATIC_URL.encode('utf8'))
+        # mismatched quotes are left alone
+        expected = expected.replace(('url("%simg/e.png' % settings.STATIC_URL).encode('utf8'), 
+            ('url("%simg/e.png' % settings.STATIC_ROOT).encode('utf8'))
+
+        chunk_size = filters._CSS_CHUNK_SIZE
+        try:
+            for size in range(1, 40):
+                filters._CSS_CHUNK_SIZE = size
+                output_file = filters.csspath(ContentFile(input))
+                self.assertEqual(output_file.read(), expected)
+                output_file.close()
+                os.unlink(output_file.name)
+        finally:
+            filters._CSS_CHUNK_SIZE = chunk_size
+
+    def test_deps(self):
+        input = '\n'.join((
+            '@font-face{src:url("%sfonts/a.woff2?v=2") format("woff2"),' % settings.STATIC_ROOT,
+            'url(%sfonts/a.woff#iefix)}' % settings.STATIC_ROOT,
+            'a{background:url(\'%simg/a.png\')}b{background:url(%simg/a.png)}' % (
+                settings.STATIC_ROOT, settings.STATIC_ROOT),
+            '@import "%scss/main.css";' % settings.STATIC_ROOT,
+            'c{background:url(data:image/png;base64,AAAA)}d{background:url(img/d.png)}',
+        )).encode('utf8')
+
+        self.assertEqual(filters.csspath_deps(ContentFile(input)),
+            ['fonts/a.woff2', 'fonts/a.woff', 'img/a.png', 'css/main.css'])
+
+class BenchCssPathTest(TestCase):
+    def test_bench(self):
+        result = bench.bench_csspath(size_mb=0.1)
+        self.assertTrue(result['identical'])
+
+@override_settings(
+    CDN_STATIC_FILTERS      = {'css': ('filters.cssmin', 'filters.csspath'), 'png': ('filters.pngcrush',)},
+    CDN_STATIC_ENCODINGS    = ('gzip',),
+)
+class BenchPipelineTest(TestCase):
+    def test_corpus(self):
+        for file_ext in ('css', 'js'):
+            paths = [bench._generate_corpus(file_ext, 10000, seed=1) for _ in range(2)]
+            try:
+                with open(paths[0], 'rb') as a, open(paths[1], 'rb') as b:
+                    self.assertEqual(a.read(), b.read())
+                self.assertTrue(os.path.getsize(paths[0]) >= 10000)
+            finally:
+                for path in paths:
+                    os.unlink(path)
+
+    def test_bench(self):
+        result = bench.bench_pipeline(size_mb=0.01, types=('css',))
+
+        for name in ('cssmin', 'csspath', 'chain', 'gzip', 'save'):
+            for measure in ('mb_s', 'peak_mb', 'ratio'):
+                self.assertTrue(('css.%s.%s' % (name, measure)) in result)
+
+        self.assertTrue(result['css.cssmin.ratio'] < 1)
+        self.assertTrue(result['css.gzip.ratio'] < result['css.chain.ratio'])
+        self.assertEqual(result['skipped'], [])
+
+    def test_skipped(self):
+        if bench.find_executable('pngcrush') or bench.images.Image is None:
+            return
+
+        result = bench.bench_pipeline(size_mb=0.01, types=('png',))
+        self.assertEqual(result['skipped'], ['png filters.pngcrush (pngcrush not installed)'])
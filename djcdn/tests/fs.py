@@ -0,0 +1,113 @@
+from __future__ import unicode_literals
+
+import gzip
+import os
+import os.path
+import shutil
+import tempfile
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from djcdn.models import CDNAsset
+from djcdn.storage import encodings
+from djcdn.storage.fs import DefaultStorage, StaticStorage
+from djcdn.templatetags import cdn
+
+def _gunzip(data):
+    return gzip.GzipFile(fileobj=StringIO(data)).read()
+
+@override_settings(
+    CDN_STATIC_FILTERS          = {'css': ('filters.cssmin',)},
+    CDN_STATIC_COMPRESSED_TYPES = ('css', 'js'),
+    CDN_STATIC_ENCODINGS        = ('gzip',),
+    CDN_DEFAULT_COMPRESSED_TYPES = ('txt',),
+    CDN_DEFAULT_ENCODINGS       = ('gzip',),
+)
+class FileSystemStorageTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def test_static(self):
+        storage = StaticStorage(location=self.path, cdn_upload_workers=0)
+        name = storage.save('css/main.css', ContentFile(b'a {  color: red;  }'))
+
+        self.assertEqual(name, 'css/main.min.css')
+        self.assertEqual(self._read('css/main.min.css'), b'a{color:red}')
+        self.assertEqual(_gunzip(self._read('css/main.min.css.gz')), b'a{color:red}')
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, 'css'))),
+            ['main.min.css', 'main.min.css.gz'])
+
+        storage.delete('css/main.min.css')
+        self.assertEqual(os.listdir(os.path.join(self.path, 'css')), [])
+
+    def test_encodings(self):
+        if encodings.brotli is None:
+            return
+
+        with self.settings(CDN_STATIC_ENCODINGS=('br', 'gzip')):
+            storage = StaticStorage(location=self.path, cdn_upload_workers=0)
+            storage.save('a.js', ContentFile(b'var a = 1;'))
+
+        self.assertEqual(encodings.brotli.decompress(self._read('a.js.br')),
+            b'var a = 1;')
+
+    def test_default(self):
+        storage = DefaultStorage(location=self.path, base_url='/media/')
+
+        self.assertEqual(storage.save('a.txt', ContentFile(b'one')), 'a.txt')
+        self.assertEqual(storage.save('b.png', ContentFile(b'png')), 'b.png')
+
+        # overwrites in place, e.g. when collectstatic runs again
+        storage._cdn_upload('a.txt', ContentFile(b'two'))
+
+        self.assertEqual(self._read('a.txt'), b'two')
+        self.assertEqual(_gunzip(self._read('a.txt.gz')), b'one')
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'b.png.gz')))
+        self.assertEqual(os.stat(os.path.join(self.path, 'a.txt')).st_mode & 0o777, 0o644)
+        self.assertEqual(storage.url('a.txt'), '/media/a.txt')
+
+    def test_delete_variants(self):
+        storage = DefaultStorage(location=self.path)
+        for name in ('a.jpg', 'a.jpg.webp', 'a.jpg.webp.gz', 'a.w320.jpg'):
+            storage._cdn_upload(name, ContentFile(b'x'))
+
+        CDNAsset.objects.record('DEFAULT', 'a.jpg',
+            {'': 'a.jpg', 'webp': 'a.jpg.webp', 'w320': 'a.w320.jpg', 'w800': 'a.jpg'})
+
+        storage.delete('a.jpg')
+        self.assertEqual(os.listdir(self.path), [])
+        self.assertEqual(CDNAsset.objects.count(), 0)
+
+@override_settings(
+    STATIC_URL              = '/static/',
+    CDN_STATIC_ENCODINGS    = ('gzip',),
+)
+class FileSystemTagTest(TestCase):
+    def test_no_encoded_names(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        context = {'request': request}
+
+        old = cdn._is_local, cdn._is_static, cdn._is_versioned
+        cdn._is_local = {'STATIC': True}
+        cdn._is_static = True
+        cdn._is_versioned = False
+
+        try:
+            self.assertEqual(cdn.cdn(context, 'css/main.css'), '/static/css/main.min.css')
+        finally:
+            cdn._is_local, cdn._is_static, cdn._is_versioned = old
@@ -0,0 +1,219 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import stat
+import tempfile
+from unittest import skipIf
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from djcdn.middleware import VaryMiddleware
+from djcdn.models import CDNAsset, CDNFile, CDNVersion
+from djcdn.storage import images
+from djcdn.storage.s3 import DefaultStorage
+from djcdn.templatetags import cdn
+
+# Writes `size` bytes to the output path, the last argument or the one after -o.
+_ENCODER = """#!/bin/sh
+out=""
+prev=""
+for arg in "$@"; do
+    if [ "$prev" = "-o" ]; then out="$arg"; fi
+    prev="$arg"
+done
+if [ -z "$out" ]; then out="$arg"; fi
+head -c %d /dev/zero > "$out"
+"""
+
+class _FakeEncodersMixin(object):
+    def setUp(self):
+        self._bin = tempfile.mkdtemp()
+        self._path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self._bin + os.pathsep + self._path
+
+        self._install('cwebp', size=10)
+
+    def tearDown(self):
+        os.environ['PATH'] = self._path
+        shutil.rmtree(self._bin)
+
+    def _install(self, tool, size):
+        path = os.path.join(self._bin, tool)
+        with open(path, 'w') as f:
+            f.write(_ENCODER % size)
+
+        os.chmod(path, stat.S_IRWXU)
+
+class ImagesTest(_FakeEncodersMixin, TestCase):
+    def test_available(self):
+        self.assertEqual(images.get_available(('avif', 'webp', 'bmp')), ['webp'])
+
+        self._install('avifenc', size=10)
+        self.assertEqual(images.get_available(('avif', 'webp')), ['avif', 'webp'])
+
+    def test_encode(self):
+        content = ContentFile(b'x' * 100)
+        self.assertEqual(images.encode('webp', content, 'jpg'), b'\0' * 10)
+        self.assertEqual(content.tell(), 0)
+
+@override_settings(
+    CDN_DEFAULT_IMAGE_FORMATS = ('avif', 'webp'),
+    CDN_DEFAULT_FILTERS = {},
+)
+class DerivativeStorageTest(_FakeEncodersMixin, TestCase):
+    def setUp(self):
+        super(DerivativeStorageTest, self).setUp()
+
+        self._install('avifenc', size=200)
+        self.storage = DefaultStorage()
+        self.uploaded = {}
+
+        def upload(name, content, headers=None):
+            content.seek(0)
+            self.uploaded[name] = (content.read(), getattr(content, 'content_type', None))
+            return name
+
+        self.storage._cdn_upload = upload
+
+    def test_save(self):
+        self.assertEqual(self.storage.save('photos/1.jpg', ContentFile(b'x' * 100)), 'photos/1.jpg')
+
+        # the AVIF is larger than the JPEG
+        self.assertEqual(sorted(self.uploaded), ['photos/1.jpg', 'photos/1.jpg.webp'])
+        self.assertEqual(self.uploaded['photos/1.jpg.webp'], (b'\0' * 10, 'image/webp'))
+
+        self.assertEqual(CDNAsset.objects.get_variants('DEFAULT', 'photos/1.jpg'),
+            {'': 'photos/1.jpg', 'webp': 'photos/1.jpg.webp'})
+
+    def test_not_image(self):
+        self.storage.save('docs/1.txt', ContentFile(b'x' * 100))
+        self.assertEqual(sorted(self.uploaded), ['docs/1.txt'])
+        self.assertEqual(CDNAsset.objects.count(), 0)
+
+@override_settings(
+    MEDIA_URL = '//cdn.example.com/media/',
+    STATIC_URL = '//cdn.example.com/static/',
+    CDN_DEFAULT_IMAGE_FORMATS = ('avif', 'webp'),
+    CDN_STATIC_IMAGE_FORMATS = ('webp',),
+)
+class ImageTagTest(TestCase):
+    def _url(self, path, accept, type='DEFAULT'):
+        request = RequestFactory().get('/', HTTP_ACCEPT=accept)
+        return cdn.cdn({'request': request}, path, type=type)
+
+    def test_default(self):
+        CDNAsset.objects.record('DEFAULT', 'a.jpg', {'': 'a.jpg', 'webp': 'a.jpg.webp'})
+
+        self.assertEqual(self._url('a.jpg', 'image/avif,image/webp,*/*'), '//cdn.example.com/media/a.jpg.webp')
+        self.assertEqual(self._url('a.jpg', 'image/webp;q=0,*/*'), '//cdn.example.com/media/a.jpg')
+        self.assertEqual(self._url('a.jpg', '*/*'), '//cdn.example.com/media/a.jpg')
+        self.assertEqual(self._url('b.jpg', 'image/webp'), '//cdn.example.com/media/b.jpg')
+
+    def test_asset_changed(self):
+        # rendered before the derivative is made in the background
+        self.assertEqual(self._url('c.jpg', 'image/webp'), '//cdn.example.com/media/c.jpg')
+
+        CDNAsset.objects.record('DEFAULT', 'c.jpg', {'': 'c.jpg', 'webp': 'c.jpg.webp'})
+        self.assertEqual(self._url('c.jpg', 'image/webp'), '//cdn.example.com/media/c.jpg.webp')
+
+        CDNAsset.objects.filter(type='DEFAULT', name='c.jpg').delete()
+        self.assertEqual(self._url('c.jpg', 'image/webp'), '//cdn.example.com/media/c.jpg')
+
+    def test_vary(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT='image/webp')
+        cdn.cdn({'request': request}, 'a.jpg', type='DEFAULT')
+
+        response = VaryMiddleware().process_response(request, HttpResponse())
+        self.assertEqual(response['Vary'], 'Accept, Accept-Encoding')
+
+        response = VaryMiddleware().process_response(RequestFactory().get('/'), HttpResponse())
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_versioned(self):
+        ver = CDNVersion.objects.create_new()
+        ver.is_done = True
+        ver.save(update_fields=('is_done',))
+        CDNFile.objects.create(version=ver, name='img/a.png', hash='',
+            variants={'': 'img/a.png', 'webp': 'img/a.png.webp'})
+
+        is_versioned = cdn._is_versioned
+        cdn._is_versioned = True
+
+        try:
+            with self.settings(CDN_VERSION_TTL=0):
+                self.assertEqual(self._url('img/a.png', 'image/webp', type='STATIC'),
+                    '//cdn.example.com/static/%s/img/a.png.webp' % ver.version_str)
+        finally:
+            cdn._is_versioned = is_versioned
+
+def _make_jpeg(width, height):
+    output = StringIO()
+    images.Image.new('RGB', (width, height), (200, 30, 30)).save(output, format='JPEG')
+    return output.getvalue()
+
+@skipIf(images.Image is None, 'PIL is not installed')
+class ResizeTest(TestCase):
+    def test_resize(self):
+        content = ContentFile(_make_jpeg(100, 50))
+        orig_width, resized = images.resize(content, 'jpg', (40, 100, 200))
+
+        self.assertEqual(orig_width, 100)
+        self.assertEqual(sorted(resized), [40])
+        self.assertEqual(images.Image.open(StringIO(resized[40])).size, (40, 20))
+
+        # same output every time
+        self.assertEqual(images.resize(content, 'jpg', (40,))[1], resized)
+
+    def test_not_image(self):
+        self.assertEqual(images.resize(ContentFile(b'x'), 'png', (40,)), (None, {}))
+
+    def test_get_widths(self):
+        self.assertEqual(images.get_widths({'': 'a.jpg', 'w100': 'a.jpg', 'w40': 'a.w40.jpg', 'webp': 'a.jpg.webp'}),
+            [(40, 'a.w40.jpg'), (100, 'a.jpg')])
+
+@skipIf(images.Image is None, 'PIL is not installed')
+@override_settings(
+    CDN_DEFAULT_IMAGE_WIDTHS = (40, 80),
+    CDN_DEFAULT_FILTERS = {},
+)
+class WidthStorageTest(TestCase):
+    def test_save(self):
+        storage = DefaultStorage()
+        uploaded = []
+        storage._cdn_upload = lambda name, content, headers=None: uploaded.append(name) or name
+
+        storage.save('photos/1.jpg', ContentFile(_make_jpeg(60, 30)))
+
+        self.assertEqual(uploaded, ['photos/1.jpg', 'photos/1.w40.jpg'])
+        self.assertEqual(CDNAsset.objects.get_variants('DEFAULT', 'photos/1.jpg'),
+            {'': 'photos/1.jpg', 'w60': 'photos/1.jpg', 'w40': 'photos/1.w40.jpg'})
+
+@override_settings(MEDIA_URL = '//cdn.example.com/media/')
+class SrcsetTagTest(TestCase):
+    def _srcset(self, path):
+        return cdn.cdn_srcset({'request': RequestFactory().get('/')}, path, type='DEFAULT')
+
+    def test_srcset(self):
+        CDNAsset.objects.record('DEFAULT', 'a.jpg', {'': 'a.jpg', 'w800': 'a.jpg', 'w320': 'a.w320.jpg'})
+
+        self.assertEqual(self._srcset('a.jpg'), 
+            '//cdn.example.com/media/a.w320.jpg 320w, //cdn.example.com/media/a.jpg 800w')
+        self.assertEqual(self._srcset('b.jpg'), '//cdn.example.com/media/b.jpg')
+
+    def test_asset_changed(self):
+        # rendered before the widths are made in the background
+        self.assertEqual(self._srcset('c.jpg'), '//cdn.example.com/media/c.jpg')
+
+        CDNAsset.objects.record('DEFAULT', 'c.jpg', {'': 'c.jpg', 'w800': 'c.jpg', 'w320': 'c.w320.jpg'})
+        self.assertEqual(self._srcset('c.jpg'), 
+            '//cdn.example.com/media/c.w320.jpg 320w, //cdn.example.com/media/c.jpg 800w')
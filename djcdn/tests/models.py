@@ -0,0 +1,63 @@
+from __future__ import unicode_literals
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djcdn.models import CDNFile, CDNVersion
+from djcdn.storage import Util
+
+class CDNFileTest(TestCase):
+    def test_manifest(self):
+        ver1 = CDNVersion.objects.create_new()
+        ver2 = CDNVersion.objects.create_new()
+
+        CDNFile.objects.bulk_create([
+            CDNFile(version=ver1, name='css/a.css', hash='1',
+                variants={'': 'css/a.min.css', 'gzip': 'css/a.min.gz.css'}),
+            CDNFile(version=ver1, name='img/b.png', hash='2', variants={'': 'img/b.png'}),
+            CDNFile(version=ver2, name='img/b.png', hash='3', variants={'': 'img/b.png'}),
+        ])
+
+        manifest = CDNFile.objects.get_manifest(ver1)
+        self.assertEqual(sorted(manifest.keys()), ['css/a.css', 'img/b.png'])
+        self.assertEqual(manifest['css/a.css'].variants['gzip'], 'css/a.min.gz.css')
+        self.assertEqual(manifest['img/b.png'].hash, '2')
+
+class UtilTest(TestCase):
+    def test_hash_file(self):
+        f = ContentFile(b'body{}')
+        hash = Util.hash_file(f)
+
+        self.assertEqual(f.tell(), 0)
+        self.assertEqual(hash, Util.hash_file(ContentFile(b'body{}')))
+        self.assertNotEqual(hash, Util.hash_file(ContentFile(b'body{}'), salt='x'))
+        self.assertNotEqual(hash, Util.hash_file(ContentFile(b'body{ }')))
+
+    def test_uses_version(self):
+        self.assertTrue(Util.uses_version(('filters.cssmin', 'filters.csspath')))
+        self.assertFalse(Util.uses_version(('filters.cssmin',)))
+        self.assertFalse(Util.uses_version(()))
+
+    @override_settings(
+        CDN_STATIC_EXPIRY_AGE               = 3600,
+        CDN_STATIC_EXPIRY_AGES              = {'html': 60, 'txt': 0},
+        CDN_STATIC_STALE_WHILE_REVALIDATE   = 0,
+        CDN_DEFAULT_EXPIRY_AGE              = 3600,
+        CDN_DEFAULT_EXPIRY_AGES             = {},
+        CDN_DEFAULT_STALE_WHILE_REVALIDATE  = 600,
+    )
+    def test_cache_headers(self):
+        cache_control = lambda *args, **kwargs: \
+            Util.get_cache_headers(*args, **kwargs)['Cache-Control']
+
+        self.assertEqual(cache_control('STATIC', 'css/a.css'), 'public, max-age=3600')
+        self.assertEqual(cache_control('STATIC', 'a.HTML'), 'public, max-age=60')
+        self.assertEqual(cache_control('STATIC', 'css/a.css', immutable=True), 
+            'public, max-age=3600, immutable')
+        self.assertEqual(Util.get_cache_headers('STATIC', 'robots.txt'), {})
+
+        self.assertEqual(cache_control('DEFAULT', 'a.jpg'), 
+            'public, max-age=3600, stale-while-revalidate=600')
+        self.assertEqual(cache_control('DEFAULT', 'a.jpg', immutable=True), 
+            'public, max-age=3600, immutable')
@@ -0,0 +1,72 @@
+from __future__ import unicode_literals
+
+import os
+import time
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from djcdn import filters
+from djcdn.exceptions import CDNFilterError
+from djcdn.storage import Util
+from djcdn.storage.process import FilterPool
+
+class FilterPoolTest(TestCase):
+    def setUp(self):
+        self.pool = FilterPool(processes=2, timeout=5)
+
+    def test_apply(self):
+        css = 'body {   color: red;  }'
+        expected = Util.apply_filters(('filters.cssmin',), ContentFile(css)).read()
+
+        output_file = Util.apply_filters(('filters.cssmin',), ContentFile(css), pool=self.pool)
+        path = output_file.file.name
+        self.assertEqual(output_file.read(), expected)
+
+        output_file.close()
+        Util.delete_file(output_file)
+        self.assertFalse(os.path.exists(path))
+
+    def test_timings(self):
+        css = 'body {   color: red;  }'
+
+        for pool in (None, self.pool):
+            timings = {}
+            Util.apply_filters(('filters.cssmin',), ContentFile(css), pool=pool, timings=timings)
+            self.assertEqual(list(timings), ['filters.cssmin'])
+            self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+
+    def test_unchanged(self):
+        input_file = ContentFile('abc')
+        output_file = self.pool.apply((), input_file)
+        self.assertTrue(output_file is input_file)
+
+    def _patch(self, fn):
+        cssmin = filters.cssmin
+        filters.cssmin = fn
+        self.addCleanup(setattr, filters, 'cssmin', cssmin)
+
+    def test_error(self):
+        def fail(input_file):
+            raise IOError('bad css')
+
+        self._patch(fail)
+        self.assertRaises(CDNFilterError, self.pool.apply, ('filters.cssmin',), ContentFile('a'))
+
+    def test_crash(self):
+        def crash(input_file):
+            os._exit(3)
+
+        self._patch(crash)
+        self.assertRaises(CDNFilterError, self.pool.apply, ('filters.cssmin',), ContentFile('a'))
+
+    def test_timeout(self):
+        def hang(input_file):
+            time.sleep(60)
+
+        self._patch(hang)
+        self.pool = FilterPool(processes=1, timeout=0.5)
+
+        start = time.time()
+        self.assertRaises(CDNFilterError, self.pool.apply, ('filters.cssmin',), ContentFile('a'))
+        self.assertTrue(time.time() - start < 10)
@@ -0,0 +1,121 @@
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest import skipIf
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djbase.utils.mock import s3 as mock_s3
+from djcdn.models import CDNVersion
+from djcdn.report import DeployReport, format_summary
+from djcdn.storage.s3 import VersionedStaticStorage
+from djcdn.versions import version_resolver
+
+class DeployReportTest(TestCase):
+    def test_summary(self):
+        report = DeployReport()
+
+        with report.file('a.css', input_bytes=100):
+            report.add('filters', {'filters.cssmin': 1.5})
+            report.set('output_bytes', 40)
+            report.add('encoded_bytes', {'gzip': 20})
+            report.add('requests', 2)
+
+        with report.file('b.png', input_bytes=1000):
+            report.set('copied', True)
+            report.add('requests', 1)
+
+        # outside of a file
+        report.add('requests', 5)
+
+        summary = report.summary(top=1)
+        self.assertEqual(summary['files'], 2)
+        self.assertEqual(summary['copied'], 1)
+        self.assertEqual(summary['requests'], 3)
+        self.assertEqual(summary['saved_bytes'], 60)
+        self.assertEqual(summary['encoded_bytes'], {'gzip': 20})
+        self.assertEqual(summary['filters'], {'filters.cssmin': 1.5})
+        self.assertEqual(len(summary['slowest']), 1)
+
+        text = format_summary(summary)
+        self.assertTrue('2 files (1 copied)' in text)
+        self.assertTrue('filters.cssmin 1.50 s' in text)
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(
+    CDN_STATIC_S3_PATH      = 'static/',
+    CDN_STATIC_FILTERS      = {'css': ('filters.cssmin',)},
+    CDN_STATIC_ENCODINGS    = ('gzip',),
+    CDN_UPLOAD_RETRY_DELAY  = 0,
+    CDN_DEPLOY_REPORT       = True,
+)
+class DeployReportStorageTest(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3.FakeS3().start()
+        self.path = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+        self.argv = sys.argv
+        sys.argv = ['manage.py', 'collectstatic']
+
+    def tearDown(self):
+        # forget the version published by cdn_done
+        version_resolver._expires = 0
+
+        sys.argv = self.argv
+        sys.stdout = self.stdout
+        shutil.rmtree(self.path)
+        self.s3.stop()
+
+    def _collect(self):
+        storage = VersionedStaticStorage(bucket='test', cdn_upload_workers=2)
+        self.s3.patch(storage)
+
+        for i in range(3):
+            storage.save('css/%d.css' % i, ContentFile(b'a {  color: red;  }'))
+        storage.post_process({})
+
+        return storage
+
+    def test_report(self):
+        with override_settings(CDN_DEPLOY_REPORT_DIR=self.path):
+            self.s3.fail(count=1, status=400, method='PUT')
+            storage = self._collect()
+
+            path = os.path.join(self.path, '%s.json' % storage._cdn_version_str)
+            with open(path) as f:
+                report = json.load(f)
+
+            summary = report['summary']
+            self.assertEqual(summary['files'], 3)
+            self.assertEqual(summary['requests'], len(self.s3.requests))
+            self.assertEqual(summary['input_bytes'], 3 * 19)
+            self.assertEqual(summary['output_bytes'], 3 * 12)
+            self.assertTrue(summary['encoded_bytes']['gzip'] > 0)
+            self.assertTrue('filters.cssmin' in summary['filters'])
+            self.assertEqual(sorted(f['name'] for f in report['files']), 
+                ['css/0.css', 'css/1.css', 'css/2.css'])
+            self.assertTrue('Deploy report: 3 files (0 copied)' in sys.stdout.getvalue())
+
+            # unchanged files are copied
+            CDNVersion.objects.filter(pk=storage._cdn_version.pk).update(is_done=True)
+            self.s3.reset()
+            storage = self._collect()
+
+            sys.stdout = StringIO()
+            call_command('cdn_done', report=True)
+            output = sys.stdout.getvalue()
+            self.assertTrue('3 files (3 copied)' in output)
+            self.assertTrue('%d S3 requests' % len(self.s3.requests) in output)
@@ -0,0 +1,163 @@
+from __future__ import unicode_literals
+
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from djcdn import bench
+from djcdn.middleware import PreloadMiddleware
+from djcdn.models import CDNFile, CDNVersion
+from djcdn.templatetags import cdn
+from djcdn.versions import version_resolver
+
+@override_settings(
+    MEDIA_URL = '//cdn.example.com/media/',
+    CDN_DEFAULT_COMPRESSED_TYPES = ('css',),
+    CDN_DEFAULT_ENCODINGS = ('gzip',),
+)
+class TagCacheTest(TestCase):
+    def setUp(self):
+        self._calls = []
+        self._build_url = cdn._build_url
+
+        def build_url(*args):
+            self._calls.append(args)
+            return self._build_url(*args)
+
+        cdn._build_url = build_url
+
+    def tearDown(self):
+        cdn._build_url = self._build_url
+
+    def _url(self, path, request=None, accept_encoding='gzip'):
+        if request is None:
+            request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+
+        return cdn.cdn({'request': request}, path, type='DEFAULT')
+
+    def test_cache(self):
+        self.assertEqual(self._url('a.css'), '//cdn.example.com/media/a.min.gz.css')
+        self.assertEqual(self._url('a.css'), '//cdn.example.com/media/a.min.gz.css')
+        self.assertEqual(len(self._calls), 1)
+
+        # encoding is part of the key
+        self.assertEqual(self._url('a.css', accept_encoding=''), '//cdn.example.com/media/a.min.css')
+        self.assertEqual(len(self._calls), 2)
+
+    def test_encoding_per_request(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self._url('a.css', request=request)
+
+        request.META['HTTP_ACCEPT_ENCODING'] = ''
+        self.assertEqual(self._url('b.css', request=request), '//cdn.example.com/media/b.min.gz.css')
+
+    def test_setting_changed(self):
+        self._url('a.css')
+
+        with self.settings(MEDIA_URL='//other.example.com/media/'):
+            self.assertEqual(self._url('a.css'), '//other.example.com/media/a.min.gz.css')
+
+        self.assertEqual(self._url('a.css'), '//cdn.example.com/media/a.min.gz.css')
+
+    def test_disabled(self):
+        with self.settings(CDN_URL_CACHE_SIZE=0):
+            self._url('a.css')
+            self._url('a.css')
+
+        self.assertEqual(len(self._calls), 2)
+
+class BenchTagTest(TestCase):
+    def tearDown(self):
+        # forget the version published by the test
+        version_resolver._expires = 0
+
+    def test_bench(self):
+        ver = CDNVersion.objects.create_new()
+        ver.is_done = True
+        ver.save(update_fields=('is_done',))
+        version_resolver.publish(ver.version_str)
+
+        result = bench.bench_tag(refs=20, paths=5, rounds=2)
+        self.assertEqual(result['refs'], 20)
+        self.assertTrue(result['cached'] > 0 and result['uncached'] > 0)
+
+@override_settings(
+    STATIC_URL = '//cdn.example.com/static/',
+    CDN_STATIC_ENCODINGS = (),
+    CDN_PRELOAD_TYPES = ('css', 'js', 'woff2'),
+    CDN_PRELOAD_DEPS = 1,
+    CDN_VERSION_TTL = 0,
+)
+class PreloadTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.context = {'request': self.request}
+
+        self._is_versioned = cdn._is_versioned
+        cdn._is_versioned = True
+
+        ver = CDNVersion.objects.create_new()
+        ver.is_done = True
+        ver.save(update_fields=('is_done',))
+        version_resolver.publish(ver.version_str)
+        self.prefix = '//cdn.example.com/static/%s/' % ver.version_str
+
+        CDNFile.objects.create(version=ver, name='css/main.css', hash='',
+            variants={'': 'css/main.min.css'}, deps=['fonts/a.woff2', 'fonts/b.woff2', 'img/a.png'])
+
+    def tearDown(self):
+        cdn._is_versioned = self._is_versioned
+        # forget the version published by the test
+        version_resolver._expires = 0
+
+    def test_tag(self):
+        cdn.cdn(self.context, 'css/main.css')
+        cdn.cdn(self.context, 'js/main.js')
+        cdn.cdn(self.context, 'img/b.png')
+
+        self.assertEqual(cdn.cdn_preload(self.context).split('\n'), [
+            '<link rel="preload" href="%scss/main.min.css" as="style">' % self.prefix,
+            '<link rel="preload" href="%sfonts/a.woff2" as="font" crossorigin>' % self.prefix,
+            '<link rel="preload" href="%sjs/main.min.js" as="script">' % self.prefix,
+        ])
+
+        # once per request
+        self.assertEqual(cdn.cdn_preload(self.context), '')
+        self.assertEqual(cdn.cdn_preload(self.context, 'css/main.css'), '')
+
+    def test_paths(self):
+        self.assertEqual(cdn.cdn_preload(self.context, 'css/main.css', 'css/other.css').split('\n'), [
+            '<link rel="preload" href="%scss/main.min.css" as="style">' % self.prefix,
+            '<link rel="preload" href="%sfonts/a.woff2" as="font" crossorigin>' % self.prefix,
+            '<link rel="preload" href="%scss/other.min.css" as="style">' % self.prefix,
+        ])
+
+    def test_no_deps(self):
+        with self.settings(CDN_PRELOAD_DEPS=0):
+            self.assertEqual(cdn.cdn_preload(self.context, 'css/main.css'),
+                '<link rel="preload" href="%scss/main.min.css" as="style">' % self.prefix)
+
+    def test_middleware(self):
+        middleware = PreloadMiddleware()
+
+        response = middleware.process_response(self.request, HttpResponse())
+        self.assertFalse(response.has_header('Link'))
+
+        cdn.cdn(self.context, 'css/main.css')
+        cdn.cdn(self.context, 'js/main.js')
+        cdn.cdn_preload(self.context, 'js/main.js')
+
+        response = HttpResponse()
+        response['Link'] = '</next>; rel=prefetch'
+        response = middleware.process_response(self.request, response)
+
+        self.assertEqual(response['Link'], ', '.join((
+            '</next>; rel=prefetch',
+            '<%scss/main.min.css>; rel=preload; as=style' % self.prefix,
+            '<%sfonts/a.woff2>; rel=preload; as=font; crossorigin' % self.prefix,
+        )))
+
+        response = middleware.process_response(RequestFactory().get('/'), 
+            HttpResponse(content_type='application/json'))
+        self.assertFalse(response.has_header('Link'))
@@ -0,0 +1,178 @@
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipIf
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djcdn import thumbnails
+from djcdn.storage import images
+
+def _make_jpeg(width, height):
+    output = StringIO()
+    images.Image.new('RGB', (width, height), (30, 200, 30)).save(output, format='JPEG')
+    return output.getvalue()
+
+class SpecTest(TestCase):
+    def test_spec(self):
+        with self.settings(CDN_THUMBNAIL_SPECS=('w320', 'h100', 'w320h240')):
+            spec = thumbnails.Spec('w320h240.webp')
+            self.assertEqual((spec.width, spec.height, spec.format), (320, 240, 'webp'))
+
+            spec = thumbnails.Spec('h100')
+            self.assertEqual((spec.width, spec.height, spec.format), (None, 100, None))
+            self.assertEqual(spec.get_format('a.PNG'), 'png')
+            self.assertEqual(spec.get_format('a.gif'), 'jpg')
+
+            self.assertRaises(ValueError, thumbnails.Spec, 'w640')
+            self.assertRaises(ValueError, thumbnails.Spec, 'w320.bmp')
+
+    def test_name(self):
+        with self.settings(CDN_THUMBNAIL_SPECS=('w320',)):
+            self.assertEqual(thumbnails.format_thumbnail_name('a/b.jpeg', thumbnails.Spec('w320'), '1a2b'), 
+                'thumbs/w320/1a2b/a/b.jpeg')
+            self.assertEqual(thumbnails.format_thumbnail_name('a/b.jpg', thumbnails.Spec('w320.webp'), '1a2b'), 
+                'thumbs/w320.webp/1a2b/a/b.jpg.webp')
+
+@skipIf(images.Image is None, 'PIL is not installed')
+class ThumbnailerTest(TestCase):
+    urls = 'djcdn.urls'
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.media)
+        self.storage.save('photos/1.jpg', ContentFile(_make_jpeg(200, 100)))
+
+        self.settings_override = override_settings(
+            CDN_THUMBNAIL_CACHE_DIR = self.cache,
+            CDN_THUMBNAIL_SPECS = ('w50',),
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media)
+        shutil.rmtree(self.cache)
+
+    def test_get(self):
+        thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+        data, content_type = thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))
+
+        self.assertEqual(content_type, 'image/jpeg')
+        self.assertEqual(images.Image.open(StringIO(data)).size, (50, 25))
+
+        # cached
+        thumbnailer._generate = None
+        self.assertEqual(thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))[0], data)
+
+    def test_no_storage_requests(self):
+        thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+        data = thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))[0]
+
+        self.storage.size = self.storage.modified_time = None
+        self.assertEqual(thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))[0], data)
+
+    @override_settings(CDN_THUMBNAIL_SOURCE_TTL=0)
+    def test_replaced(self):
+        thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+        thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))
+
+        self.storage.delete('photos/1.jpg')
+        self.storage.save('photos/1.jpg', ContentFile(_make_jpeg(100, 100)))
+
+        data = thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))[0]
+        self.assertEqual(images.Image.open(StringIO(data)).size, (50, 50))
+
+    def test_deterministic(self):
+        spec = thumbnails.Spec('w50.png')
+        data = thumbnails.Thumbnailer(storage=self.storage).get('photos/1.jpg', spec)[0]
+
+        shutil.rmtree(self.cache)
+        self.assertEqual(thumbnails.Thumbnailer(storage=self.storage).get('photos/1.jpg', spec)[0], data)
+
+    def test_missing(self):
+        thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+        self.assertRaises(IOError, thumbnailer.get, 'photos/2.jpg', thumbnails.Spec('w50'))
+
+    def test_coalesce(self):
+        thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+        generate = thumbnailer._generate
+        calls = []
+
+        def slow_generate(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            return generate(*args)
+
+        thumbnailer._generate = slow_generate
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            thumbnailer.get('photos/1.jpg', thumbnails.Spec('w50'))[0])) for i in range(5)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(results), 5)
+
+    def test_upload(self):
+        thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+        spec = thumbnails.Spec('w50')
+        name = thumbnails.format_thumbnail_name('photos/1.jpg', spec,
+            thumbnailer.get_source_version('photos/1.jpg'))
+
+        # left by an interrupted upload
+        self.storage.save(name, ContentFile(b'partial'))
+
+        with self.settings(CDN_THUMBNAIL_UPLOAD=True):
+            data = thumbnailer.get('photos/1.jpg', spec)[0]
+
+        self.assertEqual(self.storage.open(name).read(), data)
+
+    def test_view(self):
+        thumbnailer = thumbnails.thumbnailer
+        thumbnails.thumbnailer = thumbnails.Thumbnailer(storage=self.storage)
+
+        try:
+            response = self.client.get('/thumbs/w50/photos/1.jpg')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertTrue('max-age=300' in response['Cache-Control'])
+            self.assertFalse('immutable' in response['Cache-Control'])
+
+            response = self.client.get('/thumbs/w50/photos/1.jpg', 
+                HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            url = thumbnails.get_thumbnail_url('photos/1.jpg', thumbnails.Spec('w50'))
+            self.assertTrue(url.startswith('/thumbs/w50/photos/1.jpg?v='))
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue('immutable' in response['Cache-Control'])
+
+            # an outdated version
+            response = self.client.get('/thumbs/w50/photos/1.jpg?v=00000000')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse('immutable' in response['Cache-Control'])
+
+            self.assertEqual(self.client.get('/thumbs/w60/photos/1.jpg').status_code, 404)
+            self.assertEqual(self.client.get('/thumbs/w50/photos/2.jpg').status_code, 404)
+        finally:
+            thumbnails.thumbnailer = thumbnailer
@@ -0,0 +1,609 @@
+from __future__ import unicode_literals
+
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import skipIf
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+from storages.backends.s3boto import S3BotoStorage
+
+from djbase.utils.mock import s3 as mock_s3
+from djcdn import bench
+from djcdn.conf import settings as app_settings
+from djcdn.models import CDNAsset, CDNFile, CDNObject, CDNVersion
+from djcdn.storage import connections, deferred
+from djcdn.storage import s3 as s3_storage
+from djcdn.storage.s3 import DefaultStorage, StaticStorage, VersionedStaticStorage
+from djcdn.storage.upload import UploadPool, call_with_retry
+from djcdn.templatetags.cdn import cdn
+
+class RetryTest(TestCase):
+    def test_success_after_failures(self):
+        calls = []
+
+        def fn(value):
+            calls.append(value)
+            if len(calls) < 3:
+                raise IOError('failed')
+            return value
+
+        self.assertEqual(call_with_retry(fn, 2, 0, 'a'), 'a')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise IOError('failed')
+
+        self.assertRaises(IOError, call_with_retry, fn, 2, 0)
+        self.assertEqual(len(calls), 3)
+
+class UploadPoolTest(TestCase):
+    def test_failures_reported_at_end(self):
+        pool = UploadPool(workers=4)
+        done = []
+        lock = threading.Lock()
+
+        def job(i):
+            if i % 10 == 0:
+                raise IOError('failed %s' % i)
+            with lock:
+                done.append(i)
+
+        for i in range(100):
+            pool.submit('file%s' % i, job, i)
+
+        failures = pool.join()
+
+        self.assertEqual(len(done), 90)
+        self.assertEqual(sorted(name for name, e in failures),
+            sorted('file%s' % i for i in range(0, 100, 10)))
+        self.assertTrue(all(isinstance(e, IOError) for name, e in failures))
+
+        # failures are reset after join
+        pool.submit('x', job, 1)
+        self.assertEqual(pool.join(), [])
+
+    def test_close(self):
+        pool = UploadPool(workers=2)
+        done = []
+
+        for i in range(5):
+            pool.submit('file%s' % i, done.append, i)
+
+        threads = list(pool._threads)
+        pool.close()
+
+        self.assertEqual(sorted(done), range(5))
+        self.assertFalse(any(t.is_alive() for t in threads))
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(
+    CDN_STATIC_S3_PATH          = 'static/',
+    CDN_STATIC_FILTERS          = {'css': ('filters.cssmin',)},
+    CDN_STATIC_ENCODINGS        = ('gzip',),
+    CDN_UPLOAD_RETRY_DELAY      = 0,
+)
+class FakeS3UploadTest(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3.FakeS3().start()
+
+    def tearDown(self):
+        self.s3.stop()
+
+    def _collect(self, storage, count):
+        self.s3.patch(storage)
+        for i in range(count):
+            storage.save('css/%d.css' % i, ContentFile(b'a {  color: red;  }'))
+        storage.post_process({})
+
+    def test_retries(self):
+        storage = StaticStorage(bucket='test', cdn_upload_workers=4)
+        self.s3.fail(count=3, status=400, method='PUT')
+        self._collect(storage, 8)
+
+        for i in range(8):
+            self.assertEqual(self.s3.get('test', 'static/css/%d.min.css' % i).data, b'a{color:red}')
+            obj = self.s3.get('test', 'static/css/%d.min.gz.css' % i)
+            self.assertEqual(obj.headers['content-encoding'], 'gzip')
+            self.assertTrue('max-age=' in obj.headers['cache-control'])
+
+        self.assertEqual(self.s3.stats()['methods'], {'PUT': 16 + 3})
+
+    def test_incremental(self):
+        argv = sys.argv
+        sys.argv = ['manage.py', 'collectstatic']
+
+        try:
+            storage = VersionedStaticStorage(bucket='test', cdn_upload_workers=4)
+            self._collect(storage, 4)
+            CDNVersion.objects.filter(pk=storage._cdn_version.pk).update(is_done=True)
+
+            self.s3.reset()
+            storage = VersionedStaticStorage(bucket='test', cdn_upload_workers=4)
+            self._collect(storage, 4)
+        finally:
+            sys.argv = argv
+
+        # unchanged files are copied within the bucket, not uploaded again
+        copies = [r for r in self.s3.requests if 'x-amz-copy-source' in r.headers]
+        self.assertEqual(len(copies), 8)
+        self.assertEqual(self.s3.stats()['bytes_in'], 0)
+
+        name = 'static/%s/css/0.min.gz.css' % storage._cdn_version_str
+        self.assertEqual(self.s3.get('test', name).headers['content-encoding'], 'gzip')
+
+    def test_copy_headers(self):
+        argv = sys.argv
+        sys.argv = ['manage.py', 'collectstatic']
+
+        try:
+            storage = VersionedStaticStorage(bucket='test')
+            self._collect(storage, 1)
+            CDNVersion.objects.filter(pk=storage._cdn_version.pk).update(is_done=True)
+
+            # uploaded a year ago
+            for (bucket, key), obj in self.s3.objects.items():
+                obj.headers['expires'] = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+            storage = VersionedStaticStorage(bucket='test')
+            self._collect(storage, 1)
+        finally:
+            sys.argv = argv
+
+        for name, encoding in (('css/0.min.css', None), ('css/0.min.gz.css', 'gzip')):
+            headers = self.s3.get('test', 'static/%s/%s' % (storage._cdn_version_str, name)).headers
+            self.assertNotEqual(headers['expires'], 'Mon, 01 Jan 2024 00:00:00 GMT')
+            self.assertTrue(headers['cache-control'].endswith(', immutable'))
+            self.assertEqual(headers['content-type'], 'text/css')
+            self.assertEqual(headers.get('content-encoding'), encoding)
+
+    def test_copy_settings(self):
+        storage = DefaultStorage(bucket='test')
+        storage.encryption = True
+        storage.reduced_redundancy = True
+        self.s3.patch(storage)
+
+        storage.save('a.txt', ContentFile(b'a'))
+        storage._cdn_copy(storage._normalize_name('a.txt'), 'b.txt')
+
+        request = self.s3.requests[-1]
+        self.assertEqual(request.headers['x-amz-copy-source'], 'test/media/a.txt')
+        self.assertEqual(request.headers['x-amz-server-side-encryption'], 'AES256')
+        self.assertEqual(request.headers['x-amz-storage-class'], 'REDUCED_REDUNDANCY')
+
+    @override_settings(
+        STATIC_ROOT         = '/static/',
+        CDN_STATIC_FILTERS  = {'css': ('filters.cssmin', 'filters.csspath')},
+    )
+    def test_deps(self):
+        argv = sys.argv
+        sys.argv = ['manage.py', 'collectstatic']
+
+        try:
+            storage = VersionedStaticStorage(bucket='test')
+            self.s3.patch(storage)
+            storage.save('css/a.css', ContentFile(
+                b'@font-face{src:url(/static/fonts/a.woff2)}\na{background:url(/static/img/a.png)}'))
+            storage.save('img/a.png', ContentFile(b'png'))
+            storage.post_process({})
+        finally:
+            sys.argv = argv
+
+        version_str = storage._cdn_version_str
+        self.assertEqual(CDNFile.objects.get_deps(version_str, 'css/a.css'), ['fonts/a.woff2', 'img/a.png'])
+        self.assertEqual(CDNFile.objects.get_deps(version_str, 'img/a.png'), [])
+
+        # rewritten after the deps were found
+        data = self.s3.get('test', 'static/%s/css/a.min.css' % version_str).data
+        self.assertTrue(('%s%s/fonts/a.woff2' % (settings.STATIC_URL, version_str)).encode('utf8') in data)
+
+    def test_cache_headers(self):
+        argv = sys.argv
+        sys.argv = ['manage.py', 'collectstatic']
+
+        try:
+            storage = VersionedStaticStorage(bucket='test')
+            self._collect(storage, 1)
+        finally:
+            sys.argv = argv
+
+        name = 'static/%s/css/0.min.css' % storage._cdn_version_str
+        self.assertTrue(self.s3.get('test', name).headers['cache-control'].endswith(', immutable'))
+
+        storage = DefaultStorage(bucket='test')
+        self.s3.patch(storage)
+        expires = []
+
+        for i in range(2):
+            name = storage.save('a.txt', ContentFile(b'hello'))
+            headers = self.s3.get('test', storage._normalize_name(name)).headers
+            self.assertTrue('stale-while-revalidate=' in headers['cache-control'])
+            expires.append(headers['expires'])
+            time.sleep(1.1)
+
+        # relative to the upload, not to the creation of the storage
+        self.assertNotEqual(expires[0], expires[1])
+
+    @override_settings(
+        CDN_MULTIPART_THRESHOLD = 6 * 1024 * 1024,
+        CDN_MULTIPART_PART_SIZE = 5 * 1024 * 1024,
+        CDN_MULTIPART_WORKERS   = 2,
+    )
+    def test_multipart(self):
+        storage = DefaultStorage(bucket='test')
+        self.s3.patch(storage)
+
+        data = os.urandom(1024) * (12 * 1024)
+        self.s3.fail(count=1, status=400, method='PUT')
+
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            name = storage.save('videos/1.mp4', File(f))
+
+        key_name = storage._normalize_name(name)
+        self.assertEqual(self.s3.get('test', key_name).data, data)
+        self.assertEqual(self.s3.get('test', key_name).headers['content-type'], 'video/mp4')
+
+        parts = [r for r in self.s3.requests if 'partNumber' in r.query and r.status == 200]
+        self.assertEqual(sorted(int(r.query['partNumber']) for r in parts), [1, 2, 3])
+        self.assertTrue(max(r.bytes_in for r in parts) <= 5 * 1024 * 1024)
+
+        # small files are still uploaded with one request
+        self.s3.reset()
+        storage.save('a.txt', ContentFile(b'a'))
+        self.assertEqual(self.s3.stats()['methods'], {'PUT': 1})
+
+    @override_settings(
+        CDN_MULTIPART_THRESHOLD = 6 * 1024 * 1024,
+        CDN_UPLOAD_RETRIES      = 0,
+    )
+    def test_multipart_failure(self):
+        storage = DefaultStorage(bucket='test')
+        self.s3.patch(storage)
+        self.s3.fail(count=100, status=400, method='PUT')
+
+        self.assertRaises(Exception, storage.save, 'a.zip', ContentFile(b'a' * 7 * 1024 * 1024))
+
+        # the parts are freed
+        self.assertEqual(self.s3.uploads, {})
+        self.assertEqual(self.s3.objects, {})
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(
+    CDN_DEFAULT_CONTENT_ADDRESSED   = True,
+    CDN_DEFAULT_COMPRESSED_TYPES    = ('txt',),
+    CDN_DEFAULT_ENCODINGS           = ('gzip',),
+    CDN_UPLOAD_RETRY_DELAY          = 0,
+)
+class ContentAddressedTest(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3.FakeS3().start()
+        self.storage = DefaultStorage(bucket='test')
+        self.s3.patch(self.storage)
+
+    def tearDown(self):
+        self.s3.stop()
+
+    def test_dedup(self):
+        name1 = self.storage.save('a/1.txt', ContentFile(b'hello'))
+        self.assertEqual(name1, 'a/1.txt')
+        self.assertEqual(self.s3.stats()['methods']['PUT'], 2)
+
+        blob_name = CDNAsset.objects.get_variants(type='DEFAULT', name=name1)['']
+        self.assertTrue(blob_name.startswith('blobs/'))
+        self.assertTrue(blob_name.endswith('.txt'))
+
+        obj = self.s3.get('test', self.storage._normalize_name(blob_name))
+        self.assertEqual(obj.data, b'hello')
+        self.assertTrue(obj.headers['cache-control'].endswith(', immutable'))
+
+        # the same content is not uploaded again
+        self.s3.reset()
+        name2 = self.storage.save('b/2.txt', ContentFile(b'hello'))
+        self.assertEqual(name2, 'b/2.txt')
+        self.assertFalse('PUT' in self.s3.stats()['methods'])
+        self.assertEqual(CDNAsset.objects.get_variants(type='DEFAULT', name=name2)[''], blob_name)
+
+        # logical names are resolved to the blob
+        self.assertEqual(self.storage.open(name2).read(), b'hello')
+        self.assertEqual(self.storage.size(name2), 5)
+        self.assertTrue(blob_name in self.storage.url(name2))
+
+        # deleting a name keeps the blob for the other names
+        self.storage.delete(name1)
+        self.assertFalse(self.storage.exists(name1))
+        self.assertTrue(self.storage.exists(name2))
+
+        # other content gets its own blob
+        self.storage.save('c/3.txt', ContentFile(b'world'))
+        self.assertNotEqual(CDNAsset.objects.get_variants(type='DEFAULT', name='c/3.txt')[''], 
+            blob_name)
+
+    def test_tag(self):
+        self.storage.save('a/1.txt', ContentFile(b'hello'))
+        variants = CDNAsset.objects.get_variants(type='DEFAULT', name='a/1.txt')
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        url = cdn({'request': request}, 'a/1.txt', type='DEFAULT')
+        self.assertEqual(url, settings.MEDIA_URL + variants['gzip'])
+
+    def test_url_cache(self):
+        self.storage.save('a/1.txt', ContentFile(b'hello'))
+        url = self.storage.url('a/1.txt')
+
+        # resolved only once
+        with self.assertNumQueries(0):
+            self.assertEqual(self.storage.url('a/1.txt'), url)
+
+        # saved again with other content
+        self.storage.delete('a/1.txt')
+        self.storage.save('a/1.txt', ContentFile(b'world'))
+        blob_name = CDNAsset.objects.get_variants(type='DEFAULT', name='a/1.txt')['']
+        self.assertTrue(blob_name in self.storage.url('a/1.txt'))
+        self.assertFalse(blob_name in url)
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(
+    CDN_STATIC_S3_PATH      = 'static/',
+    CDN_STATIC_FILTERS      = {},
+    CDN_S3_POOL_SIZE        = 2,
+)
+class ConnectionTest(TestCase):
+    def tearDown(self):
+        connections.close_all()
+
+    def test_shared(self):
+        static = StaticStorage(bucket='test', access_key='a', secret_key='b')
+        default = DefaultStorage(bucket='test', access_key='a', secret_key='b')
+        other = DefaultStorage(bucket='test', access_key='c', secret_key='d')
+
+        self.assertTrue(static.connection is default.connection)
+        self.assertFalse(static.connection is other.connection)
+        self.assertEqual(static.connection._pool.max_size, 2)
+
+    def test_keep_alive(self):
+        with mock_s3.FakeS3() as s3:
+            connection = connections.get_connection(mock_s3.S3Connection, 
+                'fake-access-key', 'fake-secret-key', 
+                host=s3.host, port=s3.port, is_secure=False,
+                calling_format=mock_s3.OrdinaryCallingFormat())
+
+            static = StaticStorage(bucket='test')
+            default = DefaultStorage(bucket='test')
+            static._connection = default._connection = connection
+
+            for i in range(4):
+                static.save('%d.txt' % i, ContentFile(b'a'))
+                default.save('%d.txt' % i, ContentFile(b'a'))
+
+            self.assertEqual(s3.stats()['connections'], 1)
+
+            # the pool keeps at most CDN_S3_POOL_SIZE connections
+            static = StaticStorage(bucket='test', cdn_upload_workers=4)
+            static._connection = connection
+
+            for i in range(32):
+                static.save('%d.txt' % i, ContentFile(b'a'))
+            static.post_process({})
+
+            self.assertEqual(len(s3.objects), 4 + 32)
+            self.assertTrue(connection._pool.size() <= 2)
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(
+    CDN_DEFAULT_METADATA_INDEX  = True,
+    CDN_UPLOAD_RETRY_DELAY      = 0,
+)
+class MetadataIndexTest(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3.FakeS3().start()
+        self.storage = DefaultStorage(bucket='test')
+        self.s3.patch(self.storage)
+
+    def tearDown(self):
+        self.s3.stop()
+
+    def test_no_requests(self):
+        name = self.storage.save('a.txt', ContentFile(b'hello'))
+        obj = CDNObject.objects.get_object('test', self.storage._normalize_name(name))
+        self.assertEqual(obj.etag, self.s3.get('test', obj.key).etag)
+        self.assertEqual(obj.content_type, 'text/plain')
+
+        self.s3.reset()
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 5)
+        self.assertTrue(self.storage.modified_time(name) is not None)
+        self.assertEqual(self.s3.requests, [])
+
+        # names not in the index are looked up on S3
+        self.assertFalse(self.storage.exists('b.txt'))
+        self.assertEqual(self.s3.stats()['methods'], {'HEAD': 1})
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertEqual(self.s3.objects, {})
+
+    def test_not_indexed(self):
+        # written before the index was turned on
+        self.storage.bucket.new_key(self.storage._normalize_name('a.txt')).set_contents_from_string(b'old')
+
+        self.assertTrue(self.storage.exists('a.txt'))
+        self.assertEqual(self.storage.size('a.txt'), 3)
+        self.assertTrue(self.storage.modified_time('a.txt') is not None)
+
+    @override_settings(
+        CDN_DEFAULT_CONTENT_ADDRESSED   = True,
+        CDN_DEFAULT_QUEUE               = 'db',
+        CDN_DEFAULT_FILTERS             = {'css': ('filters.cssmin',)},
+    )
+    def test_deferred(self):
+        storage = DefaultStorage(bucket='test')
+        self.s3.patch(storage)
+
+        name = storage.save('a.css', ContentFile(b'a {  color: red;  }'))
+        interim = storage._normalize_name(storage._cdn_saved_name('a.css'))
+        self.assertTrue(CDNObject.objects.get_object('test', interim) is not None)
+
+        self.assertEqual(deferred.process_tasks(storage), (1, 0))
+
+        # the interim original is deleted from S3 and from the index
+        self.assertEqual(self.s3.get('test', interim), None)
+        self.assertEqual(CDNObject.objects.get_object('test', interim), None)
+        self.assertEqual(storage.open(name).read(), b'a{color:red}')
+
+    def test_reconcile(self):
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            self.storage.save(name, ContentFile(b'hello'))
+
+        # changed without djcdn
+        bucket = self.storage.bucket
+        bucket.delete_key(self.storage._normalize_name('a.txt'))
+        bucket.new_key(self.storage._normalize_name('b.txt')).set_contents_from_string(b'changed')
+        bucket.new_key(self.storage._normalize_name('d.txt')).set_contents_from_string(b'new')
+
+        key = lambda name: self.storage._normalize_name(name)
+        diff = ([key('d.txt')], [key('b.txt')], [key('a.txt')])
+
+        self.assertEqual(self.storage.cdn_reconcile(dry_run=True), diff)
+        self.assertEqual(self.storage.cdn_reconcile(), diff)
+        self.assertEqual(self.storage.cdn_reconcile(), ([], [], []))
+
+        self.assertFalse(self.storage.exists('a.txt'))
+        self.assertEqual(self.storage.size('b.txt'), 7)
+        self.assertEqual(self.storage.size('d.txt'), 3)
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(
+    CDN_STATIC_S3_PATH      = 'static/',
+    CDN_UPLOAD_RETRY_DELAY  = 0,
+)
+class CleanTest(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3.FakeS3().start()
+        self.storage = VersionedStaticStorage(bucket='test')
+        self.s3.patch(self.storage)
+
+        # 4 done versions a day apart, and one being collected
+        self.versions = []
+        for i in range(5):
+            version = CDNVersion.objects.create_new()
+            CDNVersion.objects.filter(pk=version.pk).update(is_done=(i < 4),
+                created=timezone.now() - timedelta(days=(30 - i if i < 4 else 0)))
+            self.versions.append(version.version_str)
+            self._upload(version.version_str, 3)
+
+    def tearDown(self):
+        self.s3.stop()
+
+    def _upload(self, version_str, count):
+        for i in range(count):
+            key = self.storage.bucket.new_key('static/%s/css/%d.css' % (version_str, i))
+            key.set_contents_from_string(b'a{}')
+
+    def _folders(self):
+        return sorted(set(key.split('/')[1] for bucket, key in self.s3.objects))
+
+    def test_keep(self):
+        orphan = '20000101-0000ABCD'
+        self._upload(orphan, 2)
+
+        expected = [(self.versions[0], 3), (self.versions[1], 3), (orphan, 2)]
+        self.assertEqual(self.storage.cdn_clean(keep=2, grace=60, dry_run=True), expected)
+        self.assertEqual(len(self.s3.objects), 17)
+
+        self.assertEqual(self.storage.cdn_clean(keep=2, grace=60), expected)
+        self.assertEqual(self._folders(), sorted(self.versions[2:]))
+        self.assertEqual(list(CDNVersion.objects.order_by('id')
+            .values_list('version_str', flat=True)), self.versions[2:])
+
+        self.assertEqual(self.storage.cdn_clean(keep=2, grace=60), [])
+
+    def test_grace(self):
+        self.assertEqual(self.storage.cdn_clean(keep=1, grace=28 * 24 * 3600 + 60),
+            [(self.versions[0], 3), (self.versions[1], 3)])
+        self.assertEqual(self._folders(), sorted(self.versions[2:]))
+
+    def test_resume(self):
+        self._upload(self.versions[0], 5)
+
+        batch_size = s3_storage._DELETE_BATCH_SIZE
+        s3_storage._DELETE_BATCH_SIZE = 2
+
+        try:
+            # every attempt at the first of 3 batches fails
+            self.s3.fail(count=app_settings.CDN_UPLOAD_RETRIES + 1, status=400, method='POST')
+            deleted = self.storage.cdn_clean(keep=3, grace=60, workers=1)
+
+            self.assertEqual(deleted, [])
+            self.assertTrue(CDNVersion.objects.filter(version_str=self.versions[0]).exists())
+            self.assertEqual(self._folders(), sorted(self.versions))
+
+            self.assertEqual(self.storage.cdn_clean(keep=3, grace=60, workers=2),
+                [(self.versions[0], 2)])
+        finally:
+            s3_storage._DELETE_BATCH_SIZE = batch_size
+
+        self.assertEqual(self.s3.stats()['methods']['POST'], 4 + 2 + 1)
+        self.assertEqual(self._folders(), sorted(self.versions[1:]))
+        self.assertFalse(CDNVersion.objects.filter(version_str=self.versions[0]).exists())
+
+@skipIf(mock_s3.S3Connection is None, 'boto is not installed')
+@override_settings(CDN_SIGNED_URL_WINDOW=300)
+class UrlTest(TestCase):
+    _NAMES = ('a.jpg', 'photos/image 1.jpg', 'photos/\u00e9t\u00e9.jpg', 'photos/')
+
+    def _storage(self, **kwargs):
+        kwargs.setdefault('custom_domain', None)
+        return DefaultStorage(bucket='test', access_key='a', secret_key='b', **kwargs)
+
+    def test_public(self):
+        storage = self._storage(querystring_auth=False)
+
+        for name in self._NAMES:
+            expected = S3BotoStorage.url(storage, name)
+            if name.endswith('/'):
+                expected += '/'
+            self.assertEqual(storage.url(name), expected)
+            self.assertEqual(storage.url(name), expected)
+
+        storage = self._storage(querystring_auth=False, custom_domain='cdn.example.com')
+        self.assertEqual(storage.url('a.jpg'), S3BotoStorage.url(storage, 'a.jpg'))
+
+    def test_signed(self):
+        storage = self._storage(querystring_auth=True, querystring_expire=3600)
+        now = time.time()
+
+        for name in self._NAMES[:3]:
+            url = storage.url(name)
+            expires = int(re.search(r'Expires=(\d+)', url).group(1))
+
+            self.assertEqual(expires % 300, 0)
+            self.assertTrue(now + 3600 <= expires < now + 3600 + 300 + 1)
+
+            key_name = storage._encode_name(storage._normalize_name(name))
+            self.assertEqual(url, storage.connection.generate_url(expires, method='GET',
+                bucket='test', key=key_name, expires_in_absolute=True))
+
+            # kept until the window ends
+            self.assertTrue(storage.url(name) is url)
+
+    def test_bench(self):
+        result = bench.bench_url(names=20, rounds=1)
+
+        for label in ('public', 'signed'):
+            for key in ('s3boto_us', 'uncached_us', 'djcdn_us', 'speedup'):
+                self.assertTrue(result['%s.%s' % (label, key)] > 0)
@@ -0,0 +1,62 @@
+from __future__ import unicode_literals
+
+import time
+
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from djcdn.models import CDNVersion
+from djcdn.versions import VersionResolver
+
+def _mark_done(ver):
+    ver.is_done = True
+    ver.save(update_fields=('is_done',))
+
+class VersionResolverTest(TestCase):
+    def test_ttl(self):
+        resolver = VersionResolver()
+
+        with self.settings(CDN_VERSION_TTL=0.2):
+            self.assertEqual(resolver.get_latest(), None)
+
+            ver = CDNVersion.objects.create_new()
+            _mark_done(ver)
+
+            # still cached
+            self.assertEqual(resolver.get_latest(), None)
+
+            time.sleep(0.3)
+            self.assertEqual(resolver.get_latest(), ver.version_str)
+
+    def test_publish(self):
+        ver = CDNVersion.objects.create_new()
+        _mark_done(ver)
+
+        with self.settings(CDN_VERSION_TTL=60):
+            resolver = VersionResolver()
+            self.assertEqual(resolver.get_latest(), ver.version_str)
+
+            resolver.publish('20131023-12345678')
+            self.assertEqual(resolver.get_latest(), '20131023-12345678')
+
+    @override_settings(
+        CDN_VERSION_CACHE = 'default',
+        CDN_VERSION_TTL = 0,
+    )
+    def test_cache(self):
+        get_cache('default').clear()
+
+        resolver1 = VersionResolver()
+        resolver2 = VersionResolver()
+
+        ver = CDNVersion.objects.create_new()
+        _mark_done(ver)
+        self.assertEqual(resolver2.get_latest(), ver.version_str)
+
+        # Read from the cache, not the database
+        resolver1.publish('20131023-12345678')
+        self.assertEqual(resolver2.get_latest(), '20131023-12345678')
+
+        get_cache('default').clear()
+        self.assertEqual(resolver2.get_latest(), ver.version_str)
@@ -0,0 +1,315 @@
+"""
+Thumbnails of media files, generated on demand by the `thumbnail` view
+and kept in a DiskCache.
+
+Requires Pillow.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.urlresolvers import reverse
+
+from djbase.utils.cache import LRUCache
+from djcdn.conf import settings as app_settings
+from djcdn.storage import images
+from djcdn.storage.cache import DiskCache
+
+# e.g. 'w320', 'h240', 'w320h240'
+_SIZE_MATCH = re.compile(r'^(?:w(?P<width>\d+))?(?:h(?P<height>\d+))?$')
+
+# Output format to (PIL format, Content-Type)
+FORMATS = {
+    'jpg'   : ('JPEG', 'image/jpeg'),
+    'png'   : ('PNG', 'image/png'),
+    'webp'  : ('WEBP', 'image/webp'),
+}
+
+class Spec(object):
+    """
+    Size and format of a thumbnail, e.g. 'w320' or 'w320h240.webp'.
+    The image is scaled down to fit within the width and height,
+    keeping the aspect ratio. Without a format, the format of the
+    source is kept.
+    """
+
+    def __init__(self, spec):
+        """
+        Raises ValueError if `spec` is invalid or not in
+        settings.CDN_THUMBNAIL_SPECS.
+        """
+
+        size, dot, format = spec.partition('.')
+
+        if size not in app_settings.CDN_THUMBNAIL_SPECS:
+            raise ValueError('Thumbnail size not allowed: %s' % size)
+
+        match = _SIZE_MATCH.match(size)
+        if not match or not size:
+            raise ValueError('Invalid thumbnail size: %s' % size)
+
+        if dot and format not in FORMATS:
+            raise ValueError('Invalid thumbnail format: %s' % format)
+
+        self.spec   = spec
+        self.size   = size
+        self.width  = int(match.group('width') or 0) or None
+        self.height = int(match.group('height') or 0) or None
+        self.format = format or None
+
+    def get_format(self, path):
+        """
+        :returns: str -- output format for the source `path`.
+        """
+
+        if self.format:
+            return self.format
+
+        file_ext = os.path.splitext(path)[1].lstrip('.').lower()
+
+        return 'png' if file_ext == 'png' else 'jpg'
+
+def format_thumbnail_name(path, spec, source_version):
+    """
+    :param  source_version: See Thumbnailer.get_source_version().
+
+    :returns: str -- the name of a thumbnail in the default storage, e.g.
+        thumbs/w320/1a2b3c4d/photos/1.jpg or 
+        thumbs/w320.webp/1a2b3c4d/photos/1.jpg.webp
+    """
+
+    name = 'thumbs/%s/%s/%s' % (spec.spec, source_version, path)
+
+    file_ext = os.path.splitext(path)[1].lstrip('.').lower()
+    format = spec.get_format(path)
+    if file_ext != format and (file_ext, format) != ('jpeg', 'jpg'):
+        name = images.format_derivative_name(name, format)
+
+    return name
+
+def get_thumbnail_url(path, spec):
+    """
+    :type   spec: Spec
+
+    :returns: str -- the URL of the `thumbnail` view, e.g. 
+        /media/thumbs/w320/photos/1.jpg?v=1a2b3c4d. The source version
+        in the query string lets the view send a long expiry age.
+        Left out if the source cannot be found.
+    """
+
+    url = reverse('cdn_thumbnail', kwargs={'spec': spec.spec, 'path': path})
+
+    try:
+        return '%s?v=%s' % (url, thumbnailer.get_source_version(path))
+    except IOError:
+        return url
+
+def generate(input_file, spec, format):
+    """
+    Scales an image down to fit `spec`.
+    The output only depends on the input and the settings.
+
+    :type   spec: Spec
+    :param  format: One of FORMATS.
+
+    :returns: bytes
+    """
+
+    image = images.Image.open(input_file)
+    image.load()
+
+    (width, height) = image.size
+    box = (spec.width or width, spec.height or height)
+
+    if format == 'jpg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # does nothing if the image is already smaller
+    image.thumbnail(box, images.Image.ANTIALIAS)
+
+    if format == 'webp':
+        quality = app_settings.CDN_WEBP_QUALITY
+    else:
+        quality = app_settings.CDN_JPEG_QUALITY
+
+    output = StringIO()
+    image.save(output, format=FORMATS[format][0], quality=quality, optimize=True)
+
+    return output.getvalue()
+
+class _KeyLock(object):
+    """
+    Lets only one thread or process work on a key at a time.
+
+    Uses lock files in `path` shared by all processes, 256 of them at most,
+    so keys with the same first two hex digits share a lock.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._locks = dict(('%02x' % i, threading.Lock()) for i in range(256))
+
+    @contextmanager
+    def __call__(self, key):
+        stripe = key[:2]
+
+        with self._locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+
+            try:
+                os.makedirs(self._path)
+            except OSError:
+                pass
+
+            with open(os.path.join(self._path, stripe), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+class Thumbnailer(object):
+    """
+    Gets thumbnails of files in a storage, generating them on the first
+    request and keeping them in a DiskCache. Concurrent first requests
+    for the same thumbnail wait for the one that generates it.
+    """
+
+    # source versions kept in memory, see CDN_THUMBNAIL_SOURCE_TTL
+    _SOURCE_CACHE_SIZE = 1000
+
+    def __init__(self, storage=None):
+        """
+        :param  storage: Storage of the source images. Defaults to
+            the default storage.
+        """
+
+        self._storage = storage
+        self._cache = None
+        self._source_versions = LRUCache(max_size=self._SOURCE_CACHE_SIZE)
+
+    def _get_cache(self):
+        path = app_settings.CDN_THUMBNAIL_CACHE_DIR
+
+        if self._cache is None or self._cache[0] != path:
+            cache = DiskCache(path=path, max_size=app_settings.CDN_THUMBNAIL_CACHE_SIZE)
+            self._cache = (path, cache, _KeyLock(os.path.join(path, '.locks')))
+
+        return self._cache
+
+    def _get_key(self, path, spec, source_version):
+        key = '%r|%r|%r|%r|%r' % (path, spec.spec, source_version,
+            app_settings.CDN_JPEG_QUALITY, app_settings.CDN_WEBP_QUALITY)
+
+        return hashlib.sha1(key.encode('utf8')).hexdigest()
+
+    def get_source_version(self, path):
+        """
+        Raises IOError if the source cannot be found.
+        Kept in memory for CDN_THUMBNAIL_SOURCE_TTL seconds, as looking
+        it up may take requests to the storage, e.g. S3.
+
+        :returns: str -- changes whenever the source file is replaced,
+            as it is made from its size and modification time.
+        """
+
+        now = time.time()
+        cached = self._source_versions.get(path)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        storage = self._storage or default_storage
+
+        try:
+            version = '%r|%r' % (storage.size(path), storage.modified_time(path))
+        except Exception as e:
+            raise IOError('Cannot find %s (Reason: %s)' % (path, e))
+
+        version = hashlib.sha1(version.encode('utf8')).hexdigest()[:8]
+        self._source_versions.set(path, (now + app_settings.CDN_THUMBNAIL_SOURCE_TTL, version))
+
+        return version
+
+    def get(self, path, spec, source_version=None):
+        """
+        Raises IOError if the source cannot be read.
+
+        :type   spec: Spec
+        :param  source_version: See get_source_version(). Looked up if None.
+
+        :returns: tuple -- (bytes, Content-Type)
+        """
+
+        (cache_dir, cache, key_lock) = self._get_cache()
+        source_version = source_version or self.get_source_version(path)
+        key = self._get_key(path, spec, source_version)
+        format = spec.get_format(path)
+        content_type = FORMATS[format][1]
+
+        data = cache.get(key)
+        if data is not None:
+            return data, content_type
+
+        with key_lock(key):
+            # someone else may have generated it while we were waiting
+            data = cache.get(key)
+            if data is not None:
+                return data, content_type
+
+            data = self._generate(path, spec, format)
+            cache.set(key, data)
+
+            if app_settings.CDN_THUMBNAIL_UPLOAD:
+                self._upload(path, spec, source_version, data)
+
+        return data, content_type
+
+    def _generate(self, path, spec, format):
+        storage = self._storage or default_storage
+
+        try:
+            input_file = storage.open(path)
+        except Exception as e:
+            raise IOError('Cannot open %s (Reason: %s)' % (path, e))
+
+        try:
+            return generate(input_file, spec, format)
+        except IOError:
+            raise
+        except Exception as e:
+            raise IOError('Cannot read image %s (Reason: %s)' % (path, e))
+        finally:
+            input_file.close()
+
+    def _upload(self, path, spec, source_version, data):
+        storage = self._storage or default_storage
+        name = format_thumbnail_name(path, spec, source_version)
+
+        try:
+            # replaces a partial or outdated upload; save() would rename
+            storage.delete(name)
+            storage.save(name, ContentFile(data))
+        except Exception as e:
+            print('ERROR: Cannot upload thumbnail (Reason: %s): %s' % (e, name))
+
+thumbnailer = Thumbnailer()
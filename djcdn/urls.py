@@ -0,0 +1,9 @@
+from django.conf.urls import patterns, include, url
+
+from . import views
+
+urlpatterns = patterns('',
+    url(r'^thumbs/(?P<spec>[^/]+)/(?P<path>.+)$', 
+        views.thumbnail, 
+        name='cdn_thumbnail'),
+)
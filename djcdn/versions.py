@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.core.cache import get_cache
+
+from djcdn.conf import settings as app_settings
+from djcdn.models import CDNVersion
+
+class VersionResolver(object):
+    """
+    Gets the latest done CDNVersion for the `cdn` template tag.
+
+    The version is kept in memory for settings.CDN_VERSION_TTL seconds,
+    so that new versions are picked up without restarting the process
+    and without a database query on every render.
+
+    If settings.CDN_VERSION_CACHE names a cache, the version is read
+    from that cache before the database. `cdn_done` pushes new versions
+    into it, so that every process sees them within the TTL.
+    """
+
+    CACHE_KEY       = 'djcdn:latest_version'
+    CACHE_TIMEOUT   = 3600 * 24 # seconds
+
+    def __init__(self):
+        self._lock          = threading.Lock()
+        self._version_str   = None
+        self._expires       = 0
+
+    def _get_cache(self):
+        alias = app_settings.CDN_VERSION_CACHE
+        if not alias:
+            return None
+
+        return get_cache(alias)
+
+    def _load(self):
+        cache = self._get_cache()
+
+        if cache is not None:
+            version_str = cache.get(self.CACHE_KEY)
+
+            # empty string means nothing deployed yet
+            if version_str is not None:
+                return version_str or None
+
+        ver = CDNVersion.objects.get_latest(is_done=True)
+        version_str = ver.version_str if ver else None
+
+        if cache is not None:
+            cache.set(self.CACHE_KEY, version_str or '', self.CACHE_TIMEOUT)
+
+        return version_str
+
+    def get_latest(self):
+        """
+        :returns: str -- version string of the latest done version,
+            or None if there is none.
+        """
+
+        if time.time() < self._expires:
+            return self._version_str
+
+        with self._lock:
+            # someone else may have loaded it while we were waiting
+            now = time.time()
+            if now >= self._expires:
+                self._version_str = self._load()
+                self._expires = now + app_settings.CDN_VERSION_TTL
+
+            return self._version_str
+
+    def publish(self, version_str):
+        """
+        Makes `version_str` the latest version in this process
+        and in settings.CDN_VERSION_CACHE, if set.
+        """
+
+        cache = self._get_cache()
+        if cache is not None:
+            cache.set(self.CACHE_KEY, version_str, self.CACHE_TIMEOUT)
+
+        with self._lock:
+            self._version_str = version_str
+            self._expires = time.time() + app_settings.CDN_VERSION_TTL
+
+version_resolver = VersionResolver()
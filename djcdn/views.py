@@ -0,0 +1,53 @@
+from __future__ import unicode_literals
+
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+
+from djcdn import thumbnails
+from djcdn.conf import settings as app_settings
+from djcdn.storage import Util
+
+def thumbnail(request, spec, path):
+    """
+    Serves a thumbnail of a media file, e.g. /thumbs/w320/photos/1.jpg.
+    See djcdn.thumbnails.Spec for the format of `spec`.
+
+    Only URLs with the current source version, e.g. ?v=1a2b3c4d from 
+    thumbnails.get_thumbnail_url(), are cached for long. Others are cached
+    for CDN_THUMBNAIL_EXPIRY_AGE seconds, then revalidated with the ETag.
+    """
+
+    if thumbnails.images.Image is None:
+        raise Http404('Thumbnails require PIL')
+
+    try:
+        spec = thumbnails.Spec(spec)
+    except ValueError as e:
+        raise Http404(e)
+
+    try:
+        source_version = thumbnails.thumbnailer.get_source_version(path)
+    except IOError as e:
+        raise Http404(e)
+
+    if request.GET.get('v') == source_version:
+        headers = Util.get_cache_headers('DEFAULT', path, immutable=True)
+    else:
+        # the URL stays the same when the source is replaced
+        headers = Util.get_expiry_headers(app_settings.CDN_THUMBNAIL_EXPIRY_AGE)
+
+    headers['ETag'] = '"%s"' % source_version
+
+    if request.META.get('HTTP_IF_NONE_MATCH') == headers['ETag']:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            data, content_type = thumbnails.thumbnailer.get(path, spec, source_version)
+        except IOError as e:
+            raise Http404(e)
+
+        response = HttpResponse(data, content_type=content_type)
+
+    for key, val in headers.items():
+        response[key] = val
+
+    return response